@@ -2,6 +2,8 @@
 ASGI config for ticket_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests for the availability stream are served by a native ASGI handler; everything
+else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +15,12 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ticket_system.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from tickets.streams import AVAILABILITY_STREAM_PATH, availability_stream  # noqa: E402  (needs apps loaded)
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == AVAILABILITY_STREAM_PATH:
+        return await availability_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -51,6 +51,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "tickets.middleware.CompressionMiddleware",
+    "tickets.throttling.DatabaseLatencyMiddleware",
+    "tickets.profiling.ProfilingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -88,6 +91,16 @@ DATABASES = {
     "default": env.db(engine="django.db.backends.postgresql"),
 }
 
+# Shards
+# Trains can be spread over extra databases named in SHARD_DATABASES (for example "shard1,shard2"), each
+# configured with <ALIAS>_DATABASE_URL. `default` is always a shard and holds every train not moved elsewhere
+# with `manage.py move_train`. Migrate every database, then run `manage.py configure_shards` before booking.
+
+for alias in env.list("SHARD_DATABASES", default=[]):
+    DATABASES[alias] = env.db(f"{alias.upper()}_DATABASE_URL", engine="django.db.backends.postgresql")
+SHARD_DATABASES = list(DATABASES)
+DATABASE_ROUTERS = ["tickets.sharding.ShardRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -129,3 +142,170 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Django Rest Framework
+# Booking, cancellation and list views are throttled per authenticated user or client IP with a token bucket,
+# and shed up front when lock failures or database latency show the system is overloaded.
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "tickets.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "tickets.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "tickets.throttling.LoadSheddingThrottle",
+        "tickets.throttling.TokenBucketThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "book": env("THROTTLE_RATE_BOOK", default="30/min"),
+        "cancel": env("THROTTLE_RATE_CANCEL", default="30/min"),
+        "list": env("THROTTLE_RATE_LIST", default="120/min"),
+        "status": env("THROTTLE_RATE_STATUS", default="120/min"),
+        "export": env("THROTTLE_RATE_EXPORT", default="6/min"),
+    },
+}
+
+# Shared cache for throttling buckets and ticket status; use a shared backend such as redis:// or pymemcache://
+# in production so every worker sees the same entries.
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+TICKET_STATUS_CACHE_TIMEOUT = env.int("TICKET_STATUS_CACHE_TIMEOUT", default=60 * 60)  # Seconds
+
+LOAD_SHEDDING = {
+    "LOCK_FAILURE_RATE": env.float("LOAD_SHEDDING_LOCK_FAILURE_RATE", default=0.5),  # Share of failed lock attempts
+    "DB_LATENCY_MS": env.float("LOAD_SHEDDING_DB_LATENCY_MS", default=250),  # Mean query time
+    "MIN_SAMPLES": 20,  # Decayed sample count needed before shedding kicks in
+    "HALF_LIFE": 10,  # Seconds for old samples to lose half their weight
+    "RETRY_AFTER": 2,  # Seconds advertised in Retry-After
+    "SCOPES": ("book", "cancel"),  # Throttle scopes shed under load; reads keep being served
+}
+
+
+# API documentation
+# The generated OpenAPI schema is cached per code version and schema settings; set CODE_VERSION on deploy
+# (for example to the git SHA) to skip hashing the sources at startup.
+
+CODE_VERSION = env("CODE_VERSION", default=None)
+OPENAPI_CACHE_TIMEOUT = env.int("OPENAPI_CACHE_TIMEOUT", default=60 * 60 * 24)  # Seconds
+
+
+# Request profiling
+# Calls to PROFILING_VIEWS are profiled when sent with the X-Profile header printed by `manage.py profile_token`,
+# or picked at PROFILING_SAMPLE_RATE. With PROFILING_ENABLED off the middleware is dropped at startup.
+
+PROFILING_ENABLED = env.bool("PROFILING_ENABLED", default=False)
+PROFILING_SAMPLE_RATE = env.float("PROFILING_SAMPLE_RATE", default=0.0)  # Share of calls profiled without the header
+PROFILING_SAMPLE_INTERVAL = env.float("PROFILING_SAMPLE_INTERVAL", default=0.001)  # Seconds between stack samples
+PROFILING_DIR = env("PROFILING_DIR", default=os.path.join(BASE_DIR, "var", "profiles"))
+PROFILING_MAX_PROFILES = env.int("PROFILING_MAX_PROFILES", default=200)  # Older profiles are deleted
+PROFILING_VIEWS = [
+    "BookTicketView",
+    "CancelTicketView",
+    "GetBookedTicketsView",
+    "SearchTicketsView",
+    "GetAvailableTicketsView",
+]
+
+
+# Passenger profiles
+# Bookings reuse one Passenger row per traveller (matched on external_id, or on name, age and gender).
+
+PASSENGER_PROFILES = env.bool("PASSENGER_PROFILES", default=True)
+
+
+# Quota policies are cached per process; changes made elsewhere are picked up within this many seconds
+
+QUOTA_POLICY_CHECK_INTERVAL = env.int("QUOTA_POLICY_CHECK_INTERVAL", default=5)
+
+# Quota bucket counters are split across this many rows so concurrent bookings rarely touch the same one
+QUOTA_COUNTER_STRIPES = env.int("QUOTA_COUNTER_STRIPES", default=4)
+# Unused ladies/senior quota rolls over into general this many hours before the journey date (rollover_quotas)
+QUOTA_ROLLOVER_HOURS = env.int("QUOTA_ROLLOVER_HOURS", default=24)
+
+
+# Booking concurrency: "pessimistic" locks berth rows with NOWAIT, "optimistic" claims them with a versioned
+# compare-and-swap and re-picks when another booking got there first
+
+BOOKING_CONCURRENCY = env("BOOKING_CONCURRENCY", default="pessimistic")
+BOOKING_CAS_RETRIES = env.int("BOOKING_CAS_RETRIES", default=5)  # Re-picks before giving up on a contended claim
+BOOKING_CAS_CANDIDATES = env.int("BOOKING_CAS_CANDIDATES", default=8)  # Free berths an optimistic claim picks among
+
+
+# Ticket lifecycle (archive_tickets moves these out of the hot Ticket table)
+
+ARCHIVE_JOURNEYS_AFTER_DAYS = env.int("ARCHIVE_JOURNEYS_AFTER_DAYS", default=1)  # Days after the journey date
+ARCHIVE_CANCELED_AFTER_DAYS = env.int("ARCHIVE_CANCELED_AFTER_DAYS", default=30)  # Days after cancellation
+
+
+# Response compression (brotli or gzip, by the client's Accept-Encoding q-values)
+
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=1024)  # Bytes; smaller responses are sent as-is
+COMPRESSION_BROTLI_QUALITY = env.int("COMPRESSION_BROTLI_QUALITY", default=4)  # 0-11, higher is slower
+
+
+# Flash-sale (Tatkal) waiting room
+# When enabled, bookings on the train run on sale require an admission token issued by the waiting room for that
+# run. `manage.py admit_waiting_room` admits waiting tokens while the train run on sale has capacity left.
+
+FLASH_SALE_MODE = env.bool("FLASH_SALE_MODE", default=False)
+FLASH_SALE_TRAIN = env("FLASH_SALE_TRAIN", default=None)  # Train number on sale
+FLASH_SALE_JOURNEY_DATE = env("FLASH_SALE_JOURNEY_DATE", default=None)  # YYYY-MM-DD
+FLASH_SALE_MAX_ADMITTED = env.int("FLASH_SALE_MAX_ADMITTED", default=200)  # Concurrent bookers cap
+FLASH_SALE_MAX_PASSENGERS = env.int("FLASH_SALE_MAX_PASSENGERS", default=4)  # Passengers per admitted booking
+FLASH_SALE_ADMISSION_TTL = env.int("FLASH_SALE_ADMISSION_TTL", default=120)  # Seconds to use an admission
+FLASH_SALE_BOOKING_SECONDS = env.int("FLASH_SALE_BOOKING_SECONDS", default=5)  # Expected time per booking
+FLASH_SALE_ADMIT_INTERVAL = env.float("FLASH_SALE_ADMIT_INTERVAL", default=1.0)  # Seconds between admission rounds
+
+
+# Seat holds
+# A hold keeps confirmed berths reserved while the client pays; `manage.py release_expired_holds` frees lapsed ones.
+
+SEAT_HOLD_TTL = env.int("SEAT_HOLD_TTL", default=600)  # Seconds a hold stays valid
+SEAT_HOLD_SWEEP_INTERVAL = env.float("SEAT_HOLD_SWEEP_INTERVAL", default=5.0)  # Seconds between sweeps when idle
+
+
+# Availability stream (Server-Sent Events, served by ticket_system/asgi.py)
+
+SSE_MAX_UPDATES_PER_SECOND = env.int("SSE_MAX_UPDATES_PER_SECOND", default=2)  # Bursts are coalesced to this rate
+SSE_HEARTBEAT_SECONDS = env.int("SSE_HEARTBEAT_SECONDS", default=15)  # Keep-alive comment for idle connections
+
+
+# Transactional outbox
+# Booking events are written with each change and published by `manage.py relay_outbox` to every sink below.
+
+OUTBOX_BATCH_SIZE = env.int("OUTBOX_BATCH_SIZE", default=500)  # Events per publish call
+OUTBOX_POLL_INTERVAL = env.float("OUTBOX_POLL_INTERVAL", default=1.0)  # Seconds between polls when idle
+OUTBOX_GAP_GRACE_SECONDS = env.int("OUTBOX_GAP_GRACE_SECONDS", default=5)  # Wait this long for in-flight events
+OUTBOX_WEBHOOK_URL = env("OUTBOX_WEBHOOK_URL", default=None)
+
+OUTBOX_SINKS = {
+    "segments": {
+        "BACKEND": "tickets.outbox.SegmentFileSink",
+        "OPTIONS": {
+            "directory": env("OUTBOX_SEGMENT_DIR", default=os.path.join(BASE_DIR, "var", "outbox")),
+            "max_bytes": env.int("OUTBOX_SEGMENT_MAX_BYTES", default=64 * 1024 * 1024),
+        },
+    },
+}
+if OUTBOX_WEBHOOK_URL:
+    OUTBOX_SINKS["webhook"] = {
+        "BACKEND": "tickets.outbox.WebhookSink",
+        "OPTIONS": {
+            "url": OUTBOX_WEBHOOK_URL,
+            "secret": env("OUTBOX_WEBHOOK_SECRET", default=None),  # Signs each batch with HMAC-SHA256
+            "timeout": env.int("OUTBOX_WEBHOOK_TIMEOUT", default=5),
+        },
+    }
+
+
+# Django admin
+# Changelists page by primary key instead of OFFSET and show PostgreSQL's row estimate instead of COUNT(*);
+# results estimated below this many rows are counted exactly.
+
+ADMIN_EXACT_COUNT_LIMIT = env.int("ADMIN_EXACT_COUNT_LIMIT", default=10000)
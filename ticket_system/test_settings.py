@@ -0,0 +1,22 @@
+"""
+Settings for running the test suite without PostgreSQL.
+
+Two SQLite databases stand in for the ``default`` database and a ``shard1`` shard. Only
+``default`` takes bookings, as in a single-database deployment; the sharding tests add
+``shard1`` to ``SHARD_DATABASES`` themselves. Tests of PostgreSQL features skip themselves.
+
+    python manage.py test --settings=ticket_system.test_settings
+"""
+
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+    "shard1": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+}
+SHARD_DATABASES = ["default"]
@@ -16,10 +16,12 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 
+from tickets.openapi import CachedSchemaGenerator, cached_schema_view
+
 # Define Swagger Schema View
 schema_view = get_schema_view(
     openapi.Info(
@@ -31,13 +33,16 @@ schema_view = get_schema_view(
         license=openapi.License(name="MIT License"),
     ),
     public=True,
+    generator_class=CachedSchemaGenerator,
 )
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/tickets/", include("tickets.urls")),  # Include tickets app URLs
+    # Raw schema (swagger.json / swagger.yaml); all schema views build it once per code version
+    re_path(r"^swagger(?P<format>\.json|\.yaml)$", cached_schema_view(schema_view), name="schema-json"),
     # Swagger UI
-    path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="swagger-docs"),
+    path("swagger/", cached_schema_view(schema_view, "swagger"), name="swagger-docs"),
     # Redoc UI (alternative to Swagger UI)
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="redoc-docs"),
+    path("redoc/", cached_schema_view(schema_view, "redoc"), name="redoc-docs"),
 ]
@@ -1,3 +1,221 @@
-from django.contrib import admin
+"""
+Admin for the booking tables.
 
-# Register your models here.
+The tables behind these changelists hold millions of rows, so the stock changelist is adapted:
+- ``KeysetChangeList`` pages by primary key, newest first, so a deep page costs the same as the first.
+- ``EstimatedCountPaginator`` shows PostgreSQL's row estimate instead of running ``COUNT(*)``.
+- Every list selects the related rows its columns print, so no page issues a query per row.
+- With several shards a filter picks the shard to list, and change pages look in every shard.
+
+Rows are read-only here. Tickets are cancelled and berths released through the service layer,
+so the promotion queues, quota counters, history and outbox stay consistent.
+"""
+
+import json
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .constants import AVAILABLE, BOOKED
+from .models import Berth, Passenger, Ticket, TicketHistory
+from .services import cancel_ticket, release_berth
+from .sharding import on_shard, shard_aliases
+
+AFTER_VAR = "after"
+
+
+def estimated_rows(queryset):
+    """
+    PostgreSQL's estimate of the rows in ``queryset``; ``None`` on other databases.
+
+    An unfiltered queryset reads the table's ``reltuples`` from ``pg_class``, which is ``-1``
+    until the table is first analyzed. A filtered one reads the planner's row estimate.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            table = queryset.model._meta.db_table
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            return cursor.fetchone()[0]
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        (plan,) = cursor.fetchone()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]["Plan Rows"]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting exactly only below ``ADMIN_EXACT_COUNT_LIMIT`` estimated rows."""
+
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimated_rows(self.object_list)
+        if estimate is None or estimate < settings.ADMIN_EXACT_COUNT_LIMIT:
+            return self.object_list.count()
+        self.estimated = True
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist ordered by primary key, newest first, and paged with ``?after=<pk>``.
+
+    Each page starts after the last row of the previous one instead of at an OFFSET, so the
+    database never reads past the rows it returns. Pages are only linked forward, and the
+    row count comes from the admin's paginator.
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Changing a filter or the search starts again from the first page.
+        return super().get_query_string(new_params, [AFTER_VAR, *(remove or [])])
+
+    def get_ordering(self, request, queryset):
+        return ["-pk"]
+
+    def get_results(self, request):
+        queryset = self.queryset
+        after = request.GET.get(AFTER_VAR)
+        if after:
+            try:
+                queryset = queryset.filter(pk__lt=self.lookup_opts.pk.to_python(after))
+            except ValidationError:
+                raise IncorrectLookupParameters
+        rows = list(queryset[: self.list_per_page + 1])
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows[: self.list_per_page]
+        self.can_show_all = False
+        self.multi_page = False
+        self.first_page_url = self.get_query_string() if after else None
+        self.next_page_url = None
+        if len(rows) > self.list_per_page:
+            self.next_page_url = self.get_query_string({AFTER_VAR: self.result_list[-1].pk})
+
+
+class ShardFilter(admin.SimpleListFilter):
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def queryset(self, request, queryset):
+        if self.value() in shard_aliases():
+            return queryset.using(self.value())
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Read-only admin with keyset pages, estimated counts and a shard filter."""
+
+    paginator = EstimatedCountPaginator
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        return [ShardFilter, *list_filter] if len(shard_aliases()) > 1 else list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        for alias in shard_aliases():
+            with on_shard(alias):
+                obj = super().get_object(request, object_id, from_field)
+            if obj is not None:
+                return obj
+        return None
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields] + list(self.readonly_fields)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def apply_service(self, request, queryset, service, done):
+        """Call ``service(pk)`` for every selected row and report the ``(result, error)`` outcomes."""
+        applied, errors = 0, Counter()
+        for pk in list(queryset.order_by("pk").values_list("pk", flat=True)):
+            _, error = service(pk)
+            if error:
+                errors[error] += 1
+            else:
+                applied += 1
+        self.message_user(request, done.format(applied), messages.SUCCESS)
+        for error, count in errors.items():
+            self.message_user(request, f"{error} ({count})", messages.WARNING)
+
+
+@admin.register(Ticket)
+class TicketAdmin(LargeTableAdmin):
+    list_display = ("id", "passenger", "train", "journey_date", "ticket_type", "status", "berth", "quota", "created_at")
+    list_select_related = ("passenger", "train", "berth")
+    list_filter = ("status", "ticket_type", "quota")
+    search_fields = ("passenger__name",)
+    readonly_fields = ("ticket_history",)
+    actions = ["cancel_tickets"]
+
+    @admin.display(description="History")
+    def ticket_history(self, ticket):
+        query = {"ticket__id__exact": ticket.pk}
+        if len(shard_aliases()) > 1:
+            query["shard"] = ticket._state.db
+        return format_html(
+            '<a href="{}?{}">View history</a>', reverse("admin:tickets_tickethistory_changelist"), urlencode(query)
+        )
+
+    @admin.action(description="Cancel selected tickets and promote queued passengers", permissions=["change"])
+    def cancel_tickets(self, request, queryset):
+        self.apply_service(request, queryset.filter(status=BOOKED), cancel_ticket, "Tickets cancelled: {}.")
+
+
+@admin.register(Berth)
+class BerthAdmin(LargeTableAdmin):
+    list_display = ("id", "train", "journey_date", "berth_number", "berth_type", "quota", "availability_status")
+    list_select_related = ("train",)
+    list_filter = ("availability_status", "berth_type", "quota")
+    actions = ["release_berths"]
+
+    @admin.action(description="Release selected berths held by no ticket or seat hold", permissions=["change"])
+    def release_berths(self, request, queryset):
+        self.apply_service(
+            request, queryset.exclude(availability_status=AVAILABLE), release_berth, "Berths released: {}."
+        )
+
+
+@admin.register(TicketHistory)
+class TicketHistoryAdmin(LargeTableAdmin):
+    list_display = ("id", "ticket", "action", "timestamp")
+    list_select_related = ("ticket__passenger",)
+    list_filter = ("action",)
+
+
+@admin.register(Passenger)
+class PassengerAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "age", "gender", "external_id")
+    search_fields = ("name",)
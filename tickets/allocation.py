@@ -0,0 +1,89 @@
+"""
+Group berth allocation.
+
+Plans berths for a multi-passenger booking against an in-memory snapshot of the available
+berths, keeping the group in one compartment or in neighbouring ones. The planner never
+touches the database; callers feed it a snapshot and pass the result to the locked allocator
+as hints.
+"""
+
+from bisect import bisect_left
+
+from .constants import BERTHS_PER_COMPARTMENT, LOWER
+
+
+def compartment_of(berth_number):
+    """Return the compartment index a berth number belongs to."""
+    return (berth_number - 1) // BERTHS_PER_COMPARTMENT
+
+
+class GroupBerthAllocator:
+    """Score candidate compartments and assign adjacent berths to a group of passengers."""
+
+    def __init__(self, available_berths):
+        """``available_berths`` is an iterable of ``(berth_id, berth_number, berth_type)`` tuples."""
+        self.lower_berths = {}
+        self.other_berths = {}
+        for berth_id, berth_number, berth_type in sorted(available_berths, key=lambda berth: berth[1]):
+            pool = self.lower_berths if berth_type == LOWER else self.other_berths
+            pool.setdefault(compartment_of(berth_number), []).append(berth_id)
+        self.compartments = sorted(set(self.lower_berths) | set(self.other_berths))
+
+    def plan(self, needs_lower):
+        """
+        Assign a berth to every passenger of the group.
+
+        ``needs_lower`` holds one flag per passenger, set for seniors and women travelling with
+        a child. Flagged passengers always get a lower berth while one is free anywhere in the
+        train. Returns a list of berth ids aligned with ``needs_lower``; entries are ``None``
+        once the snapshot runs out of berths.
+        """
+        best_plan, best_score = [None] * len(needs_lower), None
+        for anchor in self.compartments:
+            plan, score = self._plan_around(anchor, needs_lower)
+            if best_score is None or score < best_score:
+                best_plan, best_score = plan, score
+            if score == 0:
+                break
+        return best_plan
+
+    def _plan_around(self, anchor, needs_lower):
+        """Greedily fill the group outward from ``anchor`` and score the result by total distance."""
+        taken = set()
+        plan = [None] * len(needs_lower)
+        score = 0
+
+        # Priority passengers pick first so the group cannot use up the nearby lower berths.
+        order = sorted(range(len(needs_lower)), key=lambda index: not needs_lower[index])
+        for index in order:
+            pools = (self.lower_berths,) if needs_lower[index] else (self.other_berths, self.lower_berths)
+            found = self._nearest_free(anchor, pools, taken)
+            if found is None and needs_lower[index]:
+                found = self._nearest_free(anchor, (self.other_berths,), taken)
+            if found is None:
+                continue
+            berth_id, distance = found
+            taken.add(berth_id)
+            plan[index] = berth_id
+            score += distance
+        return plan, score
+
+    def _nearest_free(self, anchor, pools, taken):
+        """Walk compartments outward from ``anchor`` and return the first free berth in ``pools``."""
+        right = bisect_left(self.compartments, anchor)
+        left = right - 1
+        while left >= 0 or right < len(self.compartments):
+            left_distance = anchor - self.compartments[left] if left >= 0 else None
+            right_distance = self.compartments[right] - anchor if right < len(self.compartments) else None
+            if right_distance is not None and (left_distance is None or right_distance <= left_distance):
+                compartment, distance = self.compartments[right], right_distance
+                right += 1
+            else:
+                compartment, distance = self.compartments[left], left_distance
+                left -= 1
+
+            for pool in pools:
+                for berth_id in pool.get(compartment, ()):
+                    if berth_id not in taken:
+                        return berth_id, distance
+        return None
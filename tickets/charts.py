@@ -0,0 +1,241 @@
+"""
+Chart preparation.
+
+At chart time a train run still has RAC and waiting-list tickets queued behind berths that
+cancellations and unconfirmed seat holds left free. Cancellations promote one ticket at a
+time; ``prepare_chart`` resolves whole queues in one pass instead. It closes the run to
+bookings and locks the run once. It then loads the berths, queues, holds and quota counters and
+runs the cancellation cascade over every free berth in memory. The outcome is written back
+with bulk updates and inserts.
+"""
+
+import copy
+from collections import Counter, deque
+
+from django.db import transaction
+from django.utils import timezone
+
+from .concurrency import BookingConflict
+from .constants import (
+    ACTION_MOVED_RAC,
+    ACTION_PROMOTED_RAC,
+    AVAILABLE,
+    BOOKED,
+    BOOKING_CONFLICT,
+    CHART_ALREADY_PREPARED,
+    CHART_NEEDS_TRAIN_RUN,
+    CHART_PREPARED,
+    CONFIRMED,
+    EVENT_TICKET_CONFIRMED,
+    EVENT_TICKET_MOVED_RAC,
+    HOLD_ACTIVE,
+    HOLD_RELEASED,
+    LOWER,
+    QUOTA_BUCKETS,
+    RAC,
+    SIDE_LOWER,
+    WAITING_LIST,
+)
+from .inventory import bump_inventory_version
+from .models import Berth, Chart, QuotaCounter, SeatHold, Ticket, TicketHistory, Train
+from .outbox import record_events
+from .quotas import get_quota_policy
+from .services import _inventory, _needs_lower_berth
+from .sharding import current_shard, on_shard, shard_of, train_shard
+from .status import invalidate_ticket_status
+
+HISTORY_ACTIONS = {EVENT_TICKET_CONFIRMED: ACTION_PROMOTED_RAC, EVENT_TICKET_MOVED_RAC: ACTION_MOVED_RAC}
+
+
+def prepare_chart(train, journey_date):
+    """
+    Close a train run to bookings and resolve its RAC and waiting-list queues; returns ``(chart, error)``.
+
+    A run whose chart was left half-prepared, for example by a crash, is prepared again.
+    """
+    if train is None or journey_date is None:
+        return None, CHART_NEEDS_TRAIN_RUN
+    inventory = _inventory(train, journey_date)
+    with on_shard(shard_of(train)):
+        # Committed on its own first, so bookings that lock the run from now on see the chart and stop.
+        with transaction.atomic(using=current_shard()):
+            chart, _ = Chart.objects.get_or_create(**inventory)
+        if chart.status == CHART_PREPARED:
+            return None, CHART_ALREADY_PREPARED
+        try:
+            with train_shard(train):
+                _prepare(chart, inventory)
+        except BookingConflict:
+            return None, BOOKING_CONFLICT
+    return chart, None
+
+
+def _prepare(chart, inventory):
+    # Bookings in flight hold the train row or a quota stripe until they commit; wait for them.
+    Train.objects.select_for_update().get(pk=inventory["train"].pk)
+    counters = list(QuotaCounter.objects.select_for_update().filter(**inventory).order_by("quota", "stripe"))
+    holds = list(SeatHold.objects.select_for_update().filter(status=HOLD_ACTIVE, **inventory))
+    berths = Berth.objects.in_bulk(Berth.objects.filter(**inventory).values_list("id", flat=True))
+    queued = (
+        Ticket.objects.select_related("passenger", "berth", "train")
+        .filter(status=BOOKED, ticket_type__in=[RAC, WAITING_LIST], **inventory)
+        .order_by("created_at", "id")
+    )
+
+    cascade = ChartCascade(berths, counters, get_quota_policy(**inventory))
+    for hold in holds:
+        cascade.release_hold(hold)
+        hold.status = HOLD_RELEASED
+    cascade.run(queued)
+
+    # A waiting-list ticket can move to RAC and then be confirmed, so it may appear in both lists.
+    changed_tickets = list({ticket.id: ticket for ticket in cascade.confirmed + cascade.moved_to_rac}.values())
+    Ticket.objects.bulk_update(changed_tickets, ["ticket_type", "berth", "berth_allocation", "quota"], batch_size=500)
+    Berth.objects.bulk_update(cascade.changed_berths.values(), ["availability_status", "version"], batch_size=500)
+    QuotaCounter.objects.bulk_update(cascade.changed_counters, ["booked", "version"])
+    SeatHold.objects.bulk_update(holds, ["status"])
+    TicketHistory.objects.bulk_create(
+        TicketHistory(ticket=ticket, action=HISTORY_ACTIONS[event]) for event, ticket in cascade.events
+    )
+    record_events(cascade.events)
+    if changed_tickets:
+        invalidate_ticket_status(changed_tickets[0])
+    bump_inventory_version(inventory)
+
+    chart.status = CHART_PREPARED
+    chart.confirmed_from_rac = len(cascade.confirmed)
+    chart.moved_to_rac = len(cascade.moved_to_rac)
+    chart.released_holds = len(holds)
+    chart.prepared_at = timezone.now()
+    chart.save(update_fields=["status", "confirmed_from_rac", "moved_to_rac", "released_holds", "prepared_at"])
+
+
+class ChartCascade:
+    """
+    In-memory run of the cancellation cascade over every free berth of a train run.
+
+    Each free berth goes to the oldest RAC ticket, as ``promote_next_rac_ticket`` would do when
+    it is released. The side-lower berth that ticket gives up goes to the oldest waiting-list
+    ticket, as in ``promote_next_waiting_list_ticket``, or back on sale. Berths are picked in the
+    service layer's order, lower berths first for passengers who need them. Free side-lower
+    berths move further waiting-list tickets to RAC, up to the policy's RAC limit. A ticket moved
+    to RAC joins the back of the RAC queue, so the cascade goes on until the free berths, the
+    quota seats or the queues run out. ``events`` lists every move in order, with a copy of the
+    ticket as it stood after the move.
+    """
+
+    def __init__(self, berths, counters, policy):
+        self.berths = berths
+        self.counters = counters
+        self.policy = policy
+        self.seats = Counter()
+        for counter in counters:
+            self.seats[counter.quota] += counter.capacity - counter.booked
+        self.claimed = Counter()
+        self.changed_berths = {}
+        self.confirmed = []
+        self.moved_to_rac = []
+        self.events = []
+
+    def release_hold(self, hold):
+        """Put the seats and berths of an unconfirmed hold back, to be handed down the queues."""
+        for seat in hold.seats:
+            self.seats[seat["quota"]] += 1
+            self.claimed[seat["quota"]] -= 1
+            berth = self.berths.get(seat["berth_id"])
+            if berth:
+                self._set_status(berth, AVAILABLE)
+
+    def run(self, queued):
+        rac_queue = deque(ticket for ticket in queued if ticket.ticket_type == RAC)
+        waiting_list = deque(ticket for ticket in queued if ticket.ticket_type == WAITING_LIST)
+        # Same orders as _available_berths and _available_rac_berths.
+        free_berths = sorted(
+            (b for b in self.berths.values() if b.availability_status == AVAILABLE and b.berth_type != SIDE_LOWER),
+            key=lambda berth: (berth.berth_type, berth.berth_number, berth.id),
+        )
+        free_side_lowers = deque(
+            sorted(
+                (b for b in self.berths.values() if b.availability_status == AVAILABLE and b.berth_type == SIDE_LOWER),
+                key=lambda berth: (berth.berth_number, berth.id),
+            )
+        )
+
+        while True:
+            self._confirm_rac(rac_queue, waiting_list, free_berths)
+            moved = False
+            while free_side_lowers and waiting_list and len(rac_queue) < self.policy.rac_limit:
+                berth = free_side_lowers.popleft()
+                rac_queue.append(self._move_to_rac(waiting_list.popleft(), berth))
+                self._set_status(berth, BOOKED)
+                moved = True
+            if not (moved and free_berths):
+                break
+        self._apply_claims()
+
+    def _confirm_rac(self, rac_queue, waiting_list, free_berths):
+        while rac_queue and free_berths and sum(seats for seats in self.seats.values() if seats > 0):
+            ticket = rac_queue.popleft()
+            berth = self._pick_berth(free_berths, ticket.passenger)
+            vacated_berth = ticket.berth
+            ticket.ticket_type = CONFIRMED
+            ticket.berth = berth
+            ticket.berth_allocation = berth.berth_type
+            ticket.quota = self._claim_seat(berth.quota)
+            self._set_status(berth, BOOKED)
+            self.confirmed.append(ticket)
+            self.events.append((EVENT_TICKET_CONFIRMED, copy.copy(ticket)))
+
+            if vacated_berth and vacated_berth.berth_type == SIDE_LOWER:
+                if waiting_list:
+                    rac_queue.append(self._move_to_rac(waiting_list.popleft(), vacated_berth))
+                else:
+                    self._set_status(self.berths.get(vacated_berth.id, vacated_berth), AVAILABLE)
+
+    @property
+    def changed_counters(self):
+        return [counter for counter in self.counters if counter.id in self._changed_counter_ids]
+
+    def _pick_berth(self, free_berths, passenger):
+        if _needs_lower_berth(passenger.age, passenger.gender, False):
+            for index, berth in enumerate(free_berths):
+                if berth.berth_type == LOWER:
+                    return free_berths.pop(index)
+        return free_berths.pop(0)
+
+    def _claim_seat(self, quota):
+        """Take a seat from the berth's own bucket, or from the first bucket with seats left."""
+        if self.seats[quota] <= 0:
+            quota = next(bucket for bucket, _ in QUOTA_BUCKETS if self.seats[bucket] > 0)
+        self.seats[quota] -= 1
+        self.claimed[quota] += 1
+        return quota
+
+    def _move_to_rac(self, ticket, berth):
+        ticket.ticket_type = RAC
+        ticket.berth = berth
+        ticket.berth_allocation = berth.berth_type
+        self.moved_to_rac.append(ticket)
+        self.events.append((EVENT_TICKET_MOVED_RAC, copy.copy(ticket)))
+        return ticket
+
+    def _set_status(self, berth, status):
+        if berth.availability_status != status:
+            berth.availability_status = status
+            if berth.id not in self.changed_berths:
+                berth.version += 1
+            self.changed_berths[berth.id] = berth
+
+    def _apply_claims(self):
+        """Spread the net seats taken from each bucket over its stripes, as claim_quota and release_quota would."""
+        self._changed_counter_ids = set()
+        for quota, seats in self.claimed.items():
+            for counter in self.counters:
+                if counter.quota != quota or not seats:
+                    continue
+                change = min(seats, counter.capacity - counter.booked) if seats > 0 else -min(-seats, counter.booked)
+                if change:
+                    counter.booked += change
+                    counter.version += 1
+                    seats -= change
+                    self._changed_counter_ids.add(counter.id)
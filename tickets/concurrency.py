@@ -0,0 +1,54 @@
+"""
+Optimistic booking.
+
+With ``BOOKING_CONCURRENCY = "optimistic"`` berths and quota counters are not locked while a
+booking picks one. The row is read together with its ``version`` and claimed with a single
+conditional ``UPDATE ... WHERE id = ? AND version = ?`` that also bumps the version. Every other
+write to these rows bumps the version too, so a zero-row update means somebody changed the row
+in between, and the booking picks again from fresh data.
+"""
+
+import random
+
+from django.conf import settings
+from django.db.models import F
+
+from .constants import CONCURRENCY_OPTIMISTIC
+
+
+class BookingConflict(Exception):
+    """A compare-and-swap claim kept losing to concurrent bookings."""
+
+
+def optimistic_booking():
+    return settings.BOOKING_CONCURRENCY == CONCURRENCY_OPTIMISTIC
+
+
+def pick_spread(candidates):
+    """
+    Pick one of the first ``BOOKING_CAS_CANDIDATES`` rows of ``candidates`` at random, or ``None``.
+
+    Concurrent bookings reading the same ordered candidates would all race for the first row, and
+    all but one would lose and re-pick. Spreading them over the head of the list keeps the order
+    roughly intact while few claims collide.
+    """
+    rows = list(candidates[: max(settings.BOOKING_CAS_CANDIDATES, 1)])
+    return random.choice(rows) if rows else None
+
+
+def claim_versioned(candidates, pick, **changes):
+    """
+    Apply ``changes`` to the row ``pick`` chooses from ``candidates`` if nobody changed it since it was read.
+
+    ``pick`` receives the ``candidates`` queryset and returns an instance, or ``None`` when nothing
+    is left to claim. The update repeats the ``candidates`` filters, so a row that no longer
+    qualifies is never claimed. Returns the claimed instance as it was read, or ``None``; raises
+    ``BookingConflict`` after ``BOOKING_CAS_RETRIES`` lost races.
+    """
+    for _ in range(max(settings.BOOKING_CAS_RETRIES, 1)):
+        row = pick(candidates)
+        if row is None:
+            return None
+        if candidates.filter(pk=row.pk, version=row.version).update(version=F("version") + 1, **changes):
+            return row
+    raise BookingConflict
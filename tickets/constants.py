@@ -12,11 +12,24 @@ TICKET_STATUS = [(BOOKED, "Booked"), (CANCELED, "Cancelled")]
 
 # Berth Types
 LOWER = "lower"
+MIDDLE = "middle"
 UPPER = "upper"
 SIDE_LOWER = "side-lower"
 SIDE_UPPER = "side-upper"
 
-BERTH_TYPES = [(LOWER, "Lower"), (SIDE_LOWER, "Side-Lower"), (UPPER, "Upper"), (SIDE_UPPER, "Side-Upper")]
+BERTH_TYPES = [
+    (LOWER, "Lower"),
+    (MIDDLE, "Middle"),
+    (SIDE_LOWER, "Side-Lower"),
+    (UPPER, "Upper"),
+    (SIDE_UPPER, "Side-Upper"),
+]
+
+# Coach Layout
+# Berths are numbered compartment by compartment, so berth N sits in compartment (N - 1) // 8.
+COMPARTMENT_LAYOUT = [LOWER, MIDDLE, UPPER, LOWER, MIDDLE, UPPER, SIDE_LOWER, SIDE_UPPER]
+BERTHS_PER_COMPARTMENT = len(COMPARTMENT_LAYOUT)
+COMPARTMENTS_PER_COACH = 9
 
 # Availability Status
 AVAILABLE = "available"
@@ -25,6 +38,55 @@ RESERVED = "reserved"
 
 AVAILABILITY_STATUS = [(AVAILABLE, "Available"), (BOOKED, "Booked"), (RESERVED, "Reserved")]
 
+# Waiting Room Admission Status
+ADMISSION_WAITING = "waiting"
+ADMISSION_ADMITTED = "admitted"
+ADMISSION_BOOKING = "booking"
+ADMISSION_USED = "used"
+ADMISSION_EXPIRED = "expired"
+
+ADMISSION_STATUS = [
+    (ADMISSION_WAITING, "Waiting"),
+    (ADMISSION_ADMITTED, "Admitted"),
+    (ADMISSION_BOOKING, "Booking"),
+    (ADMISSION_USED, "Used"),
+    (ADMISSION_EXPIRED, "Expired"),
+]
+
+# Seat Hold Status
+HOLD_ACTIVE = "active"
+HOLD_CONFIRMED = "confirmed"
+HOLD_RELEASED = "released"
+HOLD_EXPIRED = "expired"
+
+HOLD_STATUS = [
+    (HOLD_ACTIVE, "Active"),
+    (HOLD_CONFIRMED, "Confirmed"),
+    (HOLD_RELEASED, "Released"),
+    (HOLD_EXPIRED, "Expired"),
+]
+
+# Chart Status
+# A chart row closes its train run to bookings; it is "prepared" once every queue has been resolved.
+CHART_PREPARING = "preparing"
+CHART_PREPARED = "prepared"
+
+CHART_STATUS = [
+    (CHART_PREPARING, "Preparing"),
+    (CHART_PREPARED, "Prepared"),
+]
+
+# Ticket Status Lookup
+STATUS_LOOKUP_LIMIT = 20  # Tickets per lookup, enough for a group booking
+
+# Itineraries
+ITINERARY_MAX_LEGS = 4  # Connecting trains booked together in one request
+
+# Passenger Search
+SEARCH_MIN_NAME_LENGTH = 3  # Shortest name fragment the trigram index can narrow down
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
 # Error Messages
 TICKET_NOT_FOUND = "Ticket not found."
 ALREADY_CANCELED = "This ticket is already canceled."
@@ -33,6 +95,38 @@ NO_RAC_BERTHS = "No RAC berths available"
 NO_TICKETS_AVAILABLE = "No tickets available"
 NO_BERTH_AVAILABLE = "No available berths for this ticket."
 REQUIRED_FIELDS = "All fields are required."
+ADMISSION_REQUIRED = "Flash sale in progress. Join the waiting room and book with an admitted token."
+ADMISSION_NOT_FOUND = "Admission token not found."
+ADMISSION_WRONG_TRAIN_RUN = "This admission token was issued for another train run."
+ADMISSION_TOO_MANY_PASSENGERS = "Flash-sale bookings are limited to {} passengers per admission."
+SERVICE_OVERLOADED = "Booking service is overloaded. Please retry later."
+UNSUPPORTED_EXPORT_FORMAT = "Unsupported export format. Use csv, ndjson or parquet."
+PARQUET_UNAVAILABLE = "Parquet export requires pyarrow to be installed."
+TRAIN_NOT_FOUND = "Train not found."
+BOOKING_CONFLICT = "Booking temporarily unavailable. Please try again."
+HOLD_NOT_FOUND = "Seat hold not found."
+INVALID_TICKET_IDS = f"Pass between 1 and {STATUS_LOOKUP_LIMIT} comma-separated ticket ids in the ids parameter."
+HOLD_NOT_ACTIVE = "This seat hold has expired or was already used."
+INVALID_JOURNEY_DATE = "Journey date must be in YYYY-MM-DD format."
+SEARCH_NAME_TOO_SHORT = f"Search by at least {SEARCH_MIN_NAME_LENGTH} characters of the passenger name."
+INVALID_SEARCH_FILTER = "Invalid value for the {} search filter."
+INVALID_SEARCH_CURSOR = "Invalid search cursor."
+UNKNOWN_SHARD = "Unknown shard database."
+TRAIN_ALREADY_ON_SHARD = "The train is already on that shard."
+SHARDS_REQUIRE_POSTGRESQL = "Sharding requires every shard database to be PostgreSQL."
+EXPLAIN_REQUIRES_POSTGRESQL = "Query plans can only be explained on PostgreSQL."
+NO_TRAIN_RUN_TO_EXPLAIN = "No train run has booked tickets to explain the hot queries on."
+NO_QUERY_PLAN_BASELINE = "No query plan baseline at {}; create one with --update-baseline."
+QUERY_PLANS_REGRESSED = "{} query plans regressed from the baseline."
+CHART_CLOSED = "The chart of this train run has been prepared; bookings are closed."
+CHART_ALREADY_PREPARED = "The chart of this train run has already been prepared."
+CHART_NEEDS_TRAIN_RUN = "Charts are prepared for a train and journey date."
+BERTH_NOT_FOUND = "Berth not found."
+BERTH_ALREADY_AVAILABLE = "The berth is already available."
+BERTH_IN_USE = "A booked ticket holds this berth; cancel the ticket instead."
+BERTH_HELD = "The berth is reserved by an active seat hold."
+INVALID_ITINERARY = f"Pass between 2 and {ITINERARY_MAX_LEGS} legs, each with a train and a journey date."
+DUPLICATE_ITINERARY_LEG = "An itinerary cannot book the same train run twice."
 
 # Success Messages
 ACTION_CANCELED = "Ticket canceled successfully."
@@ -48,9 +142,23 @@ HISTORY_ACTIONS = [
     (ACTION_BOOKED, "Booked"),
     (ACTION_CANCELED, "Canceled"),
     (ACTION_MOVED_RAC, "Moved to RAC"),
+    (ACTION_PROMOTED_RAC, "Promoted from RAC"),
     (ACTION_PROMOTED_WAITING, "Promoted from Waiting List"),
 ]
 
+# Outbox Events
+EVENT_TICKET_BOOKED = "ticket.booked"
+EVENT_TICKET_CANCELED = "ticket.canceled"
+EVENT_TICKET_CONFIRMED = "ticket.promoted_to_confirmed"
+EVENT_TICKET_MOVED_RAC = "ticket.moved_to_rac"
+
+EVENT_TYPES = [
+    (EVENT_TICKET_BOOKED, "Ticket booked"),
+    (EVENT_TICKET_CANCELED, "Ticket canceled"),
+    (EVENT_TICKET_CONFIRMED, "RAC ticket confirmed"),
+    (EVENT_TICKET_MOVED_RAC, "Waiting-list ticket moved to RAC"),
+]
+
 # Gender
 GENDER_MALE = "M"
 GENDER_FEMALE = "F"
@@ -60,7 +168,32 @@ GENDER_CHOICES = [(GENDER_MALE, "Male"), (GENDER_FEMALE, "Female")]
 SENIOR_AGE = 60
 CHILD_AGE = 5
 
-# Ticket Limits
+# Default Ticket Limits (used when a train has no QuotaPolicy)
 CONFIRMED_BERTH_LIMIT = 63  # Regular berths (18 + 18 + 18 + 9)
-RAC_TICKET_LIMIT = 9  # Side lower berths
+RAC_TICKET_LIMIT = 9  # One RAC passenger per side lower berth
 WAITING_LIST_LIMIT = 10  # Waiting list capacity
+LADIES_QUOTA = 6  # Confirmed berths reserved for women
+SENIOR_QUOTA = 6  # Confirmed lower berths reserved for senior citizens
+
+# Travel Classes
+SLEEPER = "SL"
+AC_THREE_TIER = "3A"
+AC_TWO_TIER = "2A"
+
+TRAVEL_CLASSES = [(SLEEPER, "Sleeper"), (AC_THREE_TIER, "AC 3 Tier"), (AC_TWO_TIER, "AC 2 Tier")]
+
+# Quota Buckets
+# Confirmed berths are sold from separate buckets; unused reserved quota rolls over into general.
+QUOTA_GENERAL = "general"
+QUOTA_LADIES = "ladies"
+QUOTA_SENIOR = "senior"
+
+QUOTA_BUCKETS = [(QUOTA_GENERAL, "General"), (QUOTA_LADIES, "Ladies"), (QUOTA_SENIOR, "Senior Citizen")]
+RESERVED_QUOTAS = [QUOTA_LADIES, QUOTA_SENIOR]
+
+# Booking Concurrency Modes
+# Pessimistic bookings lock the berth rows they pick; optimistic ones claim them with a versioned compare-and-swap.
+CONCURRENCY_PESSIMISTIC = "pessimistic"
+CONCURRENCY_OPTIMISTIC = "optimistic"
+
+CONCURRENCY_MODES = [CONCURRENCY_PESSIMISTIC, CONCURRENCY_OPTIMISTIC]
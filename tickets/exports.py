@@ -0,0 +1,187 @@
+"""
+Streaming reservation manifest export.
+
+Rows are read through a server-side cursor and encoded chunk by chunk, so exporting a full
+manifest needs constant memory whatever its size.
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .constants import CONFIRMED
+from .services import get_booked_tickets
+from .sharding import inventory_shards
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+MANIFEST_CHUNK_SIZE = 2000
+
+MANIFEST_COLUMNS = [
+    ("ticket_id", "id"),
+    ("ticket_type", "ticket_type"),
+    ("status", "status"),
+    ("queue_position", "queue_position"),
+    ("created_at", "created_at"),
+    ("train_number", "train__number"),
+    ("journey_date", "journey_date"),
+    ("passenger_id", "passenger_id"),
+    ("passenger_name", "passenger__name"),
+    ("age", "passenger__age"),
+    ("gender", "passenger__gender"),
+    ("is_child", "passenger__is_child"),
+    ("berth_number", "berth__berth_number"),
+    ("berth_type", "berth__berth_type"),
+]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def iter_manifest_rows(inventory=None):
+    """
+    Yield manifest rows as tuples ordered like ``MANIFEST_COLUMNS``, for one train run when ``inventory`` names one.
+
+    A manifest spanning trains is read one shard after the other.
+    """
+    for alias in inventory_shards(inventory):
+        yield from _iter_shard_manifest_rows(alias, inventory)
+
+
+def _iter_shard_manifest_rows(alias, inventory):
+    queryset = (
+        get_booked_tickets(inventory)
+        .using(alias)
+        .annotate(
+            queue_position=Window(
+                expression=RowNumber(),
+                partition_by=[F("train"), F("journey_date"), F("ticket_type")],
+                order_by=[F("created_at").asc(), F("id").asc()],
+            )
+        )
+        .order_by("id")
+        .values_list(*(field for _, field in MANIFEST_COLUMNS))
+    )
+    queue_index = [column for column, _ in MANIFEST_COLUMNS].index("queue_position")
+    type_index = [column for column, _ in MANIFEST_COLUMNS].index("ticket_type")
+    for row in queryset.iterator(chunk_size=MANIFEST_CHUNK_SIZE):
+        # Confirmed tickets are not queued for anything.
+        if row[type_index] == CONFIRMED:
+            row = row[:queue_index] + (None,) + row[queue_index + 1 :]
+        yield row
+
+
+def export_manifest(export_format, inventory=None):
+    """Return an iterator of encoded chunks of the manifest in ``export_format``."""
+    encoders = {"csv": _encode_csv, "ndjson": _encode_ndjson, "parquet": _encode_parquet}
+    return encoders[export_format](iter_manifest_rows(inventory))
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+class _Echo:
+    """File-like object that hands back whatever is written to it."""
+
+    def write(self, value):
+        return value
+
+
+def _encode_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in MANIFEST_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _encode_ndjson(rows):
+    columns = [column for column, _ in MANIFEST_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+class _ChunkSink:
+    """Write-only stream that collects bytes until drained while reporting the true file position."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _encode_parquet(rows):
+    """Write one row group per chunk of rows and stream each one out as soon as it is written."""
+    columns = [column for column, _ in MANIFEST_COLUMNS]
+    sink = _ChunkSink()
+    writer = None
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == MANIFEST_CHUNK_SIZE:
+            writer = _write_parquet_batch(writer, sink, columns, batch)
+            batch = []
+            yield sink.drain()
+
+    if batch or writer is None:
+        writer = _write_parquet_batch(writer, sink, columns, batch)
+    writer.close()
+    yield sink.drain()
+
+
+def _write_parquet_batch(writer, sink, columns, batch):
+    table = pyarrow.Table.from_pylist([dict(zip(columns, row)) for row in batch], schema=_parquet_schema())
+    if writer is None:
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), table.schema)
+    writer.write_table(table)
+    return writer
+
+
+def _parquet_schema():
+    return pyarrow.schema(
+        [
+            ("ticket_id", pyarrow.int64()),
+            ("ticket_type", pyarrow.string()),
+            ("status", pyarrow.string()),
+            ("queue_position", pyarrow.int64()),
+            ("created_at", pyarrow.timestamp("us", tz="UTC")),
+            ("train_number", pyarrow.string()),
+            ("journey_date", pyarrow.date32()),
+            ("passenger_id", pyarrow.int64()),
+            ("passenger_name", pyarrow.string()),
+            ("age", pyarrow.int32()),
+            ("gender", pyarrow.string()),
+            ("is_child", pyarrow.bool_()),
+            ("berth_number", pyarrow.int32()),
+            ("berth_type", pyarrow.string()),
+        ]
+    )
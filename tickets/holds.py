@@ -0,0 +1,226 @@
+"""
+Two-phase booking with temporary seat holds.
+
+``hold_seats`` claims quota and marks confirmed berths ``reserved`` in one short transaction,
+then hands the client a token that stays valid for ``SEAT_HOLD_TTL`` seconds. Slow client-side
+steps such as payment happen between the two phases without any database lock held, and
+``confirm_hold`` turns the hold into tickets. Holds nobody confirmed are freed by
+``release_expired_holds``, which passes their seats down the RAC and waiting-list queues the
+same way a cancellation does.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.db.utils import OperationalError
+from django.utils import timezone
+
+from .concurrency import BookingConflict
+from .constants import (
+    BOOKED,
+    BOOKING_CONFLICT,
+    CHART_CLOSED,
+    CHILD_AGE,
+    CONFIRMED,
+    EVENT_TICKET_BOOKED,
+    HOLD_ACTIVE,
+    HOLD_CONFIRMED,
+    HOLD_EXPIRED,
+    HOLD_NOT_ACTIVE,
+    HOLD_NOT_FOUND,
+    HOLD_RELEASED,
+    NO_BERTH_AVAILABLE,
+    NO_CONFIRMED_BERTHS,
+    RESERVED,
+)
+from .inventory import bump_inventory_version
+from .models import Berth, Passenger, SeatHold, Train
+from .outbox import record_event
+from .quotas import claim_quota, eligible_quotas, release_quota
+from .services import (
+    BookingService,
+    _allocate_berth,
+    _chart_closed,
+    _create_passenger,
+    _create_ticket,
+    _inventory,
+    _release_berth,
+    promote_next_rac_ticket,
+    promote_next_waiting_list_ticket,
+)
+from .sharding import current_shard, locate, on_shard, train_shard
+
+
+def hold_seats(passengers_data, inventory):
+    """
+    Reserve a confirmed seat for every passenger in ``passengers_data`` that can get one.
+
+    Returns ``(hold, errors)``. ``hold`` is ``None`` when no seat could be held. ``errors`` lists
+    the passengers left out, for example because confirmed quota is sold out; they can still
+    be booked onto RAC or the waiting list through the regular booking endpoint.
+    """
+    try:
+        with train_shard(inventory["train"]):
+            return _hold_seats(passengers_data, inventory)
+    except (OperationalError, BookingConflict):
+        return None, [{"error": BOOKING_CONFLICT, "passenger": passenger_data} for passenger_data in passengers_data]
+
+
+def _hold_seats(passengers_data, inventory):
+    seats, errors = [], []
+    for passenger_data in passengers_data:
+        seat, error = _hold_seat(passenger_data, inventory)
+        if error:
+            errors.append({"error": error, "passenger": passenger_data})
+        else:
+            seats.append(seat)
+
+    if not seats:
+        return None, errors
+
+    hold = SeatHold.objects.create(
+        seats=seats, expires_at=timezone.now() + timedelta(seconds=settings.SEAT_HOLD_TTL), **inventory
+    )
+    bump_inventory_version(inventory)
+    return hold, errors
+
+
+def _hold_seat(passenger_data, inventory):
+    if not BookingService._validate_passenger_data(passenger_data):
+        return None, "Missing required fields"
+
+    age, gender, has_child = passenger_data["age"], passenger_data.get("gender"), passenger_data.get("has_child", False)
+    passenger = Passenger(name=passenger_data["name"], age=age, gender=gender, is_child=age < CHILD_AGE)
+    quota = claim_quota(inventory, eligible_quotas(passenger))
+    if not quota:
+        return None, NO_CONFIRMED_BERTHS
+    if _chart_closed(inventory):
+        release_quota(inventory, quota)
+        return None, CHART_CLOSED
+
+    berth = None
+    if not passenger.is_child:
+        berth = _allocate_berth(CONFIRMED, age, gender, has_child, inventory, quota)
+        if not berth:
+            release_quota(inventory, quota)
+            return None, NO_BERTH_AVAILABLE
+        Berth.objects.filter(id=berth.id).update(availability_status=RESERVED, version=F("version") + 1)
+
+    return {
+        "name": passenger.name,
+        "age": age,
+        "gender": gender,
+        "external_id": passenger_data.get("external_id"),
+        "quota": quota,
+        "berth_id": berth.id if berth else None,
+        "berth_number": berth.berth_number if berth else None,
+        "berth_type": berth.berth_type if berth else None,
+    }, None
+
+
+def confirm_hold(token):
+    """Turn an active hold into confirmed tickets on the berths it reserved; returns ``(tickets, error)``."""
+    return _on_hold_shard(token, _confirm_hold)
+
+
+def _confirm_hold(token):
+    hold, error = _lock_active_hold(token)
+    if error:
+        return None, error
+
+    inventory = _inventory(hold.train, hold.journey_date)
+    berths = Berth.objects.in_bulk([seat["berth_id"] for seat in hold.seats if seat["berth_id"]])
+    tickets = []
+    for seat in hold.seats:
+        passenger = _create_passenger(seat["name"], seat["age"], seat["gender"], seat["external_id"])
+        ticket_details = {"ticket_type": CONFIRMED, "berth": berths.get(seat["berth_id"]), "quota": seat["quota"]}
+        ticket = _create_ticket(passenger, ticket_details, inventory)
+        record_event(EVENT_TICKET_BOOKED, ticket)
+        tickets.append(ticket)
+
+    hold.status = HOLD_CONFIRMED
+    hold.save(update_fields=["status"])
+    bump_inventory_version(inventory)
+    return tickets, None
+
+
+def release_hold(token):
+    """Give the seats of an active hold back before it expires; returns ``(hold, error)``."""
+    return _on_hold_shard(token, _release_hold)
+
+
+def _release_hold(token):
+    hold, error = _lock_active_hold(token)
+    if error:
+        return None, error
+    _release(hold, HOLD_RELEASED)
+    return hold, None
+
+
+def release_expired_holds(batch_size=100, now=None):
+    """
+    Release up to ``batch_size`` lapsed holds on the current shard and return how many were released.
+
+    Each batch is one transaction. Holds being confirmed or released at the same moment are
+    locked and skipped, so the sweeper never waits on a client request.
+    """
+    with transaction.atomic(using=current_shard()):
+        holds = list(
+            SeatHold.objects.select_for_update(skip_locked=True, of=("self",))
+            .select_related("train")
+            .filter(status=HOLD_ACTIVE, expires_at__lte=now or timezone.now())
+            .order_by("expires_at")[:batch_size]
+        )
+        for hold in holds:
+            _release(hold, HOLD_EXPIRED)
+        return len(holds)
+
+
+def _on_hold_shard(token, func):
+    """Call ``func(token)`` in a transaction on the shard of the hold's train."""
+    try:
+        with on_shard(locate(SeatHold.objects.filter(token=token))):
+            train = Train.objects.filter(seat_holds__token=token).first()
+            with train_shard(train):
+                return func(token)
+    except ValidationError:
+        return None, HOLD_NOT_FOUND
+    except BookingConflict:
+        return None, BOOKING_CONFLICT
+
+
+def _lock_active_hold(token):
+    try:
+        hold = SeatHold.objects.select_for_update(of=("self",)).select_related("train").get(token=token)
+    except (SeatHold.DoesNotExist, ValidationError):
+        return None, HOLD_NOT_FOUND
+
+    if hold.status != HOLD_ACTIVE or hold.expires_at <= timezone.now():
+        return None, HOLD_NOT_ACTIVE
+    return hold, None
+
+
+def _release(hold, status):
+    """Hand each held seat to the oldest RAC ticket, like a cancellation, and free whatever is left over."""
+    inventory = _inventory(hold.train, hold.journey_date)
+    berths = Berth.objects.in_bulk([seat["berth_id"] for seat in hold.seats if seat["berth_id"]])
+    for seat in hold.seats:
+        berth = berths.get(seat["berth_id"])
+        if not berth:
+            # A child's seat frees quota but no berth a RAC passenger could move to.
+            release_quota(inventory, seat["quota"])
+            continue
+        leftover_berth = promote_next_rac_ticket(berth, inventory, seat["quota"])
+        if leftover_berth is not berth:
+            # A RAC passenger was confirmed onto the held berth.
+            Berth.objects.filter(id=berth.id).update(availability_status=BOOKED, version=F("version") + 1)
+        leftover_berth = promote_next_waiting_list_ticket(leftover_berth, inventory)
+        if leftover_berth:
+            _release_berth(leftover_berth)
+
+    hold.status = status
+    hold.save(update_fields=["status"])
+    bump_inventory_version(inventory)
@@ -0,0 +1,64 @@
+"""
+Inventory version and change notifications.
+
+One ``InventoryVersion`` row counts every change to availability. Bookings, cancellations,
+promotions, holds, charting, quota rollovers and the lifecycle jobs call
+``bump_inventory_version``, which increments it once their transaction commits and, on
+PostgreSQL, sends a NOTIFY on ``INVENTORY_CHANNEL`` naming the train run that changed. The list
+endpoints build their ETags from the version with ``inventory_etag``, so a client holding a
+current one gets a 304 without a read of tickets or berths, and the availability stream wakes
+only the clients following that run.
+"""
+
+from django.db import connection
+from django.db.models import F
+
+from .models import InventoryVersion
+from .sharding import on_commit
+
+INVENTORY_VERSION_ID = 1
+INVENTORY_CHANNEL = "inventory_changes"
+
+
+def get_inventory_version():
+    """Read the current inventory version with a single primary-key lookup."""
+    return InventoryVersion.objects.filter(pk=INVENTORY_VERSION_ID).values_list("version", flat=True).first() or 0
+
+
+def bump_inventory_version(inventory=None):
+    """
+    Bump the inventory version once the surrounding transaction on the current shard commits.
+
+    Bumping after commit keeps the hot counter row out of the booking transaction and
+    guarantees a client never sees a new version alongside data from before the change.
+    ``inventory`` names the train run that changed; jobs that change many runs leave it out.
+    """
+    run = _run_key(inventory)
+    on_commit(lambda: _increment_version(run))
+
+
+def _run_key(inventory):
+    """Key of the train run in ``inventory`` in change notifications; empty when no single run is named."""
+    if not inventory or not inventory.get("train") or not inventory.get("journey_date"):
+        return ""
+    return f"{inventory['train'].number}:{inventory['journey_date']}"
+
+
+def _increment_version(run):
+    updated = InventoryVersion.objects.filter(pk=INVENTORY_VERSION_ID).update(version=F("version") + 1)
+    if not updated:
+        InventoryVersion.objects.get_or_create(pk=INVENTORY_VERSION_ID, defaults={"version": 1})
+
+    # Wake the availability streams of the run in every worker process.
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [INVENTORY_CHANNEL, run])
+
+
+def inventory_etag(scope):
+    """Build an ``etag_func`` for ``django.views.decorators.http.condition`` tied to the inventory version."""
+
+    def etag_func(request, *args, **kwargs):
+        return f"{scope}-{get_inventory_version()}"
+
+    return etag_func
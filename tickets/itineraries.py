@@ -0,0 +1,123 @@
+"""
+Itineraries: one booking over connecting trains.
+
+``book_itinerary`` books every passenger on every leg or on none of them. Legs are locked in
+order of train number and journey date, whatever order the request lists them in, so two
+itineraries sharing trains take their locks in the same order and cannot deadlock.
+
+When all legs live on one shard they are booked in one transaction, with RAC and waiting-list
+tickets where confirmed berths are sold out, and a failed leg rolls every leg back. Legs on
+different shards cannot share a transaction, so they go through seat holds instead: every leg
+is held first and only then confirmed. A leg that cannot be held releases the holds taken so
+far; a hold that fails to confirm cancels the tickets already booked. Seat holds only reserve
+confirmed berths, so such an itinerary is refused rather than queued when a leg is sold out.
+"""
+
+from django.db import transaction
+
+from .constants import DUPLICATE_ITINERARY_LEG, INVALID_ITINERARY, ITINERARY_MAX_LEGS
+from .holds import confirm_hold, hold_seats, release_hold
+from .services import BookingService, cancel_ticket, resolve_inventory
+from .sharding import on_shard, shard_of
+
+
+class LegFailed(Exception):
+    """Raised inside the itinerary transaction to roll back every leg booked so far."""
+
+    def __init__(self, error):
+        super().__init__(error["error"])
+        self.error = error
+
+
+def book_itinerary(passengers_data, legs_data):
+    """
+    Book ``passengers_data`` on every leg in ``legs_data``; returns ``(legs, error)``.
+
+    Each leg is a dict with ``train`` and ``journey_date``. ``legs`` lists, in request order,
+    the train run and tickets of each leg. ``error`` is a dict with the message and, when a
+    booking failed, the ``leg`` index and the ``passenger`` it failed for.
+    """
+    if not passengers_data:
+        return None, {"error": "No passengers provided"}
+    legs, error = _resolve_legs(legs_data)
+    if error:
+        return None, {"error": error}
+
+    order = sorted(range(len(legs)), key=lambda index: (legs[index]["train"].number, legs[index]["journey_date"]))
+    if len({shard_of(leg["train"]) for leg in legs}) == 1:
+        tickets, error = _book_in_one_transaction(passengers_data, legs, order)
+    else:
+        tickets, error = _book_with_holds(passengers_data, legs, order)
+    if error:
+        return None, error
+    return [{**leg, "tickets": tickets[index]} for index, leg in enumerate(legs)], None
+
+
+def _resolve_legs(legs_data):
+    if not isinstance(legs_data, list) or not 2 <= len(legs_data) <= ITINERARY_MAX_LEGS:
+        return None, INVALID_ITINERARY
+    legs = []
+    for leg_data in legs_data:
+        if not isinstance(leg_data, dict) or not leg_data.get("train") or not leg_data.get("journey_date"):
+            return None, INVALID_ITINERARY
+        inventory, error = resolve_inventory(leg_data["train"], leg_data["journey_date"])
+        if error:
+            return None, error
+        legs.append(inventory)
+    if len({(leg["train"].pk, leg["journey_date"]) for leg in legs}) < len(legs):
+        return None, DUPLICATE_ITINERARY_LEG
+    return legs, None
+
+
+def _book_in_one_transaction(passengers_data, legs, order):
+    alias = shard_of(legs[0]["train"])
+    tickets = {}
+    try:
+        with on_shard(alias), transaction.atomic(using=alias):
+            profiles = BookingService._resolve_profiles(passengers_data)
+            for index in order:
+                tickets[index] = _book_leg(passengers_data, legs[index], index, profiles)
+    except LegFailed as failure:
+        return None, failure.error
+    return tickets, None
+
+
+def _book_leg(passengers_data, inventory, index, profiles):
+    berth_plan = BookingService._plan_group_berths(passengers_data, inventory) if len(passengers_data) > 1 else {}
+    tickets = []
+    for position, passenger_data in enumerate(passengers_data):
+        result = BookingService._process_single_booking(
+            passenger_data, inventory, berth_plan.get(position), profiles.get(position)
+        )
+        if result.get("error"):
+            raise LegFailed({**result, "leg": index})
+        tickets.append(result["ticket"])
+    return tickets
+
+
+def _book_with_holds(passengers_data, legs, order):
+    holds = {}
+    for index in order:
+        hold, errors = hold_seats(passengers_data, legs[index])
+        if errors:
+            _release_holds(list(holds.values()) + ([hold] if hold else []))
+            return None, {**errors[0], "leg": index}
+        holds[index] = hold
+
+    tickets = {}
+    for index in order:
+        hold = holds.pop(index)
+        booked, error = confirm_hold(hold.token)
+        if error:
+            for leg_tickets in tickets.values():
+                for ticket in leg_tickets:
+                    cancel_ticket(ticket.id)
+            _release_holds([hold, *holds.values()])
+            return None, {"error": error, "leg": index}
+        tickets[index] = booked
+    return tickets, None
+
+
+def _release_holds(holds):
+    for hold in holds:
+        release_hold(hold.token)
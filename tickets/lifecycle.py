@@ -0,0 +1,110 @@
+"""
+Hot/cold ticket lifecycle.
+
+Tickets of departed journeys and tickets canceled long ago are never touched by the booking
+path, so ``archive_tickets`` moves them into ``ArchivedTicket`` in small batches. Every batch
+is its own transaction and archived rows are inserted with conflicts ignored, so the job can
+be stopped at any point and simply run again to resume.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .constants import ACTION_CANCELED, CANCELED
+from .inventory import bump_inventory_version
+from .models import ArchivedTicket, Berth, Chart, QuotaCounter, Ticket, TicketHistory
+from .sharding import current_shard
+
+
+def archivable_tickets(now=None):
+    """Tickets whose journey has departed or that were canceled before the retention cutoff."""
+    now = now or timezone.now()
+    departed_before = now.date() - timedelta(days=settings.ARCHIVE_JOURNEYS_AFTER_DAYS)
+    canceled_before = now - timedelta(days=settings.ARCHIVE_CANCELED_AFTER_DAYS)
+    long_canceled = Ticket.objects.filter(
+        status=CANCELED, history__action=ACTION_CANCELED, history__timestamp__lt=canceled_before
+    ).values("id")
+    return Ticket.objects.filter(Q(journey_date__lt=departed_before) | Q(id__in=long_canceled))
+
+
+def archive_batch(batch_size, now=None):
+    """Move up to ``batch_size`` tickets into the archive and return how many were moved."""
+    with transaction.atomic(using=current_shard()):
+        tickets = list(
+            archivable_tickets(now)
+            .select_for_update(skip_locked=True, of=("self",))
+            .select_related("passenger", "train", "berth")
+            .order_by("id")[:batch_size]
+        )
+        if not tickets:
+            return 0
+
+        ticket_ids = [ticket.id for ticket in tickets]
+        history = {}
+        for ticket_id, action, timestamp in (
+            TicketHistory.objects.filter(ticket_id__in=ticket_ids)
+            .order_by("timestamp", "id")
+            .values_list("ticket_id", "action", "timestamp")
+        ):
+            history.setdefault(ticket_id, []).append({"action": action, "timestamp": timestamp.isoformat()})
+
+        ArchivedTicket.objects.bulk_create(
+            [_archived_copy(ticket, history.get(ticket.id, [])) for ticket in tickets], ignore_conflicts=True
+        )
+        TicketHistory.objects.filter(ticket_id__in=ticket_ids).delete()
+        Ticket.objects.filter(id__in=ticket_ids).delete()
+        bump_inventory_version()
+        return len(tickets)
+
+
+def _archived_copy(ticket, history):
+    passenger = ticket.passenger
+    berth = ticket.berth
+    return ArchivedTicket(
+        id=ticket.id,
+        ticket_type=ticket.ticket_type,
+        status=ticket.status,
+        passenger_id=passenger.id,
+        passenger_name=passenger.name,
+        passenger_age=passenger.age,
+        passenger_gender=passenger.gender,
+        train_number=ticket.train.number if ticket.train_id else None,
+        journey_date=ticket.journey_date,
+        quota=ticket.quota,
+        berth_number=berth.berth_number if berth else None,
+        berth_type=berth.berth_type if berth else ticket.berth_allocation,
+        history=history,
+        created_at=ticket.created_at,
+    )
+
+
+def purge_departed_inventory(batch_size, now=None):
+    """
+    Delete berths, quota counters and charts of departed runs once none of their tickets are left.
+
+    Archived tickets keep the berth number and type, so the inventory rows are no longer
+    needed. Returns the number of rows deleted in this batch.
+    """
+    departed_before = (now or timezone.now()).date() - timedelta(days=settings.ARCHIVE_JOURNEYS_AFTER_DAYS)
+    if Ticket.objects.filter(journey_date__lt=departed_before).exists():
+        return 0
+
+    deleted = 0
+    for model in (Berth, QuotaCounter, Chart):
+        ids = list(model.objects.filter(journey_date__lt=departed_before).values_list("id", flat=True)[:batch_size])
+        deleted += model.objects.filter(id__in=ids).delete()[0]
+    if deleted:
+        bump_inventory_version()
+    return deleted
+
+
+def find_ticket(ticket_id):
+    """Return the live ticket or its archived copy for a PNR, and which table it came from."""
+    ticket = Ticket.objects.select_related("passenger", "berth", "train").filter(id=ticket_id).first()
+    if ticket:
+        return ticket, False
+    return ArchivedTicket.objects.filter(id=ticket_id).first(), True
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.waiting_room import WaitingRoomService
+
+
+class Command(BaseCommand):
+    help = "Expires lapsed admissions and admits waiting-room tokens in order while the flash sale has capacity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Run a single admission round and exit")
+
+    def handle(self, *args, **options):
+        while True:
+            admitted, error = WaitingRoomService.admit()
+            if error:
+                raise CommandError(error)
+            if options["once"]:
+                self.stdout.write(self.style.SUCCESS(f"Admitted {admitted} waiting-room tokens"))
+                return
+            time.sleep(settings.FLASH_SALE_ADMIT_INTERVAL)
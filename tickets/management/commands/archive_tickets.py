@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tickets.lifecycle import archive_batch, purge_departed_inventory
+from tickets.sharding import on_shard, shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Moves departed-journey and long-canceled tickets into the archive in resumable batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Tickets moved per transaction")
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches; rerun to resume")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Seconds to pause between batches")
+
+    def handle(self, *args, **options):
+        archived = purged = 0
+        for alias in shard_aliases():
+            with on_shard(alias):
+                shard_archived, shard_purged = self.archive_shard(options)
+            archived += shard_archived
+            purged += shard_purged
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} tickets and purged {purged} inventory rows"))
+
+    def archive_shard(self, options):
+        """Archive and purge on the current shard; ``--max-batches`` applies to each shard."""
+        archived = batches = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            moved = archive_batch(options["batch_size"])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            time.sleep(options["sleep"])
+
+        purged = 0
+        while options["max_batches"] is None or batches < options["max_batches"]:
+            deleted = purge_departed_inventory(options["batch_size"])
+            if not deleted:
+                break
+            purged += deleted
+            batches += 1
+            time.sleep(options["sleep"])
+        return archived, purged
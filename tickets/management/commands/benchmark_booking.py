@@ -0,0 +1,106 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from tickets.constants import (
+    BOOKING_CONFLICT,
+    COMPARTMENT_LAYOUT,
+    CONCURRENCY_MODES,
+    GENDER_FEMALE,
+    GENDER_MALE,
+    SIDE_LOWER,
+)
+from tickets.models import Berth, Passenger, QuotaPolicy, Ticket, Train
+from tickets.services import book_ticket
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-tests concurrent bookings in the pessimistic and optimistic concurrency modes. "
+        "Books real tickets on a scratch train, so run it against a test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=CONCURRENCY_MODES, action="append", help="Mode to test; default both")
+        parser.add_argument("--threads", type=int, default=16, help="Concurrent booking clients")
+        parser.add_argument("--compartments", type=int, default=45, help="Compartments on the scratch train")
+        parser.add_argument("--keep", action="store_true", help="Keep the scratch trains and their tickets")
+
+    def handle(self, *args, **options):
+        for mode in options["mode"] or CONCURRENCY_MODES:
+            train = self.create_train(options["compartments"])
+            attempts = len(COMPARTMENT_LAYOUT) * options["compartments"]
+            try:
+                with override_settings(BOOKING_CONCURRENCY=mode):
+                    results = self.run_clients(train, options["threads"], attempts)
+            finally:
+                if not options["keep"]:
+                    self.delete_train(train)
+            self.report(mode, results)
+
+    def create_train(self, compartments):
+        train = Train.objects.create(number=f"B{uuid.uuid4().hex[:9]}", name="Booking benchmark")
+        layout = COMPARTMENT_LAYOUT * compartments
+        seated = len(layout) - layout.count(SIDE_LOWER)
+        QuotaPolicy.objects.create(train=train, confirmed_limit=seated, rac_limit=0, waiting_list_limit=0)
+        Berth.objects.bulk_create(
+            [
+                Berth(train=train, berth_number=number, berth_type=berth_type)
+                for number, berth_type in enumerate(layout, 1)
+            ]
+        )
+        return train
+
+    def run_clients(self, train, threads, attempts):
+        """Book until the train sells out; returns ``(elapsed, latencies, errors)`` over all clients."""
+        latencies, errors = [], []
+        remaining = iter(range(attempts))
+        lock = threading.Lock()
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        index = next(remaining, None)
+                    if index is None:
+                        return
+                    gender = GENDER_FEMALE if index % 2 else GENDER_MALE
+                    started = time.perf_counter()
+                    _, error = book_ticket(f"bench-{train.number}-{index}", 20 + index % 70, gender, train=train)
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                        if error:
+                            errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=client) for _ in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - started, latencies, errors
+
+    def report(self, mode, results):
+        elapsed, latencies, errors = results
+        booked = len(latencies) - len(errors)
+        conflicts = errors.count(BOOKING_CONFLICT)
+        # Twenty quantiles: index 9 is the median and index 18 the 95th percentile.
+        quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0.0] * 19
+        self.stdout.write(
+            f"{mode:<12} booked {booked:>6}  conflicts {conflicts:>5}  other errors {len(errors) - conflicts:>5}  "
+            f"{booked / elapsed if elapsed else 0:8.1f} bookings/s  "
+            f"p50 {quantiles[9] * 1000:7.1f} ms  p95 {quantiles[18] * 1000:7.1f} ms"
+        )
+
+    def delete_train(self, train):
+        passenger_ids = list(Ticket.objects.filter(train=train).values_list("passenger_id", flat=True))
+        Ticket.objects.filter(train=train).delete()
+        Passenger.objects.filter(id__in=passenger_ids, tickets__isnull=True).delete()
+        train.delete()
@@ -0,0 +1,73 @@
+import gzip
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from tickets.constants import BOOKED, COMPARTMENT_LAYOUT, CONFIRMED
+from tickets.renderers import FastJSONRenderer, orjson
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = "Benchmarks JSON encode time and bytes on the wire for large booked-ticket payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, default=10000, help="Number of tickets in the payload")
+        parser.add_argument("--rounds", type=int, default=5, help="Encode rounds per renderer; the best is reported")
+
+    def handle(self, *args, **options):
+        payload = self.build_payload(options["tickets"])
+        self.stdout.write(f"Payload: {options['tickets']} tickets (orjson installed: {orjson is not None})")
+
+        for renderer in (JSONRenderer(), FastJSONRenderer()):
+            seconds, body = self.time_render(renderer, payload, options["rounds"])
+            self.stdout.write(f"{type(renderer).__name__:<20} encode {seconds * 1000:8.1f} ms  {len(body):>10} bytes")
+
+        for name, compress in self.compressors():
+            start = time.perf_counter()
+            compressed = compress(body)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name:<20} compress {elapsed * 1000:6.1f} ms  {len(compressed):>10} bytes")
+
+    def build_payload(self, count):
+        """Build a payload shaped like ``TicketSerializer(many=True).data`` without touching the database."""
+        created_at = datetime(2025, 3, 7, 12, 24, tzinfo=timezone.utc).isoformat()
+        return [
+            {
+                "id": index,
+                "ticket_type": CONFIRMED,
+                "status": BOOKED,
+                "berth_allocation": COMPARTMENT_LAYOUT[index % len(COMPARTMENT_LAYOUT)],
+                "berth_details": {
+                    "id": index,
+                    "berth_number": index % 72 + 1,
+                    "berth_type": COMPARTMENT_LAYOUT[index % len(COMPARTMENT_LAYOUT)],
+                    "availability_status": BOOKED,
+                },
+                "created_at": created_at,
+                "passenger": {"id": index, "name": f"Passenger {index}", "age": 20 + index % 60, "is_child": False},
+            }
+            for index in range(count)
+        ]
+
+    def time_render(self, renderer, payload, rounds):
+        best, body = None, b""
+        for _ in range(rounds):
+            start = time.perf_counter()
+            body = renderer.render(payload, "application/json")
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
+
+    def compressors(self):
+        yield "gzip (level 6)", lambda body: gzip.compress(body, compresslevel=6)
+        if brotli:
+            quality = settings.COMPRESSION_BROTLI_QUALITY
+            yield f"brotli (quality {quality})", lambda body: brotli.compress(body, quality=quality)
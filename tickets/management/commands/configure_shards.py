@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from tickets.constants import SHARDS_REQUIRE_POSTGRESQL
+from tickets.sharding import shard_aliases, stride_id_sequences
+
+
+class Command(BaseCommand):
+    help = (
+        "Gives every shard database its own interleaved range of ids so tickets stay unique across shards. "
+        "Run it after migrating a newly added shard and before the shard takes bookings."
+    )
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if any(connections[alias].vendor != "postgresql" for alias in aliases):
+            raise CommandError(SHARDS_REQUIRE_POSTGRESQL)
+        stride_id_sequences()
+        self.stdout.write(self.style.SUCCESS(f"Interleaved ids over {len(aliases)} shards: {', '.join(aliases)}"))
@@ -0,0 +1,227 @@
+import json
+import os
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from tickets.constants import (
+    BOOKED,
+    CANCELED,
+    CHILD_AGE,
+    COMPARTMENT_LAYOUT,
+    CONFIRMED,
+    EXPLAIN_REQUIRES_POSTGRESQL,
+    GENDER_FEMALE,
+    GENDER_MALE,
+    NO_QUERY_PLAN_BASELINE,
+    NO_TRAIN_RUN_TO_EXPLAIN,
+    QUERY_PLANS_REGRESSED,
+    RAC,
+    SIDE_LOWER,
+    WAITING_LIST,
+)
+from tickets.models import Berth, Passenger, QuotaCounter, QuotaPolicy, Ticket, Train
+from tickets.query_plans import HOT_QUERIES, capture_statements, explain, regressions, statement_key, summarize
+from tickets.quotas import create_quota_buckets
+from tickets.services import _inventory
+from tickets.sharding import on_shard
+
+FIRST_NAMES = ["Aarav", "Priya", "Rahul", "Ananya", "Vikram", "Sneha", "Arjun", "Kavya", "Rohan", "Meera"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Reddy", "Singh", "Gupta", "Nair", "Das", "Khan", "Joshi"]
+WAITING_LIST_SEED = 20  # Waiting-list tickets per seeded train run
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the booking hot-path queries under EXPLAIN (ANALYZE, BUFFERS) on a seeded scratch dataset, which is "
+        "rolled back afterwards. Flags sequential scans and sorts, suggests indexes, and with --check fails when a "
+        "plan regressed from the stored baseline. PostgreSQL only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="Database (shard) to explain on")
+        parser.add_argument("--trains", type=int, default=20, help="Scratch trains to seed")
+        parser.add_argument("--dates", type=int, default=10, help="Journey dates seeded per train")
+        parser.add_argument("--compartments", type=int, default=45, help="Compartments per seeded train run")
+        parser.add_argument("--seed", type=int, default=1, help="Seed of the scratch data")
+        parser.add_argument(
+            "--no-seed", action="store_true", help="Explain on the busiest existing train run instead of scratch data"
+        )
+        parser.add_argument(
+            "--min-rows", type=int, default=1000, help="Flag sequential scans reading at least this many rows"
+        )
+        parser.add_argument(
+            "--baseline",
+            default=os.path.join(settings.BASE_DIR, "query_plan_baseline.json"),
+            help="Baseline plan summaries to compare with",
+        )
+        parser.add_argument("--update-baseline", action="store_true", help="Store these plans as the new baseline")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Fail when a plan regressed from the baseline, or a statement is missing from it or no longer runs",
+        )
+        parser.add_argument(
+            "--buffer-tolerance", type=float, default=2.0, help="Buffer growth over the baseline that counts as worse"
+        )
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        if connections[alias].vendor != "postgresql":
+            raise CommandError(EXPLAIN_REQUIRES_POSTGRESQL)
+        baseline = self.load_baseline(options)
+
+        # Service calls fan out over shards; keep them on the explained database and its open transaction.
+        with override_settings(SHARD_DATABASES=[alias]), on_shard(alias), transaction.atomic(using=alias):
+            run = self.busiest_run() if options["no_seed"] else self.seed(options)
+            with connections[alias].cursor() as cursor:
+                for model in (Passenger, Ticket, Berth, QuotaCounter):
+                    cursor.execute(f"ANALYZE {model._meta.db_table}")
+            summaries = self.explain_hot_queries(alias, run, options["min_rows"])
+            transaction.set_rollback(True, using=alias)
+
+        regressed = self.report(summaries, baseline, options["buffer_tolerance"], strict=options["check"])
+        if options["update_baseline"]:
+            stored = {
+                key: {field: summary[field] for field in ("query", "sql", "scans", "flags", "buffers")}
+                for key, summary in summaries.items()
+            }
+            with open(options["baseline"], "w", encoding="utf-8") as baseline_file:
+                json.dump(stored, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Stored {len(summaries)} plans in {options['baseline']}"))
+        if options["check"] and regressed:
+            raise CommandError(QUERY_PLANS_REGRESSED.format(regressed))
+
+    def load_baseline(self, options):
+        if not os.path.exists(options["baseline"]):
+            if options["check"]:
+                raise CommandError(NO_QUERY_PLAN_BASELINE.format(options["baseline"]))
+            return {}
+        with open(options["baseline"], encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)
+
+    def busiest_run(self):
+        run = (
+            Ticket.objects.filter(status=BOOKED, train__isnull=False)
+            .values("train", "journey_date")
+            .annotate(count=Count("id"))
+            .order_by("-count")
+            .first()
+        )
+        if run is None:
+            raise CommandError(NO_TRAIN_RUN_TO_EXPLAIN)
+        return _inventory(Train.objects.get(pk=run["train"]), run["journey_date"])
+
+    def seed(self, options):
+        """Seed scratch train runs and return the one in the middle to explain on."""
+        rng = random.Random(options["seed"])
+        layout = COMPARTMENT_LAYOUT * options["compartments"]
+        side_lowers = layout.count(SIDE_LOWER)
+        first_date = timezone.localdate() + timedelta(days=1)
+        runs = []
+        for _ in range(options["trains"]):
+            train = Train.objects.create(number=f"Q{uuid.uuid4().hex[:9]}", name="Query plan scratch train")
+            QuotaPolicy.objects.create(
+                train=train,
+                confirmed_limit=len(layout) - side_lowers,
+                rac_limit=side_lowers,
+                waiting_list_limit=WAITING_LIST_SEED,
+            )
+            runs += [_inventory(train, first_date + timedelta(days=day)) for day in range(options["dates"])]
+        for run in runs:
+            self.seed_run(run, layout, rng)
+        self.stdout.write(f"Seeded {len(runs)} train runs of {len(layout)} berths")
+        return runs[len(runs) // 2]
+
+    def seed_run(self, run, layout, rng):
+        """A run after a few cancellations: about one berth in ten free again, RAC and waiting-list queues waiting."""
+        berths = Berth.objects.bulk_create(
+            Berth(berth_number=number, berth_type=berth_type, **run) for number, berth_type in enumerate(layout, 1)
+        )
+        booked = [berth for berth in berths if berth.berth_type != SIDE_LOWER and rng.random() > 0.1]
+        shared = [berth for berth in berths if berth.berth_type == SIDE_LOWER and rng.random() > 0.2]
+        tickets = [(CONFIRMED, BOOKED, berth) for berth in booked]
+        tickets += [(RAC, BOOKED, berth) for berth in shared]
+        tickets += [(WAITING_LIST, BOOKED, None)] * WAITING_LIST_SEED
+        tickets += [(CONFIRMED, CANCELED, None)] * (len(layout) - len(shared) - len(booked))
+        rng.shuffle(tickets)
+
+        ages = [rng.randint(1, 85) for _ in tickets]
+        passengers = Passenger.objects.bulk_create(
+            Passenger(
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                age=age,
+                is_child=age < CHILD_AGE,
+                gender=rng.choice([GENDER_MALE, GENDER_FEMALE]),
+            )
+            for age in ages
+        )
+        Ticket.objects.bulk_create(
+            Ticket(
+                ticket_type=ticket_type,
+                status=status,
+                passenger=passenger,
+                berth=berth,
+                berth_allocation=berth.berth_type if berth else None,
+                **run,
+            )
+            for (ticket_type, status, berth), passenger in zip(tickets, passengers)
+        )
+        Berth.objects.filter(id__in=[berth.id for berth in booked + shared]).update(availability_status=BOOKED)
+        create_quota_buckets(run)
+
+    def explain_hot_queries(self, alias, run, min_rows):
+        summaries = {}
+        for hot_query in HOT_QUERIES:
+            for sql, params in capture_statements(alias, hot_query.run, *hot_query.arguments(run)):
+                summary = summarize(explain(alias, sql, params), min_rows)
+                summary.update(query=hot_query.name, sql=sql)
+                summaries[statement_key(hot_query.name, sql)] = summary
+        return summaries
+
+    def report(self, summaries, baseline, buffer_tolerance, strict=False):
+        """
+        Print every plan with its flags, suggestions and regressions; returns the number of regressed plans.
+
+        With ``strict``, a statement missing from the baseline and a baseline statement that no
+        longer runs count as regressions too, so a new or rewritten hot query cannot skip the check.
+        """
+        regressed = 0
+        for hot_query in HOT_QUERIES:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{hot_query.name}: {hot_query.description}"))
+            for key, summary in summaries.items():
+                if summary["query"] != hot_query.name:
+                    continue
+                self.stdout.write(
+                    f"  {key}  {summary['execution_ms']:.2f} ms  {summary['buffers']} buffers  "
+                    f"{'; '.join(summary['scans']) or 'no table scans'}"
+                )
+                for note in summary["notes"]:
+                    self.stdout.write(self.style.WARNING(f"    {note}"))
+                if summary["flags"]:
+                    self.stdout.write(f"    suggested: {hot_query.suggestion}")
+                if key not in baseline:
+                    regressed += strict
+                    note = "    no baseline for this statement"
+                    self.stdout.write(self.style.ERROR(note) if strict else note)
+                    continue
+                found = regressions(summary, baseline[key], buffer_tolerance)
+                regressed += bool(found)
+                for regression in found:
+                    self.stdout.write(self.style.ERROR(f"    regressed: {regression}"))
+
+        removed = sorted(set(baseline) - set(summaries))
+        if removed:
+            self.stdout.write(self.style.MIGRATE_HEADING("Baseline statements that no longer run:"))
+            for key in removed:
+                note = f"  {key}  {baseline[key]['query']}"
+                self.stdout.write(self.style.ERROR(note) if strict else note)
+            regressed += strict * len(removed)
+        return regressed
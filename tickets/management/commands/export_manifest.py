@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.constants import PARQUET_UNAVAILABLE
+from tickets.exports import EXPORT_FORMATS, export_manifest, parquet_available
+from tickets.services import resolve_inventory
+
+
+class Command(BaseCommand):
+    help = "Streams the passenger manifest of booked tickets to a file or stdout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv", help="Export format")
+        parser.add_argument("--output", help="File to write; defaults to stdout")
+        parser.add_argument("--train", help="Only export tickets on this train number")
+        parser.add_argument("--journey-date", help="Only export tickets for this journey date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        export_format = options["format"]
+        if export_format == "parquet" and not parquet_available():
+            raise CommandError(PARQUET_UNAVAILABLE)
+        inventory, error = resolve_inventory(options["train"], options["journey_date"])
+        if error:
+            raise CommandError(error)
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in export_manifest(export_format, inventory):
+                output.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+        finally:
+            if options["output"]:
+                output.close()
+
+        if options["output"]:
+            self.stderr.write(self.style.SUCCESS(f"Manifest written to {options['output']}"))
@@ -1,4 +1,5 @@
 import random
+from collections import Counter
 from datetime import datetime
 
 from django.core.management.base import BaseCommand
@@ -8,6 +9,9 @@ from faker import Faker
 from tickets.constants import (
     AVAILABILITY_STATUS,
     BERTH_TYPES,
+    BERTHS_PER_COMPARTMENT,
+    COMPARTMENT_LAYOUT,
+    COMPARTMENTS_PER_COACH,
     HISTORY_ACTIONS,
     TICKET_STATUS,
     TICKET_TYPES,
@@ -42,33 +46,24 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"An error occurred: {str(e)}"))
 
     def generate_berths(self):
-        """Generate 72 berths with realistic distribution."""
-        # Distribution of berths in a typical coach
-        berth_distribution = {
-            "lower": 18,  # 9 compartments × 2 lower berths
-            "middle": 18,  # 9 compartments × 2 middle berths
-            "upper": 18,  # 9 compartments × 2 upper berths
-            "side_lower": 9,  # 9 side lower berths
-            "side_upper": 9,  # 9 side upper berths
-        }
-
+        """Generate 72 berths laid out compartment by compartment."""
         coach_number = "S1"  # Sample coach number
-        berth_counter = 1
-
-        for berth_type, count in berth_distribution.items():
-            for _ in range(count):
-                Berth.objects.create(
-                    berth_type=berth_type,
-                    availability_status=AVAILABILITY_STATUS[0][0],  # 'available'
-                    berth_number=berth_counter,
-                )
-                berth_counter += 1
+        berths = [
+            Berth(
+                berth_type=berth_type,
+                availability_status=AVAILABILITY_STATUS[0][0],  # 'available'
+                berth_number=compartment * BERTHS_PER_COMPARTMENT + position + 1,
+            )
+            for compartment in range(COMPARTMENTS_PER_COACH)
+            for position, berth_type in enumerate(COMPARTMENT_LAYOUT)
+        ]
+        Berth.objects.bulk_create(berths)
 
-        total_berths = sum(berth_distribution.values())
+        distribution = Counter(berth.berth_type for berth in berths)
         self.stdout.write(
             self.style.SUCCESS(
-                f"Generated {total_berths} berths in coach {coach_number}\n"
-                f'Distribution: {", ".join(f"{k}: {v}" for k, v in berth_distribution.items())}'
+                f"Generated {len(berths)} berths in coach {coach_number}\n"
+                f'Distribution: {", ".join(f"{k}: {v}" for k, v in distribution.items())}'
             )
         )
 
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.sharding import move_train, shard_aliases, shard_for_train
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves a train with its berths, quotas, tickets, history, seat holds and charts to another shard database. "
+        "Bookings on the train are refused while it moves; pause archive_tickets, rollover_quotas and "
+        "release_expired_holds for the duration."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("train", help="Train number")
+        parser.add_argument("shard", choices=shard_aliases(), help="Shard database to move the train to")
+
+    def handle(self, *args, **options):
+        train, target = options["train"], options["shard"]
+        source = shard_for_train(train)
+        moved, error = move_train(train, target)
+        if error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(f"Moved train {train} with {moved} tickets from {source} to {target}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.charts import prepare_chart
+from tickets.services import resolve_inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Prepares the chart of a train run: closes it to bookings, releases unconfirmed seat holds and "
+        "confirms RAC and waiting-list tickets onto the berths left free, in one pass"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("train", help="Train number")
+        parser.add_argument("journey_date", help="Journey date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        inventory, error = resolve_inventory(options["train"], options["journey_date"])
+        if error:
+            raise CommandError(error)
+        chart, error = prepare_chart(inventory["train"], inventory["journey_date"])
+        if error:
+            raise CommandError(error)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Chart prepared for train {options['train']} on {chart.journey_date}: "
+                f"{chart.confirmed_from_rac} RAC tickets confirmed, {chart.moved_to_rac} waiting-list tickets "
+                f"moved to RAC, {chart.released_holds} seat holds released"
+            )
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tickets.profiling import PROFILE_HEADER, profile_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints a signed X-Profile header. Requests sent with it to the profiled views are profiled "
+        "while PROFILING_ENABLED is on, until the header expires."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl", type=int, default=15 * 60, help="Seconds the header stays valid")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{PROFILE_HEADER}: {profile_token(options['ttl'])}")
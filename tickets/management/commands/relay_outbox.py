@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from tickets.outbox import get_sinks, prune_delivered, relay_batch
+from tickets.sharding import on_shard, shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Publishes booking events from the outbox to the configured sinks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once every sink has caught up")
+        parser.add_argument("--prune", action="store_true", help="Delete events every sink has delivered")
+        parser.add_argument(
+            "--shard", choices=shard_aliases(), default=DEFAULT_DB_ALIAS, help="Shard database whose outbox to relay"
+        )
+
+    def handle(self, *args, **options):
+        with on_shard(options["shard"]):
+            self.relay(options)
+
+    def relay(self, options):
+        sinks = get_sinks()
+        while True:
+            delivered = 0
+            for name, sink in sinks.items():
+                try:
+                    delivered += relay_batch(name, sink)
+                except Exception as e:
+                    # The offset did not move; the batch is retried on the next poll.
+                    self.stderr.write(self.style.ERROR(f"Sink {name} failed: {e}"))
+
+            if delivered:
+                continue
+            if options["prune"]:
+                prune_delivered()
+            if options["once"]:
+                return
+            time.sleep(settings.OUTBOX_POLL_INTERVAL)
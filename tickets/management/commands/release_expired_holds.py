@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tickets.holds import release_expired_holds
+from tickets.sharding import on_shard, shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Puts the berths of lapsed seat holds back on sale"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Holds released per transaction")
+        parser.add_argument("--once", action="store_true", help="Exit once no lapsed hold is left")
+
+    def handle(self, *args, **options):
+        released = 0
+        while True:
+            count = 0
+            for alias in shard_aliases():
+                with on_shard(alias):
+                    count += release_expired_holds(options["batch_size"])
+            released += count
+            if count:
+                continue
+            if options["once"]:
+                self.stdout.write(self.style.SUCCESS(f"Released {released} seat holds"))
+                return
+            time.sleep(settings.SEAT_HOLD_SWEEP_INTERVAL)
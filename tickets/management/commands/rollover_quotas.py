@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tickets.quotas import rollover_quotas
+from tickets.sharding import on_shard, shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Rolls unused ladies and senior quota over into general for journeys within QUOTA_ROLLOVER_HOURS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Train runs to process per batch")
+
+    def handle(self, *args, **options):
+        seats = 0
+        for alias in shard_aliases():
+            with on_shard(alias):
+                seats += rollover_quotas(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rolled {seats} reserved seats over into general ({settings.QUOTA_ROLLOVER_HOURS}h cutoff)"
+            )
+        )
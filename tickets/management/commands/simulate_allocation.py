@@ -0,0 +1,68 @@
+import copy
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets.models import QuotaPolicy, Ticket
+from tickets.quotas import get_quota_policy
+from tickets.services import resolve_inventory
+from tickets.simulator import AllocationSimulator, recorded_trace, synthetic_trace, verify_against_service
+
+
+class Command(BaseCommand):
+    help = "Replays a synthetic or recorded booking trace through the in-memory allocation simulator"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=100000, help="Events in the synthetic trace")
+        parser.add_argument("--compartments", type=int, default=9, help="Compartments of the simulated coach")
+        parser.add_argument("--cancel-rate", type=float, default=0.2, help="Share of events that are cancellations")
+        parser.add_argument("--seed", type=int, help="Seed of the synthetic trace")
+        parser.add_argument("--confirmed-limit", type=int, help="Override the confirmed limit of the policy")
+        parser.add_argument("--rac-limit", type=int, help="Override the RAC limit of the policy")
+        parser.add_argument("--waiting-list-limit", type=int, help="Override the waiting-list limit of the policy")
+        parser.add_argument("--ladies-quota", type=int, help="Override the ladies quota of the policy")
+        parser.add_argument("--senior-quota", type=int, help="Override the senior citizen quota of the policy")
+        parser.add_argument("--train", help="Replay the recorded bookings of this train instead of a synthetic trace")
+        parser.add_argument("--journey-date", help="Journey date (YYYY-MM-DD) of the recorded train run")
+        parser.add_argument(
+            "--verify",
+            type=int,
+            default=0,
+            help="Also replay the first N events through the service layer and report differences",
+        )
+
+    def handle(self, *args, **options):
+        inventory = None
+        if options["train"]:
+            inventory, error = resolve_inventory(options["train"], options["journey_date"])
+            if error:
+                raise CommandError(error)
+
+        # Copy the cached policy so the overrides below never leak into it.
+        policy = copy.copy(get_quota_policy(**inventory)) if inventory else QuotaPolicy()
+        for field in ("confirmed_limit", "rac_limit", "waiting_list_limit", "ladies_quota", "senior_quota"):
+            if options[field] is not None:
+                setattr(policy, field, options[field])
+
+        if inventory:
+            trace = recorded_trace(Ticket.objects.filter(**inventory))
+        else:
+            trace = synthetic_trace(options["events"], options["cancel_rate"], seed=options["seed"])
+
+        simulator = AllocationSimulator(policy, options["compartments"])
+        started = time.perf_counter()
+        simulator.run(trace)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(json.dumps(simulator.report(), indent=2))
+        rate = len(trace) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Replayed {len(trace)} events in {elapsed:.2f}s ({rate:,.0f} events/s)"))
+
+        if options["verify"]:
+            mismatches = verify_against_service(trace[: options["verify"]], policy, options["compartments"])
+            for index, simulated, actual in mismatches:
+                self.stderr.write(f"Event {index} {trace[index]}: simulated {simulated}, service {actual}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} of {options['verify']} events differ from the service layer")
+            self.stdout.write(self.style.SUCCESS(f"First {options['verify']} events match the service layer"))
@@ -2,11 +2,13 @@ from django.apps import apps
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from .constants import CONFIRMED_BERTH_LIMIT, RAC_TICKET_LIMIT, WAITING_LIST_LIMIT
+
 
 class TicketManager(models.Manager):
-    CONFIRMED_BERTHS_LIMIT = 63
-    RAC_LIMIT = 18
-    WAITING_LIST_LIMIT = 10
+    CONFIRMED_BERTHS_LIMIT = CONFIRMED_BERTH_LIMIT
+    RAC_LIMIT = RAC_TICKET_LIMIT
+    WAITING_LIST_LIMIT = WAITING_LIST_LIMIT
 
     def check_confirmed_berths_limit(self):
         """
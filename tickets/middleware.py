@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Map each coding in an ``Accept-Encoding`` header to its q-value."""
+    encodings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses above ``COMPRESSION_MIN_SIZE`` bytes.
+
+    Picks brotli or gzip by the client's ``Accept-Encoding`` q-values, preferring brotli on a tie
+    when the ``brotli`` package is installed. Streaming responses (manifest exports and event
+    streams) are sent as-is, since compressing them would hold chunks back until a block fills.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = self.choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if not encoding:
+            return response
+
+        if encoding == "br":
+            compressed_content = brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed_content = compress_string(response.content)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response["Content-Length"] = str(len(compressed_content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    @staticmethod
+    def choose_encoding(header):
+        """The coding to compress with, or ``None`` when the client accepts neither brotli nor gzip."""
+        encodings = accepted_encodings(header)
+        fallback = encodings.get("*", 0.0)
+        quality = {"gzip": encodings.get("gzip", fallback)}
+        if brotli:
+            quality["br"] = encodings.get("br", fallback)
+        best = max(quality, key=lambda coding: (quality[coding], coding == "br"))
+        return best if quality[best] > 0 else None
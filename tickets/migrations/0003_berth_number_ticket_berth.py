@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def number_existing_berths(apps, schema_editor):
+    Berth = apps.get_model("tickets", "Berth")
+    for number, berth in enumerate(Berth.objects.order_by("id"), start=1):
+        berth.berth_number = number
+        berth.save(update_fields=["berth_number"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0002_auto_20250307_1224'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='berth',
+            name='berth_number',
+            field=models.PositiveIntegerField(default=0, help_text='Number of the berth within the coach'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(number_existing_berths, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='ticket',
+            name='berth',
+            field=models.ForeignKey(blank=True, help_text='Berth currently held by this ticket', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tickets', to='tickets.berth'),
+        ),
+        migrations.AlterField(
+            model_name='tickethistory',
+            name='action',
+            field=models.CharField(choices=[('booked', 'Booked'), ('canceled', 'Canceled'), ('moved_to_RAC', 'Moved to RAC'), ('promoted_from_RAC', 'Promoted from RAC'), ('promoted_from_waiting', 'Promoted from Waiting List')], help_text='Action performed on the ticket', max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_berth_number_ticket_berth'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='berth',
+            name='berth_type',
+            field=models.CharField(choices=[('lower', 'Lower'), ('middle', 'Middle'), ('side-lower', 'Side-Lower'), ('upper', 'Upper'), ('side-upper', 'Side-Upper')], help_text='Type of berth (Lower/Upper/Side)', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='berth_allocation',
+            field=models.CharField(blank=True, choices=[('lower', 'Lower'), ('middle', 'Middle'), ('side-lower', 'Side-Lower'), ('upper', 'Upper'), ('side-upper', 'Side-Upper')], help_text='Berth allocated to this ticket', max_length=20, null=True),
+        ),
+    ]
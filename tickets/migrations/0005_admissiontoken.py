@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:54
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_berth_type_middle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdmissionToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, help_text='Token handed to the client', unique=True)),
+                ('status', models.CharField(choices=[('waiting', 'Waiting'), ('admitted', 'Admitted'), ('used', 'Used'), ('expired', 'Expired')], default='waiting', help_text='Where the token is in the admission lifecycle', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When the client joined the waiting room')),
+                ('admitted_at', models.DateTimeField(blank=True, help_text='When the token was admitted to book', null=True)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='When an unused admission lapses', null=True)),
+            ],
+            options={
+                'verbose_name': 'Admission Token',
+                'verbose_name_plural': 'Admission Tokens',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='admissiontoken',
+            index=models.Index(fields=['status', 'id'], name='tickets_adm_status_c80837_idx'),
+        ),
+    ]
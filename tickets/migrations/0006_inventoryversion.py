@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:56
+
+from django.db import migrations, models
+
+
+def create_inventory_version(apps, schema_editor):
+    InventoryVersion = apps.get_model("tickets", "InventoryVersion")
+    InventoryVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_admissiontoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, help_text='Monotonically increasing inventory version')),
+            ],
+            options={
+                'verbose_name': 'Inventory Version',
+                'verbose_name_plural': 'Inventory Versions',
+            },
+        ),
+        migrations.RunPython(create_inventory_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_inventoryversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_class', models.CharField(choices=[('SL', 'Sleeper'), ('3A', 'AC 3 Tier'), ('2A', 'AC 2 Tier')], default='SL', help_text='Class the policy applies to', max_length=5)),
+                ('journey_date', models.DateField(blank=True, help_text='Journey date the policy applies to; blank applies to every date', null=True)),
+                ('confirmed_limit', models.PositiveIntegerField(default=63, help_text='Confirmed berths')),
+                ('rac_limit', models.PositiveIntegerField(default=18, help_text='RAC tickets')),
+                ('waiting_list_limit', models.PositiveIntegerField(default=10, help_text='Waiting list tickets')),
+                ('ladies_quota', models.PositiveIntegerField(default=6, help_text='Confirmed berths reserved for women')),
+                ('senior_quota', models.PositiveIntegerField(default=6, help_text='Confirmed lower berths reserved for senior citizens')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='When the policy last changed')),
+            ],
+            options={
+                'verbose_name': 'Quota Policy',
+                'verbose_name_plural': 'Quota Policies',
+                'ordering': ['train', 'travel_class', 'journey_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Train',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(help_text='Train number', max_length=10, unique=True)),
+                ('name', models.CharField(help_text='Name of the train', max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Train',
+                'verbose_name_plural': 'Trains',
+                'ordering': ['number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='berth',
+            name='journey_date',
+            field=models.DateField(blank=True, help_text='Date of the journey this berth is sold for', null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='journey_date',
+            field=models.DateField(blank=True, help_text='Date of the journey', null=True),
+        ),
+        migrations.AddField(
+            model_name='quotapolicy',
+            name='train',
+            field=models.ForeignKey(help_text='Train the policy applies to', on_delete=django.db.models.deletion.CASCADE, related_name='quota_policies', to='tickets.train'),
+        ),
+        migrations.AddField(
+            model_name='berth',
+            name='train',
+            field=models.ForeignKey(blank=True, help_text='Train the berth belongs to', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='berths', to='tickets.train'),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='train',
+            field=models.ForeignKey(blank=True, help_text='Train the ticket is booked on', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='tickets', to='tickets.train'),
+        ),
+        migrations.AddIndex(
+            model_name='berth',
+            index=models.Index(fields=['train', 'journey_date', 'availability_status'], name='tickets_ber_train_i_15c7a5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['train', 'journey_date', 'status', 'ticket_type'], name='tickets_tic_train_i_c6f019_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quotapolicy',
+            index=models.Index(fields=['updated_at'], name='tickets_quo_updated_58d2a3_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotapolicy',
+            constraint=models.UniqueConstraint(fields=('train', 'travel_class', 'journey_date'), name='unique_dated_quota_policy'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotapolicy',
+            constraint=models.UniqueConstraint(condition=models.Q(('journey_date__isnull', True)), fields=('train', 'travel_class'), name='unique_default_quota_policy'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0007_train_quotapolicy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='berth',
+            name='quota',
+            field=models.CharField(choices=[('general', 'General'), ('ladies', 'Ladies'), ('senior', 'Senior Citizen')], default='general', help_text='Quota bucket the berth is sold from', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='quota',
+            field=models.CharField(blank=True, choices=[('general', 'General'), ('ladies', 'Ladies'), ('senior', 'Senior Citizen')], help_text='Quota bucket a confirmed ticket was sold from', max_length=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='QuotaCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journey_date', models.DateField(blank=True, help_text='Date of the journey', null=True)),
+                ('quota', models.CharField(choices=[('general', 'General'), ('ladies', 'Ladies'), ('senior', 'Senior Citizen')], help_text='Quota bucket', max_length=10)),
+                ('stripe', models.PositiveSmallIntegerField(help_text='Stripe number within the bucket')),
+                ('capacity', models.PositiveIntegerField(default=0, help_text='Seats this stripe can sell')),
+                ('booked', models.PositiveIntegerField(default=0, help_text='Seats sold from this stripe')),
+                ('train', models.ForeignKey(blank=True, help_text='Train the counter belongs to', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='quota_counters', to='tickets.train')),
+            ],
+            options={
+                'verbose_name': 'Quota Counter',
+                'verbose_name_plural': 'Quota Counters',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='quotacounter',
+            index=models.Index(fields=['journey_date', 'quota'], name='tickets_quo_journey_47bb95_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotacounter',
+            constraint=models.UniqueConstraint(fields=('train', 'journey_date', 'quota', 'stripe'), name='unique_quota_counter'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotacounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('journey_date__isnull', True)), fields=('train', 'quota', 'stripe'), name='unique_undated_quota_counter'),
+        ),
+        migrations.AddConstraint(
+            model_name='quotacounter',
+            constraint=models.UniqueConstraint(condition=models.Q(('journey_date__isnull', True), ('train__isnull', True)), fields=('quota', 'stripe'), name='unique_unassigned_quota_counter'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0008_quota_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumerOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(help_text='Consumer name', max_length=100, unique=True)),
+                ('offset', models.BigIntegerField(default=0, help_text='Id of the last event processed')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='When the offset last moved')),
+            ],
+            options={
+                'verbose_name': 'Consumer Offset',
+                'verbose_name_plural': 'Consumer Offsets',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('ticket.booked', 'Ticket booked'), ('ticket.canceled', 'Ticket canceled'), ('ticket.promoted_to_confirmed', 'RAC ticket confirmed'), ('ticket.moved_to_rac', 'Waiting-list ticket moved to RAC')], help_text='What happened', max_length=40)),
+                ('ticket_id', models.BigIntegerField(help_text='Ticket the event is about')),
+                ('payload', models.JSONField(help_text='Ticket state after the change')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When the event was recorded')),
+            ],
+            options={
+                'verbose_name': 'Outbox Event',
+                'verbose_name_plural': 'Outbox Events',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0009_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='passenger',
+            options={'verbose_name': 'Passenger', 'verbose_name_plural': 'Passengers'},
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Client-supplied profile id, such as a loyalty number', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='passenger',
+            name='lookup_key',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 of the normalized external id, or of name, age and gender', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0010_passenger_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Original ticket id (PNR)', primary_key=True, serialize=False)),
+                ('ticket_type', models.CharField(choices=[('confirmed', 'Confirmed'), ('RAC', 'RAC'), ('waiting-list', 'Waiting List')], help_text='Ticket type when archived', max_length=20)),
+                ('status', models.CharField(choices=[('booked', 'Booked'), ('canceled', 'Cancelled')], help_text='Status when archived', max_length=20)),
+                ('passenger_id', models.BigIntegerField(help_text='Passenger the ticket belonged to')),
+                ('passenger_name', models.CharField(help_text='Full name of the passenger', max_length=255)),
+                ('passenger_age', models.IntegerField(help_text='Age of the passenger')),
+                ('passenger_gender', models.CharField(choices=[('M', 'Male'), ('F', 'Female')], help_text='Gender of the passenger', max_length=1)),
+                ('train_number', models.CharField(blank=True, help_text='Train number', max_length=10, null=True)),
+                ('journey_date', models.DateField(blank=True, help_text='Date of the journey', null=True)),
+                ('quota', models.CharField(blank=True, choices=[('general', 'General'), ('ladies', 'Ladies'), ('senior', 'Senior Citizen')], help_text='Quota bucket', max_length=10, null=True)),
+                ('berth_number', models.PositiveIntegerField(blank=True, help_text='Berth held when archived', null=True)),
+                ('berth_type', models.CharField(blank=True, choices=[('lower', 'Lower'), ('middle', 'Middle'), ('side-lower', 'Side-Lower'), ('upper', 'Upper'), ('side-upper', 'Side-Upper')], help_text='Berth type', max_length=20, null=True)),
+                ('history', models.JSONField(default=list, help_text='Actions performed on the ticket, oldest first')),
+                ('created_at', models.DateTimeField(help_text='When the ticket was booked')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, help_text='When the ticket was archived')),
+            ],
+            options={
+                'verbose_name': 'Archived Ticket',
+                'verbose_name_plural': 'Archived Tickets',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['journey_date'], name='tickets_tic_journey_0a5904_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0011_archivedticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='berth',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped on every change, for compare-and-swap updates'),
+        ),
+        migrations.AddField(
+            model_name='quotacounter',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped on every change, for compare-and-swap updates'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0012_berth_quotacounter_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, help_text='Token handed to the client', unique=True)),
+                ('journey_date', models.DateField(blank=True, help_text='Date of the journey', null=True)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('confirmed', 'Confirmed'), ('released', 'Released'), ('expired', 'Expired')], default='active', help_text='Where the hold is in its lifecycle', max_length=20)),
+                ('seats', models.JSONField(default=list, help_text='Held passengers with their quota and reserved berth')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When the seats were held')),
+                ('expires_at', models.DateTimeField(help_text='When the reserved berths go back on sale')),
+                ('train', models.ForeignKey(blank=True, help_text='Train the seats are held on', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='tickets.train')),
+            ],
+            options={
+                'verbose_name': 'Seat Hold',
+                'verbose_name_plural': 'Seat Holds',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='seathold',
+            index=models.Index(fields=['status', 'expires_at'], name='tickets_sea_status_b106a4_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:33
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """Trigram GIN indexes only exist on PostgreSQL; other databases, such as the SQLite test settings, skip them."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0013_seathold'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='tickets_tic_status_0e5646_idx',
+        ),
+        AddPostgresIndex(
+            model_name='passenger',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='passenger_name_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'created_at'], name='tickets_tic_status_8acd21_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0014_passenger_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('train_number', models.CharField(help_text='Number of the train', max_length=10, unique=True)),
+                ('shard', models.CharField(help_text="Database alias holding the train's inventory and tickets", max_length=100)),
+                ('moving', models.BooleanField(default=False, help_text='Set while move_train copies the train to another shard')),
+                ('updated_at', models.DateTimeField(auto_now=True, help_text='When the entry last changed')),
+            ],
+            options={
+                'verbose_name': 'Train Shard',
+                'verbose_name_plural': 'Train Shards',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 09:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0015_trainshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journey_date', models.DateField(help_text='Date of the journey')),
+                ('status', models.CharField(choices=[('preparing', 'Preparing'), ('prepared', 'Prepared')], default='preparing', help_text='Where the chart is in its preparation', max_length=20)),
+                ('confirmed_from_rac', models.PositiveIntegerField(default=0, help_text='RAC tickets confirmed onto free berths')),
+                ('moved_to_rac', models.PositiveIntegerField(default=0, help_text='Waiting-list tickets moved to RAC')),
+                ('released_holds', models.PositiveIntegerField(default=0, help_text='Unconfirmed seat holds released')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='When bookings on the run were closed')),
+                ('prepared_at', models.DateTimeField(blank=True, help_text='When the chart was prepared', null=True)),
+                ('train', models.ForeignKey(help_text='Train the chart belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='charts', to='tickets.train')),
+            ],
+            options={
+                'verbose_name': 'Chart',
+                'verbose_name_plural': 'Charts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chart',
+            constraint=models.UniqueConstraint(fields=('train', 'journey_date'), name='unique_chart_per_run'),
+        ),
+    ]
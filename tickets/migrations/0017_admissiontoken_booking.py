@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0016_chart'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='admissiontoken',
+            name='status',
+            field=models.CharField(choices=[('waiting', 'Waiting'), ('admitted', 'Admitted'), ('booking', 'Booking'), ('used', 'Used'), ('expired', 'Expired')], default='waiting', help_text='Where the token is in the admission lifecycle', max_length=20),
+        ),
+    ]
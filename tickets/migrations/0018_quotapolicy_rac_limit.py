@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0017_admissiontoken_booking'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quotapolicy',
+            name='rac_limit',
+            field=models.PositiveIntegerField(default=9, help_text='RAC tickets'),
+        ),
+    ]
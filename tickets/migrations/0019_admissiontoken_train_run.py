@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0018_quotapolicy_rac_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='admissiontoken',
+            name='journey_date',
+            field=models.DateField(blank=True, help_text='Journey date on sale when the token was issued', null=True),
+        ),
+        migrations.AddField(
+            model_name='admissiontoken',
+            name='train_number',
+            field=models.CharField(blank=True, help_text='Number of the train on sale when the token was issued', max_length=10, null=True),
+        ),
+    ]
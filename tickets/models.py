@@ -1,18 +1,147 @@
+import uuid
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Upper
 
 from .constants import (
+    ADMISSION_STATUS,
+    ADMISSION_WAITING,
     AVAILABILITY_STATUS,
     BERTH_TYPES,
+    CHART_PREPARING,
+    CHART_STATUS,
     CHILD_AGE,
+    CONFIRMED_BERTH_LIMIT,
+    EVENT_TYPES,
     GENDER_CHOICES,
     HISTORY_ACTIONS,
+    HOLD_ACTIVE,
+    HOLD_STATUS,
+    LADIES_QUOTA,
+    QUOTA_BUCKETS,
+    QUOTA_GENERAL,
+    RAC_TICKET_LIMIT,
+    SENIOR_QUOTA,
+    SLEEPER,
     TICKET_STATUS,
     TICKET_TYPES,
+    TRAVEL_CLASSES,
+    WAITING_LIST_LIMIT,
 )
 from .managers import TicketManager
 
 
+class Train(models.Model):
+    """Model representing a train service."""
+
+    number = models.CharField(max_length=10, unique=True, help_text="Train number")
+    name = models.CharField(max_length=255, help_text="Name of the train")
+
+    class Meta:
+        verbose_name = "Train"
+        verbose_name_plural = "Trains"
+        ordering = ["number"]
+
+    def __str__(self):
+        return f"{self.number} {self.name}"
+
+
+class QuotaPolicy(models.Model):
+    """Model holding the ticket quotas for a train and class, optionally for a single journey date."""
+
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="quota_policies", help_text="Train the policy applies to"
+    )
+    travel_class = models.CharField(
+        max_length=5, choices=TRAVEL_CLASSES, default=SLEEPER, help_text="Class the policy applies to"
+    )
+    journey_date = models.DateField(
+        null=True, blank=True, help_text="Journey date the policy applies to; blank applies to every date"
+    )
+    confirmed_limit = models.PositiveIntegerField(default=CONFIRMED_BERTH_LIMIT, help_text="Confirmed berths")
+    rac_limit = models.PositiveIntegerField(default=RAC_TICKET_LIMIT, help_text="RAC tickets")
+    waiting_list_limit = models.PositiveIntegerField(default=WAITING_LIST_LIMIT, help_text="Waiting list tickets")
+    ladies_quota = models.PositiveIntegerField(default=LADIES_QUOTA, help_text="Confirmed berths reserved for women")
+    senior_quota = models.PositiveIntegerField(
+        default=SENIOR_QUOTA, help_text="Confirmed lower berths reserved for senior citizens"
+    )
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the policy last changed")
+
+    class Meta:
+        verbose_name = "Quota Policy"
+        verbose_name_plural = "Quota Policies"
+        ordering = ["train", "travel_class", "journey_date"]
+        constraints = [
+            models.UniqueConstraint(fields=["train", "travel_class", "journey_date"], name="unique_dated_quota_policy"),
+            models.UniqueConstraint(
+                fields=["train", "travel_class"],
+                condition=models.Q(journey_date__isnull=True),
+                name="unique_default_quota_policy",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.train_id} {self.travel_class} {self.journey_date or 'default'}"
+
+    @property
+    def general_quota(self):
+        """Confirmed berths left for the general quota once reserved quotas are set aside."""
+        return max(self.confirmed_limit - self.ladies_quota - self.senior_quota, 0)
+
+
+class QuotaCounter(models.Model):
+    """
+    One stripe of the booked-seat counter of a quota bucket on a train run.
+
+    Each bucket's capacity is split across several stripes, and a booking takes a seat from
+    any stripe with room left. Concurrent bookings therefore update different rows instead
+    of queueing on one counter. Totals are the sum over the stripes.
+    """
+
+    train = models.ForeignKey(
+        Train,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="quota_counters",
+        help_text="Train the counter belongs to",
+    )
+    journey_date = models.DateField(null=True, blank=True, help_text="Date of the journey")
+    quota = models.CharField(max_length=10, choices=QUOTA_BUCKETS, help_text="Quota bucket")
+    stripe = models.PositiveSmallIntegerField(help_text="Stripe number within the bucket")
+    capacity = models.PositiveIntegerField(default=0, help_text="Seats this stripe can sell")
+    booked = models.PositiveIntegerField(default=0, help_text="Seats sold from this stripe")
+    version = models.PositiveIntegerField(default=0, help_text="Bumped on every change, for compare-and-swap updates")
+
+    class Meta:
+        verbose_name = "Quota Counter"
+        verbose_name_plural = "Quota Counters"
+        constraints = [
+            models.UniqueConstraint(fields=["train", "journey_date", "quota", "stripe"], name="unique_quota_counter"),
+            models.UniqueConstraint(
+                fields=["train", "quota", "stripe"],
+                condition=models.Q(journey_date__isnull=True),
+                name="unique_undated_quota_counter",
+            ),
+            models.UniqueConstraint(
+                fields=["quota", "stripe"],
+                condition=models.Q(train__isnull=True, journey_date__isnull=True),
+                name="unique_unassigned_quota_counter",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["journey_date", "quota"]),
+        ]
+
+    def __str__(self):
+        return f"{self.train_id} {self.journey_date} {self.quota}#{self.stripe}: {self.booked}/{self.capacity}"
+
+
 class Passenger(models.Model):
     """Model representing a passenger in the ticket booking system."""
 
@@ -24,11 +153,25 @@ class Passenger(models.Model):
         choices=GENDER_CHOICES,
         help_text="Gender of the passenger",
     )
+    external_id = models.CharField(
+        max_length=64, null=True, blank=True, help_text="Client-supplied profile id, such as a loyalty number"
+    )
+    lookup_key = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="SHA-256 of the normalized external id, or of name, age and gender",
+    )
 
     class Meta:
         verbose_name = "Passenger"
         verbose_name_plural = "Passengers"
-        ordering = ["name"]
+        indexes = [
+            # Trigram index on the expression icontains compares, so name search can match any part of a name.
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="passenger_name_trgm_idx"),
+        ]
 
     def __str__(self):
         return f"{self.name}, Age: {self.age}"
@@ -54,9 +197,33 @@ class Ticket(models.Model):
     passenger = models.ForeignKey(
         Passenger, on_delete=models.CASCADE, related_name="tickets", help_text="Passenger this ticket belongs to"
     )
+    train = models.ForeignKey(
+        Train,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="tickets",
+        help_text="Train the ticket is booked on",
+    )
+    journey_date = models.DateField(null=True, blank=True, help_text="Date of the journey")
+    quota = models.CharField(
+        max_length=10,
+        choices=QUOTA_BUCKETS,
+        null=True,
+        blank=True,
+        help_text="Quota bucket a confirmed ticket was sold from",
+    )
     berth_allocation = models.CharField(
         max_length=20, choices=BERTH_TYPES, null=True, blank=True, help_text="Berth allocated to this ticket"
     )
+    berth = models.ForeignKey(
+        "Berth",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="tickets",
+        help_text="Berth currently held by this ticket",
+    )
     created_at = models.DateTimeField(auto_now_add=True, help_text="Timestamp when ticket was created")
 
     objects = TicketManager()
@@ -67,7 +234,9 @@ class Ticket(models.Model):
         ordering = ["-created_at"]
         indexes = [
             models.Index(fields=["ticket_type", "status"]),
-            models.Index(fields=["status"]),
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["train", "journey_date", "status", "ticket_type"]),
+            models.Index(fields=["journey_date"]),
         ]
 
     def __str__(self):
@@ -77,13 +246,27 @@ class Ticket(models.Model):
 class Berth(models.Model):
     """Model representing a berth in the train."""
 
+    train = models.ForeignKey(
+        Train,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="berths",
+        help_text="Train the berth belongs to",
+    )
+    journey_date = models.DateField(null=True, blank=True, help_text="Date of the journey this berth is sold for")
+    berth_number = models.PositiveIntegerField(help_text="Number of the berth within the coach")
     berth_type = models.CharField(max_length=20, choices=BERTH_TYPES, help_text="Type of berth (Lower/Upper/Side)")
+    quota = models.CharField(
+        max_length=10, choices=QUOTA_BUCKETS, default=QUOTA_GENERAL, help_text="Quota bucket the berth is sold from"
+    )
     availability_status = models.CharField(
         max_length=20,
         choices=AVAILABILITY_STATUS,
         default=AVAILABILITY_STATUS[0][0],  # 'available'
         help_text="Current availability status of the berth",
     )
+    version = models.PositiveIntegerField(default=0, help_text="Bumped on every change, for compare-and-swap updates")
 
     class Meta:
         verbose_name = "Berth"
@@ -91,10 +274,11 @@ class Berth(models.Model):
         ordering = ["berth_type"]
         indexes = [
             models.Index(fields=["availability_status"]),
+            models.Index(fields=["train", "journey_date", "availability_status"]),
         ]
 
     def __str__(self):
-        return f"{self.berth_type} - {self.availability_status}"
+        return f"{self.berth_number} ({self.berth_type}) - {self.availability_status}"
 
 
 class TicketHistory(models.Model):
@@ -116,3 +300,201 @@ class TicketHistory(models.Model):
 
     def __str__(self):
         return f"Ticket ID: {self.ticket.id} - Action: {self.action} - {self.timestamp}"
+
+
+class ArchivedTicket(models.Model):
+    """
+    Cold copy of a ticket moved out of the hot ``Ticket`` table by ``archive_tickets``.
+
+    The primary key is the original ticket id (the PNR), so archived tickets are still found
+    with a primary-key lookup. Passenger, train and berth details are copied in, along with the
+    ticket's history.
+    """
+
+    id = models.BigIntegerField(primary_key=True, help_text="Original ticket id (PNR)")
+    ticket_type = models.CharField(max_length=20, choices=TICKET_TYPES, help_text="Ticket type when archived")
+    status = models.CharField(max_length=20, choices=TICKET_STATUS, help_text="Status when archived")
+    passenger_id = models.BigIntegerField(help_text="Passenger the ticket belonged to")
+    passenger_name = models.CharField(max_length=255, help_text="Full name of the passenger")
+    passenger_age = models.IntegerField(help_text="Age of the passenger")
+    passenger_gender = models.CharField(max_length=1, choices=GENDER_CHOICES, help_text="Gender of the passenger")
+    train_number = models.CharField(max_length=10, null=True, blank=True, help_text="Train number")
+    journey_date = models.DateField(null=True, blank=True, help_text="Date of the journey")
+    quota = models.CharField(max_length=10, choices=QUOTA_BUCKETS, null=True, blank=True, help_text="Quota bucket")
+    berth_number = models.PositiveIntegerField(null=True, blank=True, help_text="Berth held when archived")
+    berth_type = models.CharField(max_length=20, choices=BERTH_TYPES, null=True, blank=True, help_text="Berth type")
+    history = models.JSONField(default=list, help_text="Actions performed on the ticket, oldest first")
+    created_at = models.DateTimeField(help_text="When the ticket was booked")
+    archived_at = models.DateTimeField(auto_now_add=True, help_text="When the ticket was archived")
+
+    class Meta:
+        verbose_name = "Archived Ticket"
+        verbose_name_plural = "Archived Tickets"
+
+    def __str__(self):
+        return f"Archived ticket {self.id} for {self.passenger_name} - {self.ticket_type} - {self.status}"
+
+
+class AdmissionToken(models.Model):
+    """Model representing a place in the flash-sale waiting room."""
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, help_text="Token handed to the client")
+    status = models.CharField(
+        max_length=20,
+        choices=ADMISSION_STATUS,
+        default=ADMISSION_WAITING,
+        help_text="Where the token is in the admission lifecycle",
+    )
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the client joined the waiting room")
+    admitted_at = models.DateTimeField(null=True, blank=True, help_text="When the token was admitted to book")
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="When an unused admission lapses")
+    train_number = models.CharField(
+        max_length=10, null=True, blank=True, help_text="Number of the train on sale when the token was issued"
+    )
+    journey_date = models.DateField(null=True, blank=True, help_text="Journey date on sale when the token was issued")
+
+    class Meta:
+        verbose_name = "Admission Token"
+        verbose_name_plural = "Admission Tokens"
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.token} - {self.status}"
+
+
+class SeatHold(models.Model):
+    """Model representing confirmed berths reserved for a client until it confirms or the hold expires."""
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, help_text="Token handed to the client")
+    train = models.ForeignKey(
+        Train,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="seat_holds",
+        help_text="Train the seats are held on",
+    )
+    journey_date = models.DateField(null=True, blank=True, help_text="Date of the journey")
+    status = models.CharField(
+        max_length=20, choices=HOLD_STATUS, default=HOLD_ACTIVE, help_text="Where the hold is in its lifecycle"
+    )
+    seats = models.JSONField(default=list, help_text="Held passengers with their quota and reserved berth")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the seats were held")
+    expires_at = models.DateTimeField(help_text="When the reserved berths go back on sale")
+
+    class Meta:
+        verbose_name = "Seat Hold"
+        verbose_name_plural = "Seat Holds"
+        indexes = [
+            models.Index(fields=["status", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.token} - {self.status}"
+
+
+class Chart(models.Model):
+    """
+    Final chart of a train run.
+
+    The row is created before the chart is prepared and closes the run to bookings from then on.
+    ``prepare_chart`` fills in the counts and ``prepared_at`` once the RAC and waiting-list
+    queues have been resolved against every free berth.
+    """
+
+    train = models.ForeignKey(
+        Train, on_delete=models.CASCADE, related_name="charts", help_text="Train the chart belongs to"
+    )
+    journey_date = models.DateField(help_text="Date of the journey")
+    status = models.CharField(
+        max_length=20, choices=CHART_STATUS, default=CHART_PREPARING, help_text="Where the chart is in its preparation"
+    )
+    confirmed_from_rac = models.PositiveIntegerField(default=0, help_text="RAC tickets confirmed onto free berths")
+    moved_to_rac = models.PositiveIntegerField(default=0, help_text="Waiting-list tickets moved to RAC")
+    released_holds = models.PositiveIntegerField(default=0, help_text="Unconfirmed seat holds released")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When bookings on the run were closed")
+    prepared_at = models.DateTimeField(null=True, blank=True, help_text="When the chart was prepared")
+
+    class Meta:
+        verbose_name = "Chart"
+        verbose_name_plural = "Charts"
+        constraints = [
+            models.UniqueConstraint(fields=["train", "journey_date"], name="unique_chart_per_run"),
+        ]
+
+    def __str__(self):
+        return f"{self.train_id} {self.journey_date} - {self.status}"
+
+
+class InventoryVersion(models.Model):
+    """Single-row counter bumped whenever booking, cancellation or promotion changes the inventory."""
+
+    version = models.PositiveBigIntegerField(default=0, help_text="Monotonically increasing inventory version")
+
+    class Meta:
+        verbose_name = "Inventory Version"
+        verbose_name_plural = "Inventory Versions"
+
+    def __str__(self):
+        return f"Inventory version {self.version}"
+
+
+class TrainShard(models.Model):
+    """
+    Directory entry placing a train on a shard database; kept in the ``default`` database.
+
+    Trains without an entry live on ``default``.
+    """
+
+    train_number = models.CharField(max_length=10, unique=True, help_text="Number of the train")
+    shard = models.CharField(max_length=100, help_text="Database alias holding the train's inventory and tickets")
+    moving = models.BooleanField(default=False, help_text="Set while move_train copies the train to another shard")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the entry last changed")
+
+    class Meta:
+        verbose_name = "Train Shard"
+        verbose_name_plural = "Train Shards"
+
+    def __str__(self):
+        return f"{self.train_number} on {self.shard}{' (moving)' if self.moving else ''}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Booking lifecycle event, written in the same transaction as the change it describes.
+
+    The id is the event's offset: ``relay_outbox`` publishes events in id order and each sink
+    remembers the last offset it has delivered in ``ConsumerOffset``.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=40, choices=EVENT_TYPES, help_text="What happened")
+    ticket_id = models.BigIntegerField(help_text="Ticket the event is about")
+    payload = models.JSONField(help_text="Ticket state after the change")
+    created_at = models.DateTimeField(auto_now_add=True, help_text="When the event was recorded")
+
+    class Meta:
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"#{self.id} {self.event_type} ticket {self.ticket_id}"
+
+
+class ConsumerOffset(models.Model):
+    """Last outbox offset a consumer has processed, so it can resume from there."""
+
+    consumer = models.CharField(max_length=100, unique=True, help_text="Consumer name")
+    offset = models.BigIntegerField(default=0, help_text="Id of the last event processed")
+    updated_at = models.DateTimeField(auto_now=True, help_text="When the offset last moved")
+
+    class Meta:
+        verbose_name = "Consumer Offset"
+        verbose_name_plural = "Consumer Offsets"
+
+    def __str__(self):
+        return f"{self.consumer} @ {self.offset}"
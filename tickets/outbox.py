@@ -0,0 +1,200 @@
+"""
+Transactional outbox for booking lifecycle events.
+
+``record_event`` writes an ``OutboxEvent`` inside the transaction that books, cancels or
+promotes a ticket, so an event exists exactly when its change was committed. ``relay_batch``
+publishes events to a sink in id order and moves the sink's ``ConsumerOffset`` only after the
+sink accepted the batch, giving at-least-once delivery; consumers deduplicate on ``offset``.
+Every shard keeps its own outbox and offsets, relayed by its own ``relay_outbox --shard``.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ConsumerOffset, OutboxEvent
+from .sharding import atomic
+
+SEGMENT_SUFFIX = ".ndjson"
+
+
+def record_event(event_type, ticket):
+    """Add an event describing ``ticket`` to the outbox of the current transaction."""
+    event = _event(event_type, ticket)
+    event.save()
+    return event
+
+
+def record_events(events):
+    """Add an event for each ``(event_type, ticket)`` in ``events`` with one insert, in order."""
+    return OutboxEvent.objects.bulk_create([_event(event_type, ticket) for event_type, ticket in events])
+
+
+def _event(event_type, ticket):
+    berth = ticket.berth
+    return OutboxEvent(
+        event_type=event_type,
+        ticket_id=ticket.id,
+        payload={
+            "ticket_id": ticket.id,
+            "passenger_id": ticket.passenger_id,
+            "ticket_type": ticket.ticket_type,
+            "status": ticket.status,
+            "quota": ticket.quota,
+            "train": ticket.train.number if ticket.train_id else None,
+            "journey_date": ticket.journey_date.isoformat() if ticket.journey_date else None,
+            "berth_number": berth.berth_number if berth else None,
+            "berth_type": berth.berth_type if berth else None,
+        },
+    )
+
+
+def serialize_event(event):
+    return {
+        "offset": event.id,
+        "type": event.event_type,
+        "ticket_id": event.ticket_id,
+        "created_at": event.created_at,
+        "payload": event.payload,
+    }
+
+
+def get_sinks():
+    """Instantiate the sinks configured in ``OUTBOX_SINKS``, keyed by name."""
+    return {
+        name: import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+        for name, config in settings.OUTBOX_SINKS.items()
+    }
+
+
+@atomic
+def relay_batch(name, sink):
+    """
+    Publish the next batch of events to ``sink`` and return how many were delivered.
+
+    The consumer row is locked with SKIP LOCKED, so several relay processes can run without
+    delivering the same batch twice. Ids come from a sequence and can commit out of order: the
+    batch stops at a gap until the gap is ``OUTBOX_GAP_GRACE_SECONDS`` old, after which the
+    missing id is taken to belong to a rolled-back transaction.
+    """
+    ConsumerOffset.objects.get_or_create(consumer=name)
+    consumer = ConsumerOffset.objects.select_for_update(skip_locked=True).filter(consumer=name).first()
+    if consumer is None:
+        return 0
+
+    settled_before = timezone.now() - timedelta(seconds=settings.OUTBOX_GAP_GRACE_SECONDS)
+    batch = []
+    expected = consumer.offset + 1
+    for event in OutboxEvent.objects.filter(id__gt=consumer.offset).order_by("id")[: settings.OUTBOX_BATCH_SIZE]:
+        if event.id != expected and event.created_at > settled_before:
+            break
+        batch.append(serialize_event(event))
+        expected = event.id + 1
+
+    if not batch:
+        return 0
+
+    sink.publish(batch)
+    consumer.offset = batch[-1]["offset"]
+    consumer.save(update_fields=["offset", "updated_at"])
+    return len(batch)
+
+
+def prune_delivered():
+    """Delete events every sink has delivered; returns the number deleted."""
+    offsets = list(ConsumerOffset.objects.filter(consumer__in=settings.OUTBOX_SINKS).values_list("offset", flat=True))
+    if len(offsets) < len(settings.OUTBOX_SINKS):
+        return 0
+    deleted, _ = OutboxEvent.objects.filter(id__lte=min(offsets)).delete()
+    return deleted
+
+
+class SegmentFileSink:
+    """
+    Append-only log of NDJSON segment files, named after the first offset they hold.
+
+    A batch is appended and fsynced before the relay moves its offset. Events at or below the
+    last offset already on disk are skipped, so a batch replayed after a crash is not written
+    twice.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def publish(self, events):
+        events = [event for event in events if event["offset"] > self._last_offset()]
+        if not events:
+            return
+
+        path = self._current_segment()
+        if path is None or os.path.getsize(path) >= self.max_bytes:
+            path = os.path.join(self.directory, f"{events[0]['offset']:020d}{SEGMENT_SUFFIX}")
+        with open(path, "a", encoding="utf-8") as segment:
+            segment.writelines(json.dumps(event, cls=DjangoJSONEncoder) + "\n" for event in events)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def _current_segment(self):
+        segments = self._segments()
+        return os.path.join(self.directory, segments[-1]) if segments else None
+
+    def _last_offset(self):
+        path = self._current_segment()
+        if path is None or not os.path.getsize(path):
+            return 0
+        with open(path, "rb") as segment:
+            segment.seek(max(os.path.getsize(path) - 64 * 1024, 0))
+            last_line = segment.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+        return json.loads(last_line)["offset"]
+
+
+def read_segments(directory, after=0):
+    """
+    Yield events with an offset above ``after`` from a segment directory.
+
+    Segment names are their first offsets, so resuming skips straight to the segment holding
+    ``after + 1`` instead of scanning the log from the start.
+    """
+    segments = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+    first_offsets = [int(name[: -len(SEGMENT_SUFFIX)]) for name in segments]
+    start = max((index for index, first in enumerate(first_offsets) if first <= after + 1), default=0)
+    for name in segments[start:]:
+        with open(os.path.join(directory, name), encoding="utf-8") as segment:
+            for line in segment:
+                event = json.loads(line)
+                if event["offset"] > after:
+                    yield event
+
+
+class WebhookSink:
+    """POST each batch as JSON to a URL, signed with HMAC-SHA256 when a secret is configured."""
+
+    def __init__(self, url, secret=None, timeout=5):
+        self.url = url
+        self.secret = secret
+        self.timeout = timeout
+
+    def publish(self, events):
+        body = json.dumps({"events": events}, cls=DjangoJSONEncoder).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            signature = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Outbox-Signature"] = f"sha256={signature}"
+
+        request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        # Non-2xx responses raise, leaving the offset where it was so the batch is retried.
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
@@ -0,0 +1,85 @@
+"""
+Passenger profile reuse.
+
+Bookings look passengers up by a hashed, normalized key instead of inserting a new row per
+ticket. The key is built from an external id when the client sends one (for example a loyalty
+number) and from name, age and gender otherwise. On PostgreSQL a whole group is resolved with
+one ``INSERT ... ON CONFLICT ... RETURNING`` statement.
+"""
+
+import hashlib
+
+from django.db import connections
+
+from .constants import CHILD_AGE
+from .models import Passenger
+from .sharding import atomic, current_shard
+
+
+def passenger_lookup_key(name, age, gender, external_id=None):
+    """Return the SHA-256 hex digest identifying a passenger profile."""
+    if external_id:
+        normalized = f"ext:{str(external_id).strip().casefold()}"
+    else:
+        normalized = f"pax:{' '.join(name.split()).casefold()}|{int(age)}|{(gender or '').upper()}"
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def upsert_passengers(passengers_data):
+    """
+    Look up or create the profile of every passenger in ``passengers_data``.
+
+    Each entry is a dict with ``name``, ``age``, ``gender`` and optionally ``external_id``.
+    Returns the ``Passenger`` objects in the same order; passengers sharing a key share a
+    profile. Profiles found by external id get their details refreshed.
+    """
+    rows = {}
+    keys = []
+    for data in passengers_data:
+        key = passenger_lookup_key(data["name"], data["age"], data.get("gender"), data.get("external_id"))
+        keys.append(key)
+        rows[key] = (
+            data["name"],
+            data["age"],
+            data["age"] < CHILD_AGE,
+            data.get("gender"),
+            data.get("external_id"),
+            key,
+        )
+
+    if connections[current_shard()].vendor == "postgresql":
+        passengers = _upsert_returning(list(rows.values()))
+    else:
+        passengers = _get_or_create_each(list(rows.values()))
+    return [passengers[key] for key in keys]
+
+
+def _upsert_returning(rows):
+    table = Passenger._meta.db_table
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+    sql = (
+        f"INSERT INTO {table} (name, age, is_child, gender, external_id, lookup_key) VALUES {placeholders} "
+        "ON CONFLICT (lookup_key) DO UPDATE SET name = EXCLUDED.name, age = EXCLUDED.age, "
+        "is_child = EXCLUDED.is_child, gender = EXCLUDED.gender "
+        "RETURNING id, name, age, is_child, gender, external_id, lookup_key"
+    )
+    with connections[current_shard()].cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+        returned = cursor.fetchall()
+    return {
+        row[6]: Passenger(
+            id=row[0], name=row[1], age=row[2], is_child=row[3], gender=row[4], external_id=row[5], lookup_key=row[6]
+        )
+        for row in returned
+    }
+
+
+@atomic
+def _get_or_create_each(rows):
+    passengers = {}
+    for name, age, is_child, gender, external_id, key in rows:
+        passengers[key], _ = Passenger.objects.update_or_create(
+            lookup_key=key,
+            defaults={"name": name, "age": age, "is_child": is_child, "gender": gender, "external_id": external_id},
+        )
+    return passengers
@@ -0,0 +1,256 @@
+"""
+On-demand profiling of slow requests.
+
+``ProfilingMiddleware`` profiles a request to one of ``PROFILING_VIEWS`` when it carries an
+``X-Profile`` header signed by ``manage.py profile_token``, or when it is picked at
+``PROFILING_SAMPLE_RATE``. cProfile and a stack sampler run around the view and the rendering of
+its response. Each profiled request leaves three files in ``PROFILING_DIR``, which keeps the
+newest ``PROFILING_MAX_PROFILES``: a ``.pstats`` file, a ``.speedscope.json`` flame graph and a
+``.summary.json`` with the request id, query count and SQL time. With ``PROFILING_ENABLED`` off
+Django drops the middleware at startup, so requests pay nothing for it.
+"""
+
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+SIGNING_SALT = "tickets.profiling"
+PROFILE_SUFFIXES = (".summary.json", ".pstats", ".speedscope.json")
+
+re_request_id = re.compile(r"^[\w.-]{1,64}$")
+
+
+def profile_token(ttl):
+    """Value for the ``X-Profile`` header that gets requests profiled for the next ``ttl`` seconds."""
+    return signing.dumps({"until": int(time.time()) + ttl}, salt=SIGNING_SALT)
+
+
+def _valid_token(value):
+    try:
+        until = signing.loads(value, salt=SIGNING_SALT)["until"]
+    except (signing.BadSignature, KeyError, TypeError):
+        return False
+    return until >= time.time()
+
+
+class ProfilingMiddleware:
+    """Profile sampled or explicitly requested calls to the views in ``PROFILING_VIEWS``."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.views = set(settings.PROFILING_VIEWS)
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            profile = getattr(request, "_profile", None)
+            if profile is not None:
+                profile.stop()
+        if profile is not None:
+            profile.save(request, response)
+            response[PROFILE_ID_HEADER] = profile.name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        view_name = view_class.__name__ if view_class else view_func.__name__
+        if view_name not in self.views:
+            return None
+
+        header = request.headers.get(PROFILE_HEADER)
+        if header and _valid_token(header):
+            reason = "requested"
+        elif random.random() < settings.PROFILING_SAMPLE_RATE:
+            reason = "sampled"
+        else:
+            return None
+
+        request_id = request.headers.get("X-Request-ID", "")
+        request._profile = RequestProfile(request_id if re_request_id.match(request_id) else uuid.uuid4().hex)
+        request._profile.start(view_name, reason)
+        return None
+
+
+class RequestProfile:
+    """cProfile, stack samples and query totals of one request, written out under a shared file name."""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started_at = timezone.now()
+        self.name = f"{self.started_at:%Y%m%dT%H%M%S%f}-{request_id}"
+        self.queries = QueryStats()
+        self.sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+        self.profiler = cProfile.Profile()
+        self._hooks = ExitStack()
+
+    def start(self, view_name, reason):
+        self.view_name = view_name
+        self.reason = reason
+        for connection in connections.all():
+            self._hooks.enter_context(connection.execute_wrapper(self.queries))
+        self.sampler.start()
+        self._start = time.perf_counter()
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Only one cProfile can be active at a time on Python 3.12+; keep the flame graph alone.
+            self.profiler = None
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.duration = time.perf_counter() - self._start
+        self.sampler.stop()
+        self._hooks.close()
+
+    def save(self, request, response):
+        summary = {
+            "request_id": self.request_id,
+            "reason": self.reason,
+            "view": self.view_name,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status_code": response.status_code,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "query_count": self.queries.count,
+            "sql_ms": round(self.queries.seconds * 1000, 3),
+        }
+        directory = settings.PROFILING_DIR
+        path = os.path.join(directory, self.name)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if self.profiler is not None:
+                self.profiler.dump_stats(path + ".pstats")
+            with open(path + ".speedscope.json", "w", encoding="utf-8") as flame_graph:
+                json.dump(self.sampler.speedscope(_title(summary)), flame_graph)
+            with open(path + ".summary.json", "w", encoding="utf-8") as summary_file:
+                json.dump(summary, summary_file, indent=2)
+            _rotate(directory, settings.PROFILING_MAX_PROFILES)
+        except OSError:
+            # A full or read-only disk must not fail a booking that has already committed.
+            pass
+
+
+class QueryStats:
+    """``execute_wrapper`` hook counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class StackSampler:
+    """
+    Record the stack of one thread every ``interval`` seconds from a background thread.
+
+    Each sample is weighted by the time since the previous one, since a thread holding the GIL
+    delays the sampler past its interval.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        previous = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is not None:
+                self.samples.append((_stack(frame), now - previous))
+            previous = now
+
+    def speedscope(self, title):
+        """The samples as a speedscope sampled profile (https://www.speedscope.app/file-format-schema.json)."""
+        frames, indexes, stacks = [], {}, []
+        for stack, _ in self.samples:
+            for frame in stack:
+                if frame not in indexes:
+                    indexes[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            stacks.append([indexes[frame] for frame in stack])
+        weights = [round(weight * 1000, 3) for _, weight in self.samples]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": title,
+            "exporter": "tickets.profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": title,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": stacks,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def _stack(frame):
+    """Root-first ``(function, file, line)`` tuples of the frames leading to ``frame``."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _title(summary):
+    return (
+        f"{summary['method']} {summary['path']} [{summary['request_id']}] "
+        f"{summary['query_count']} queries, {summary['sql_ms']} ms SQL"
+    )
+
+
+def _rotate(directory, keep):
+    """Delete all but the newest ``keep`` profiles; names start with their timestamp, so they sort by age."""
+    summary = PROFILE_SUFFIXES[0]
+    names = sorted(name[: -len(summary)] for name in os.listdir(directory) if name.endswith(summary))
+    for name in names[: max(len(names) - keep, 0)]:
+        for suffix in PROFILE_SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,249 @@
+"""
+Query plans of the booking hot path.
+
+``HOT_QUERIES`` calls the service-layer reads behind every booking, cancellation, promotion and
+list request on one train run. ``capture_statements`` records the SELECTs and UPDATEs a call
+issues, such as the quota stripe claim, and ``explain`` runs each again under
+``EXPLAIN (ANALYZE, BUFFERS)`` in a savepoint that is rolled back. ``summarize`` reduces a plan to:
+- the scans it uses
+- the sequential scans over large tables and the explicit sorts, which are flagged
+- the buffers it touched
+
+``regressions`` compares a summary with the one stored in the baseline. Each hot query carries
+the partial or covering index that would serve it, suggested whenever its plan is flagged.
+PostgreSQL only.
+"""
+
+import hashlib
+import json
+
+from django.db import connections, transaction
+
+from .constants import AVAILABLE, BOOKED, GENDER_FEMALE, GENDER_MALE, QUOTA_GENERAL, RAC, SIDE_LOWER, WAITING_LIST
+from .models import Ticket
+from .quotas import claim_quota, get_quota_buckets
+from .search import search_tickets
+from .services import (
+    AvailabilityService,
+    _allocate_confirmed_berth_with_lock,
+    _allocate_rac_berth_with_lock,
+    _get_current_ticket_counts,
+    _next_in_queue,
+    get_remaining_capacity,
+    list_booked_tickets,
+)
+
+SCAN_NODES = {"Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan", "Bitmap Index Scan"}
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE")
+
+
+class HotQuery:
+    """
+    A service-layer call on the hot path, explained on one train run.
+
+    ``run`` is called with the arguments ``arguments(run)`` returns, the train run by default.
+    Those arguments are looked up before the statements are captured, so the lookup is not explained.
+    """
+
+    __slots__ = ("name", "description", "run", "suggestion", "arguments")
+
+    def __init__(self, name, description, run, suggestion, arguments=None):
+        self.name = name
+        self.description = description
+        self.run = run
+        self.suggestion = suggestion
+        self.arguments = arguments or (lambda run: (run,))
+
+
+def passenger_on_run(run):
+    """Search parameters naming the latest passenger booked on ``run``, so the search finds the run's tickets."""
+    name = (
+        Ticket.objects.filter(status=BOOKED, **run)
+        .order_by("-created_at", "-id")
+        .values_list("passenger__name", flat=True)
+        .first()
+    )
+    return ({"name": name or ""},)
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "ticket_counts",
+        "RAC and waiting-list counts checked before admitting a booking",
+        _get_current_ticket_counts,
+        f'models.Index(fields=["train", "journey_date", "ticket_type"], condition=Q(status="{BOOKED}"), '
+        'name="ticket_booked_type_idx")',
+    ),
+    HotQuery(
+        "remaining_capacity",
+        "Booked tickets and held berths counted for a seat hold",
+        lambda run: get_remaining_capacity(**run),
+        f'models.Index(fields=["train", "journey_date"], condition=Q(status="{BOOKED}"), name="ticket_booked_run_idx")',
+    ),
+    HotQuery(
+        "quota_stripes",
+        "Quota stripes with room, claimed for a confirmed booking",
+        lambda run: claim_quota(run, [QUOTA_GENERAL]),
+        'models.Index(fields=["train", "journey_date", "quota"], include=["booked", "capacity"], '
+        'name="quotacounter_room_idx")',
+    ),
+    HotQuery(
+        "confirmed_berth",
+        "Free berth picked for a confirmed booking",
+        lambda run: _allocate_confirmed_berth_with_lock(30, GENDER_MALE, False, run),
+        'models.Index(fields=["train", "journey_date", "quota", "berth_type", "berth_number", "id"], '
+        f'condition=Q(availability_status="{AVAILABLE}"), name="berth_free_pool_idx")',
+    ),
+    HotQuery(
+        "lower_berth",
+        "Free lower berth picked for a senior citizen or a woman travelling with a child",
+        lambda run: _allocate_confirmed_berth_with_lock(35, GENDER_FEMALE, True, run),
+        'models.Index(fields=["train", "journey_date", "quota", "berth_type", "berth_number", "id"], '
+        f'condition=Q(availability_status="{AVAILABLE}"), name="berth_free_pool_idx")',
+    ),
+    HotQuery(
+        "rac_berth",
+        "Free side-lower berth picked for an RAC booking",
+        _allocate_rac_berth_with_lock,
+        'models.Index(fields=["train", "journey_date", "berth_number", "id"], '
+        f'condition=Q(availability_status="{AVAILABLE}", berth_type="{SIDE_LOWER}"), name="berth_free_rac_idx")',
+    ),
+    HotQuery(
+        "rac_queue_head",
+        "Oldest RAC ticket, promoted when a confirmed berth is released",
+        lambda run: _next_in_queue(RAC, run),
+        'models.Index(fields=["train", "journey_date", "ticket_type", "created_at", "id"], '
+        f'condition=Q(status="{BOOKED}"), name="ticket_queue_idx")',
+    ),
+    HotQuery(
+        "waiting_list_head",
+        "Oldest waiting-list ticket, moved to RAC when a side-lower berth is released",
+        lambda run: _next_in_queue(WAITING_LIST, run),
+        'models.Index(fields=["train", "journey_date", "ticket_type", "created_at", "id"], '
+        f'condition=Q(status="{BOOKED}"), name="ticket_queue_idx")',
+    ),
+    HotQuery(
+        "booked_list",
+        "GET /booked for a train run, newest first",
+        list_booked_tickets,
+        'models.Index(fields=["train", "journey_date", "-created_at", "-id"], '
+        f'condition=Q(status="{BOOKED}"), name="ticket_booked_list_idx")',
+    ),
+    HotQuery(
+        "availability",
+        "GET /available for a train run",
+        AvailabilityService.get_availability_info,
+        'models.Index(fields=["train", "journey_date", "berth_type"], '
+        f'condition=Q(availability_status="{AVAILABLE}"), name="berth_free_type_idx")',
+    ),
+    HotQuery(
+        "availability_summary",
+        "Availability and quota counts pushed to the availability stream",
+        AvailabilityService.get_availability_summary,
+        'models.Index(fields=["train", "journey_date", "berth_type"], '
+        f'condition=Q(availability_status="{AVAILABLE}"), name="berth_free_type_idx")',
+    ),
+    HotQuery(
+        "quota_buckets",
+        "Quota bucket totals shown with availability",
+        get_quota_buckets,
+        'models.Index(fields=["train", "journey_date", "quota"], include=["booked", "capacity"], '
+        'name="quotacounter_room_idx")',
+    ),
+    HotQuery(
+        "passenger_search",
+        "GET /search by the name of a passenger booked on the train run",
+        search_tickets,
+        "passenger_name_trgm_idx and the (status, created_at) index should serve it; check that "
+        "the pg_trgm extension exists and the tables were analyzed",
+        arguments=passenger_on_run,
+    ),
+]
+
+
+def capture_statements(alias, func, *args):
+    """Call ``func`` in a rolled-back savepoint; returns the SELECTs and UPDATEs it issued as ``(sql, params)``."""
+    statements = []
+
+    def capture(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connections[alias].execute_wrapper(capture), transaction.atomic(using=alias):
+        func(*args)
+        transaction.set_rollback(True, using=alias)
+    return statements
+
+
+def explain(alias, sql, params):
+    """``EXPLAIN (ANALYZE, BUFFERS)`` of one statement, as PostgreSQL's JSON plan; rolled back afterwards."""
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+        (plan,) = cursor.fetchone()
+        transaction.set_rollback(True, using=alias)
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+def statement_key(query_name, sql):
+    """Baseline key of a statement: the hot query it belongs to and a digest of its SQL."""
+    return f"{query_name}:{hashlib.sha1(sql.encode()).hexdigest()[:12]}"
+
+
+def summarize(plan, min_rows):
+    """
+    Reduce a JSON plan to what the advisor compares.
+
+    Sequential scans are flagged once they read ``min_rows`` rows or more; smaller tables are
+    cheaper to scan than to index. Every explicit sort is flagged, since the hot queries should
+    get their order from an index.
+    """
+    scans, flags, notes = set(), set(), []
+    for node in _nodes(plan["Plan"]):
+        node_type = node["Node Type"]
+        relation = node.get("Relation Name")
+        if node_type in SCAN_NODES:
+            if relation:
+                scans.add(f"{node_type} on {relation}")
+            if node.get("Index Name"):
+                scans.add(f"{node_type} using {node['Index Name']}")
+        loops = node.get("Actual Loops", 1)
+        rows_read = (node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * loops
+        if node_type == "Seq Scan" and rows_read >= min_rows:
+            flags.add(f"Seq Scan on {relation}")
+            notes.append(f"Seq Scan on {relation} read {rows_read} rows; filter: {node.get('Filter', '-')}")
+        if node_type in ("Sort", "Incremental Sort"):
+            sort_key = ", ".join(node.get("Sort Key", []))
+            flags.add(f"{node_type} by {sort_key}")
+            notes.append(f"{node_type} by {sort_key} over {node.get('Actual Rows', 0) * loops} rows")
+    top = plan["Plan"]
+    return {
+        "scans": sorted(scans),
+        "flags": sorted(flags),
+        "notes": notes,
+        "buffers": top.get("Shared Hit Blocks", 0) + top.get("Shared Read Blocks", 0),
+        "execution_ms": plan.get("Execution Time"),
+    }
+
+
+def regressions(summary, baseline, buffer_tolerance):
+    """
+    Ways a plan got worse than its baseline summary.
+
+    New flags, and indexes the baseline used but the plan no longer does, count as regressions.
+    So do buffers that grew past ``buffer_tolerance`` times the baseline. Execution time is too
+    noisy to compare.
+    """
+    found = [f"new {flag}" for flag in summary["flags"] if flag not in baseline["flags"]]
+    used = set(summary["scans"])
+    found += [f"no longer uses {scan}" for scan in baseline["scans"] if " using " in scan and scan not in used]
+    # Small plans move by a few pages between runs; only flag growth beyond that.
+    if summary["buffers"] > max(baseline["buffers"] * buffer_tolerance, baseline["buffers"] + 16):
+        found.append(f"buffers grew from {baseline['buffers']} to {summary['buffers']}")
+    return found
+
+
+def _nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _nodes(child)
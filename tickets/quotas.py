@@ -0,0 +1,313 @@
+"""
+Quota policies and quota buckets.
+
+Policies are read through an in-process cache so the booking hot path does not query for
+them. The cache compares a cheap policy-table version (latest ``updated_at`` plus row count on
+every shard) at most every ``QUOTA_POLICY_CHECK_INTERVAL`` seconds. Saving or deleting a policy
+also clears the cache of the process that made the change straight away.
+
+Confirmed berths of a train run are sold from ladies, senior and general buckets, each with
+its own berth pool and a striped ``QuotaCounter``. Buckets are created from the policy on the
+first booking of the run; ``rollover_quotas`` later hands unused reserved quota to general.
+"""
+
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .concurrency import claim_versioned, optimistic_booking
+from .constants import (
+    AVAILABLE,
+    BOOKED,
+    CONFIRMED,
+    GENDER_FEMALE,
+    LOWER,
+    QUOTA_GENERAL,
+    QUOTA_LADIES,
+    QUOTA_SENIOR,
+    RESERVED_QUOTAS,
+    SENIOR_AGE,
+    SIDE_LOWER,
+    SLEEPER,
+)
+from .inventory import bump_inventory_version
+from .models import Berth, QuotaCounter, QuotaPolicy, Ticket
+from .sharding import atomic, fan_out, inventory_shards, shard_aliases, shard_of
+
+
+class QuotaPolicyCache:
+    """Process-local cache of quota policies keyed by train, class and journey date."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies = {}
+        self._version = None
+        self._checked_at = None
+
+    def get(self, train=None, journey_date=None, travel_class=SLEEPER):
+        """Return the policy for a train/class/date, falling back to the train default and then the global one."""
+        self._revalidate()
+        key = (train.pk if train else None, travel_class, journey_date)
+        policy = self._policies.get(key)
+        if policy is None:
+            policy = self._policies[key] = self._load(train, travel_class, journey_date)
+        return policy
+
+    def invalidate(self):
+        with self._lock:
+            self._policies = {}
+            self._checked_at = None
+
+    def _revalidate(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < settings.QUOTA_POLICY_CHECK_INTERVAL:
+            return
+
+        version = [
+            QuotaPolicy.objects.using(alias).aggregate(updated_at=Max("updated_at"), count=Count("id"))
+            for alias in shard_aliases()
+        ]
+        with self._lock:
+            if version != self._version:
+                self._policies = {}
+                self._version = version
+            self._checked_at = now
+
+    @staticmethod
+    def _load(train, travel_class, journey_date):
+        if train is None:
+            return QuotaPolicy(travel_class=travel_class)
+
+        candidates = QuotaPolicy.objects.using(shard_of(train)).filter(train=train, travel_class=travel_class)
+        policies = {
+            policy.journey_date: policy
+            for policy in candidates.filter(Q(journey_date=journey_date) | Q(journey_date__isnull=True))
+        }
+        return policies.get(journey_date) or policies.get(None) or QuotaPolicy(train=train, travel_class=travel_class)
+
+
+quota_policies = QuotaPolicyCache()
+
+
+def get_quota_policy(train=None, journey_date=None, travel_class=SLEEPER):
+    """Return the quota policy that applies to a booking."""
+    return quota_policies.get(train, journey_date, travel_class)
+
+
+@receiver([post_save, post_delete], sender=QuotaPolicy)
+def invalidate_quota_policies(sender, **kwargs):
+    quota_policies.invalidate()
+
+
+def eligible_quotas(passenger):
+    """Buckets a passenger may book from, reserved ones first so general is kept for everyone else."""
+    quotas = []
+    if passenger.age >= SENIOR_AGE:
+        quotas.append(QUOTA_SENIOR)
+    if passenger.gender == GENDER_FEMALE and not passenger.is_child:
+        quotas.append(QUOTA_LADIES)
+    quotas.append(QUOTA_GENERAL)
+    return quotas
+
+
+def claim_quota(inventory, quotas):
+    """
+    Take one seat from the first bucket in ``quotas`` with room left and return its name.
+
+    Stripes with room are tried in random order, each with a conditional increment, so
+    concurrent bookings spread over the stripes and never oversell one. Returns ``None`` when
+    every bucket is full. Buckets are created from the quota policy on first use. In optimistic
+    mode the increment is a versioned compare-and-swap instead.
+    """
+    for quota in quotas:
+        if _claim_stripe(inventory, quota):
+            return quota
+
+    if not QuotaCounter.objects.filter(**inventory).exists():
+        create_quota_buckets(inventory)
+        return claim_quota(inventory, quotas)
+    return None
+
+
+def _claim_stripe(inventory, quota):
+    with_room = QuotaCounter.objects.filter(quota=quota, booked__lt=F("capacity"), **inventory)
+    if optimistic_booking():
+        return claim_versioned(with_room, _pick_stripe, booked=F("booked") + 1) is not None
+
+    stripes = list(with_room.values_list("id", flat=True))
+    random.shuffle(stripes)
+    for stripe_id in stripes:
+        if QuotaCounter.objects.filter(id=stripe_id, booked__lt=F("capacity")).update(
+            booked=F("booked") + 1, version=F("version") + 1
+        ):
+            return True
+    return False
+
+
+def _pick_stripe(stripes):
+    stripes = list(stripes.only("id", "version"))
+    return random.choice(stripes) if stripes else None
+
+
+def release_quota(inventory, quota):
+    """Give a seat back to ``quota``; tickets sold before buckets existed have no quota and are skipped."""
+    if not quota:
+        return
+    stripes = list(QuotaCounter.objects.filter(quota=quota, booked__gt=0, **inventory).values_list("id", flat=True))
+    random.shuffle(stripes)
+    for stripe_id in stripes:
+        if QuotaCounter.objects.filter(id=stripe_id, booked__gt=0).update(
+            booked=F("booked") - 1, version=F("version") + 1
+        ):
+            return
+
+
+def create_quota_buckets(inventory):
+    """
+    Create the striped counters and berth pools of a train run from its quota policy.
+
+    Safe to run concurrently: counters are inserted with conflicts ignored and the berth pools
+    are picked deterministically. Confirmed tickets already on the run are counted against
+    their bucket, or against general when they predate buckets.
+    """
+    berth_types = Berth.objects.filter(**inventory).values_list("berth_type", flat=True)
+    capacities = bucket_capacities(get_quota_policy(**inventory), berth_types)
+    booked = {quota: 0 for quota in capacities}
+    for quota, count in (
+        Ticket.objects.filter(ticket_type=CONFIRMED, status=BOOKED, **inventory)
+        .order_by()
+        .values_list("quota")
+        .annotate(count=Count("id"))
+    ):
+        booked[quota or QUOTA_GENERAL] += count
+
+    counters = []
+    for quota, capacity in capacities.items():
+        for stripe, (stripe_capacity, stripe_booked) in enumerate(_split(capacity, booked[quota])):
+            counters.append(
+                QuotaCounter(quota=quota, stripe=stripe, capacity=stripe_capacity, booked=stripe_booked, **inventory)
+            )
+    QuotaCounter.objects.bulk_create(counters, ignore_conflicts=True)
+    _assign_berth_pools(inventory, capacities[QUOTA_SENIOR], capacities[QUOTA_LADIES])
+
+
+def bucket_capacities(policy, berth_types):
+    """
+    Seats per bucket for a policy on a run with berths of ``berth_types``.
+
+    Reserved quotas never exceed the confirmed limit or their berth pools, however configured:
+    senior seats are capped at the lower berths and ladies seats at the regular berths left, so
+    every reserved seat has a berth. Seats trimmed from them are sold as general.
+    """
+    berth_types = list(berth_types)
+    lower_berths = berth_types.count(LOWER)
+    regular_berths = len(berth_types) - berth_types.count(SIDE_LOWER)
+    senior = min(policy.senior_quota, policy.confirmed_limit, lower_berths)
+    ladies = min(policy.ladies_quota, policy.confirmed_limit - senior, regular_berths - senior)
+    return {
+        QUOTA_SENIOR: senior,
+        QUOTA_LADIES: ladies,
+        QUOTA_GENERAL: policy.confirmed_limit - senior - ladies,
+    }
+
+
+def _split(capacity, booked):
+    """Spread a bucket's capacity and already-sold seats over the configured number of stripes."""
+    stripes = max(settings.QUOTA_COUNTER_STRIPES, 1)
+    split = []
+    for stripe in range(stripes):
+        stripe_capacity = capacity // stripes + (1 if stripe < capacity % stripes else 0)
+        stripe_booked = min(booked, stripe_capacity) if stripe < stripes - 1 else booked
+        booked -= stripe_booked
+        split.append((stripe_capacity, stripe_booked))
+    return split
+
+
+def _assign_berth_pools(inventory, senior, ladies):
+    """Set aside the lowest-numbered lower berths for seniors and the next berths for ladies."""
+    berths = Berth.objects.filter(**inventory).exclude(berth_type=SIDE_LOWER).order_by("berth_number", "id")
+    senior_ids = list(berths.filter(berth_type=LOWER).values_list("id", flat=True)[:senior])
+    ladies_ids = list(berths.exclude(id__in=senior_ids).values_list("id", flat=True)[:ladies])
+    Berth.objects.filter(id__in=senior_ids).update(quota=QUOTA_SENIOR, version=F("version") + 1)
+    Berth.objects.filter(id__in=ladies_ids).update(quota=QUOTA_LADIES, version=F("version") + 1)
+
+
+def get_quota_buckets(inventory=None):
+    """Capacity, booked and available seats per bucket, summed over the stripes and over shards."""
+    counters = QuotaCounter.objects.all()
+    if inventory and inventory["train"]:
+        counters = counters.filter(train=inventory["train"])
+    if inventory and inventory["journey_date"]:
+        counters = counters.filter(journey_date=inventory["journey_date"])
+
+    totals = {quota: {"capacity": 0, "booked": 0} for quota in (QUOTA_GENERAL, *RESERVED_QUOTAS)}
+    for rows in fan_out(
+        lambda: list(counters.order_by().values("quota").annotate(capacity=Sum("capacity"), booked=Sum("booked"))),
+        inventory_shards(inventory),
+    ):
+        for row in rows:
+            totals[row["quota"]]["capacity"] += row["capacity"]
+            totals[row["quota"]]["booked"] += row["booked"]
+    return {
+        quota: {**total, "available": max(total["capacity"] - total["booked"], 0)} for quota, total in totals.items()
+    }
+
+
+def rollover_quotas(now=None, batch_size=100):
+    """
+    Move unused ladies and senior quota into general on runs within the rollover cutoff.
+
+    Runs are processed ``batch_size`` at a time, each in its own short transaction, so the job
+    never holds locks across the whole table. Reserved stripes shrink to what they have sold,
+    the freed seats are spread over the general stripes and the reserved berths still free move
+    to the general pool. Returns the number of seats rolled over.
+    """
+    now = now or timezone.now()
+    cutoff = (now + timedelta(hours=settings.QUOTA_ROLLOVER_HOURS)).date()
+    pending = (
+        QuotaCounter.objects.filter(
+            quota__in=RESERVED_QUOTAS, journey_date__isnull=False, journey_date__lte=cutoff, capacity__gt=F("booked")
+        )
+        .order_by("journey_date", "train")
+        .values_list("train", "journey_date")
+        .distinct()
+    )
+
+    rolled_over = 0
+    while True:
+        runs = list(pending[:batch_size])
+        if not runs:
+            return rolled_over
+        for train_id, journey_date in runs:
+            rolled_over += _rollover_run({"train_id": train_id, "journey_date": journey_date})
+
+
+@atomic
+def _rollover_run(inventory):
+    counters = list(QuotaCounter.objects.select_for_update().filter(**inventory).order_by("stripe"))
+    unused = 0
+    for counter in counters:
+        if counter.quota in RESERVED_QUOTAS and counter.capacity > counter.booked:
+            unused += counter.capacity - counter.booked
+            counter.capacity = counter.booked
+            counter.version += 1
+            counter.save(update_fields=["capacity", "version"])
+
+    general = [counter for counter in counters if counter.quota == QUOTA_GENERAL]
+    for index, counter in enumerate(general):
+        counter.capacity += unused // len(general) + (1 if index < unused % len(general) else 0)
+        counter.version += 1
+        counter.save(update_fields=["capacity", "version"])
+
+    Berth.objects.filter(quota__in=RESERVED_QUOTAS, availability_status=AVAILABLE, **inventory).update(
+        quota=QUOTA_GENERAL, version=F("version") + 1
+    )
+    bump_inventory_version(inventory)
+    return unused
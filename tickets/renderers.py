@@ -0,0 +1,51 @@
+"""
+Fast JSON rendering and parsing.
+
+Uses orjson when it is installed and falls back to DRF's stdlib-based classes otherwise,
+so the settings can reference these classes unconditionally.
+"""
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSON renderer backed by orjson, with DRF's encoder handling types orjson does not know."""
+
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Indented output is only requested by humans; leave it to the stdlib renderer.
+        if orjson is None or self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        # Dates and times go through DRF's encoder too, so UTC is written as "Z" as the stdlib renderer does.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(data, default=self.encoder.default, option=option)
+
+
+class FastJSONParser(JSONParser):
+    """JSON parser backed by orjson."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        try:
+            body = stream.read()
+            return orjson.loads(body if encoding.lower() in ("utf-8", "utf8") else body.decode(encoding))
+        except (orjson.JSONDecodeError, UnicodeDecodeError) as exc:
+            raise ParseError(f"JSON parse error - {exc}")
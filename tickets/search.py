@@ -0,0 +1,133 @@
+"""
+Passenger search over tickets.
+
+Agents look tickets up by part of a passenger name, an age range, ticket type, status and
+booking time. Name matching is a case-insensitive substring match, which the trigram GIN index
+on ``UPPER(name)`` serves without scanning every passenger; status and booking time use the
+``(status, created_at)`` index. Results come newest first in pages addressed by an opaque
+keyset cursor, so page fifty costs the same as page one instead of skipping rows with OFFSET.
+"""
+
+import base64
+import binascii
+import heapq
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .constants import (
+    BOOKED,
+    INVALID_SEARCH_CURSOR,
+    INVALID_SEARCH_FILTER,
+    SEARCH_MAX_PAGE_SIZE,
+    SEARCH_MIN_NAME_LENGTH,
+    SEARCH_NAME_TOO_SHORT,
+    SEARCH_PAGE_SIZE,
+    TICKET_STATUS,
+    TICKET_TYPES,
+)
+from .models import Ticket
+from .sharding import fan_out
+
+
+def search_tickets(params):
+    """
+    Search tickets with the filters in ``params``, the endpoint's query parameters; returns ``(page, error)``.
+
+    ``page`` holds up to ``limit`` tickets, newest first, and the ``next_cursor`` to pass back for
+    the following page, or ``None`` on the last one. Only booked tickets are searched unless
+    ``status`` asks for canceled ones.
+    """
+    filters, error = _parse_filters(params)
+    if error:
+        return None, error
+
+    limit = params.get("limit") or str(SEARCH_PAGE_SIZE)
+    if not limit.isdigit() or not 1 <= int(limit) <= SEARCH_MAX_PAGE_SIZE:
+        return None, INVALID_SEARCH_FILTER.format("limit")
+    limit = int(limit)
+
+    tickets = Ticket.objects.filter(**filters).select_related("passenger", "berth", "train")
+    if params.get("cursor"):
+        position = _decode_cursor(params["cursor"])
+        if position is None:
+            return None, INVALID_SEARCH_CURSOR
+        created_at, ticket_id = position
+        # Bound created_at on its own so the index scan starts at the cursor, then drop the rows
+        # of that same instant already returned.
+        tickets = tickets.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=ticket_id)
+
+    # Every shard returns its own first page and the merged pages are cut back to one.
+    per_shard = fan_out(lambda: list(tickets.order_by("-created_at", "-id")[: limit + 1]))
+    page = list(heapq.merge(*per_shard, key=lambda ticket: (ticket.created_at, ticket.id), reverse=True))[: limit + 1]
+    next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return {"tickets": page[:limit], "next_cursor": next_cursor}, None
+
+
+def _parse_filters(params):
+    status = params.get("status") or BOOKED
+    if status not in dict(TICKET_STATUS):
+        return None, INVALID_SEARCH_FILTER.format("status")
+    filters = {"status": status}
+
+    name = params.get("name", "").strip()
+    if name:
+        if len(name) < SEARCH_MIN_NAME_LENGTH:
+            return None, SEARCH_NAME_TOO_SHORT
+        filters["passenger__name__icontains"] = name
+
+    ticket_type = params.get("ticket_type")
+    if ticket_type:
+        if ticket_type not in dict(TICKET_TYPES):
+            return None, INVALID_SEARCH_FILTER.format("ticket_type")
+        filters["ticket_type"] = ticket_type
+
+    for param, lookup in (("age_min", "passenger__age__gte"), ("age_max", "passenger__age__lte")):
+        value = params.get(param)
+        if value:
+            if not value.isdigit():
+                return None, INVALID_SEARCH_FILTER.format(param)
+            filters[lookup] = int(value)
+
+    # created_from is inclusive and created_to exclusive, so consecutive ranges never overlap.
+    for param, lookup in (("created_from", "created_at__gte"), ("created_to", "created_at__lt")):
+        value = params.get(param)
+        if value:
+            moment = _parse_moment(value)
+            if moment is None:
+                return None, INVALID_SEARCH_FILTER.format(param)
+            filters[lookup] = moment
+
+    return filters, None
+
+
+def _parse_moment(value):
+    """Parse an ISO 8601 date or datetime; a date means midnight and naive times are in the current time zone."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _encode_cursor(ticket):
+    position = json.dumps([ticket.created_at.isoformat(), ticket.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        created_at, ticket_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        return None
+    if created_at is None or not isinstance(ticket_id, int):
+        return None
+    return created_at, ticket_id
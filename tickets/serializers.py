@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from .models import Berth, Passenger, Ticket, TicketHistory
+from .models import Berth, Passenger, SeatHold, Ticket, TicketHistory
 
 
 class PassengerSerializer(serializers.ModelSerializer):
@@ -8,7 +8,7 @@ class PassengerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Passenger
-        fields = ["id", "name", "age", "is_child", "gender"]
+        fields = ["id", "name", "age", "is_child", "gender", "external_id"]
         read_only_fields = ["is_child"]  # is_child is automatically set based on age
 
 
@@ -17,7 +17,7 @@ class BerthSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Berth
-        fields = ["id", "berth_type", "availability_status"]
+        fields = ["id", "berth_number", "berth_type", "quota", "availability_status"]
         read_only_fields = ["availability_status"]  # Status is managed by the system
 
 
@@ -26,11 +26,23 @@ class TicketSerializer(serializers.ModelSerializer):
 
     passenger = PassengerSerializer()
     berth_details = BerthSerializer(source="berth", read_only=True)
+    train = serializers.SlugRelatedField(slug_field="number", read_only=True)
 
     class Meta:
         model = Ticket
-        fields = ["id", "ticket_type", "status", "berth_allocation", "berth_details", "created_at", "passenger"]
-        read_only_fields = ["status", "berth_allocation", "created_at"]
+        fields = [
+            "id",
+            "ticket_type",
+            "status",
+            "train",
+            "journey_date",
+            "quota",
+            "berth_allocation",
+            "berth_details",
+            "created_at",
+            "passenger",
+        ]
+        read_only_fields = ["status", "quota", "berth_allocation", "created_at"]
 
     def create(self, validated_data):
         """Create a ticket with nested passenger data."""
@@ -68,3 +80,14 @@ class TicketHistorySerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         representation["action_display"] = instance.get_action_display()
         return representation
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    """Serializer for a seat hold and the seats it reserves."""
+
+    train = serializers.SlugRelatedField(slug_field="number", read_only=True)
+
+    class Meta:
+        model = SeatHold
+        fields = ["token", "status", "train", "journey_date", "seats", "created_at", "expires_at"]
+        read_only_fields = fields
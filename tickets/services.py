@@ -1,38 +1,74 @@
+import heapq
+from collections import Counter
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db.models import Count, F, Q, QuerySet
 from django.db.utils import OperationalError
+from django.utils.dateparse import parse_date
 from rest_framework import status
 
-from .constants import (ACTION_CANCELED, ACTION_MOVED_RAC, ACTION_PROMOTED_RAC, ALREADY_CANCELED, AVAILABLE, BOOKED,
-                        CANCELED, CHILD_AGE, CONFIRMED, GENDER_FEMALE, LOWER, NO_BERTH_AVAILABLE, NO_CONFIRMED_BERTHS,
-                        NO_RAC_BERTHS, NO_TICKETS_AVAILABLE, RAC, REQUIRED_FIELDS, SENIOR_AGE, SIDE_LOWER,
-                        TICKET_NOT_FOUND, WAITING_LIST)
-from .models import Berth, Passenger, Ticket, TicketHistory
+from .allocation import GroupBerthAllocator
+from .concurrency import BookingConflict, claim_versioned, optimistic_booking, pick_spread
+from .constants import (ACTION_CANCELED, ACTION_MOVED_RAC, ACTION_PROMOTED_RAC, ALREADY_CANCELED, AVAILABLE,
+                        BERTH_ALREADY_AVAILABLE, BERTH_HELD, BERTH_IN_USE, BERTH_NOT_FOUND, BOOKED, BOOKING_CONFLICT,
+                        CANCELED, CHART_CLOSED, CHILD_AGE, CONFIRMED, EVENT_TICKET_BOOKED, EVENT_TICKET_CANCELED,
+                        EVENT_TICKET_CONFIRMED, EVENT_TICKET_MOVED_RAC, GENDER_FEMALE, HOLD_ACTIVE,
+                        INVALID_JOURNEY_DATE, LOWER, NO_BERTH_AVAILABLE, NO_CONFIRMED_BERTHS, NO_RAC_BERTHS,
+                        NO_TICKETS_AVAILABLE, QUOTA_GENERAL, RAC, REQUIRED_FIELDS, RESERVED, SENIOR_AGE, SIDE_LOWER,
+                        TICKET_NOT_FOUND, TRAIN_NOT_FOUND, WAITING_LIST)
+from .inventory import bump_inventory_version, get_inventory_version
+from .models import Berth, Chart, Passenger, SeatHold, Ticket, TicketHistory, Train
+from .outbox import record_event
+from .profiles import upsert_passengers
+from .quotas import claim_quota, eligible_quotas, get_quota_buckets, get_quota_policy, release_quota
 from .serializers import BerthSerializer, TicketSerializer
+from .sharding import atomic, fan_out, inventory_shards, locate, on_shard, shard_for_train, shard_of, train_shard
+from .status import invalidate_ticket_status
+from .throttling import load_monitor
+
+
+def book_ticket(
+    passenger_name,
+    passenger_age,
+    gender=None,
+    has_child=False,
+    berth_hint=None,
+    train=None,
+    journey_date=None,
+    external_id=None,
+    passenger=None,
+):
+    """
+    Book a ticket with concurrency handling.
 
-CONFIRMED_BERTH_LIMIT = 63
-RAC_TICKET_LIMIT = 18
-WAITING_LIST_LIMIT = 10
-
-
-@transaction.atomic
-def book_ticket(passenger_name, passenger_age, gender=None, has_child=False):
-    """Book a ticket with concurrency handling"""
+    ``train`` and ``journey_date`` select the inventory to book from; leaving them out books
+    from the berths that are not assigned to any train. ``berth_hint`` is the id of a berth
+    picked by the group planner; it is used when it is still available under lock and ignored
+    otherwise. ``passenger`` is a profile already resolved by the caller. The booking runs in one
+    transaction on the shard of ``train``.
+    """
     if not _validate_booking_params(passenger_name, passenger_age):
         return None, REQUIRED_FIELDS
 
     try:
-        passenger = _create_passenger(passenger_name, passenger_age, gender)
-        ticket_details = _determine_ticket_type_and_berth(passenger, has_child)
-
-        if "error" in ticket_details:
-            return None, ticket_details["error"]
-
-        ticket = _create_ticket(passenger, ticket_details)
-        return ticket, None
-
-    except OperationalError:
-        return None, "Booking temporarily unavailable. Please try again."
+        with train_shard(train):
+            inventory = _inventory(train, journey_date)
+            passenger = passenger or _create_passenger(passenger_name, passenger_age, gender, external_id)
+            ticket_details = _determine_ticket_type_and_berth(passenger, has_child, inventory, berth_hint)
+
+            if "error" in ticket_details:
+                return None, ticket_details["error"]
+
+            ticket = _create_ticket(passenger, ticket_details, inventory)
+            record_event(EVENT_TICKET_BOOKED, ticket)
+            bump_inventory_version(inventory)
+            load_monitor.record_lock_attempt(failed=False)
+            return ticket, None
+
+    except (OperationalError, BookingConflict):
+        load_monitor.record_lock_attempt(failed=True)
+        return None, BOOKING_CONFLICT
     except ValidationError as e:
         return None, str(e)
 
@@ -42,153 +78,438 @@ def _validate_booking_params(name, age):
     return bool(name and age is not None)
 
 
-def _create_passenger(name, age, gender):
-    """Create a new passenger record."""
+def _create_passenger(name, age, gender, external_id=None):
+    """Reuse the passenger's profile, or create a new passenger record when profiles are disabled."""
+    if settings.PASSENGER_PROFILES:
+        return upsert_passengers([{"name": name, "age": age, "gender": gender, "external_id": external_id}])[0]
     is_child = age < CHILD_AGE
-    return Passenger.objects.create(name=name, age=age, is_child=is_child, gender=gender)
+    return Passenger.objects.create(name=name, age=age, is_child=is_child, gender=gender, external_id=external_id)
 
 
-@transaction.atomic
-def _determine_ticket_type_and_berth(passenger, has_child):
-    """Determine ticket type and berth allocation based on availability."""
-    ticket_counts = _get_current_ticket_counts()
+def _inventory(train=None, journey_date=None):
+    """Filter arguments selecting the berths and tickets of one train run."""
+    return {"train": train, "journey_date": journey_date}
 
-    # Determine ticket type
-    ticket_type = _get_available_ticket_type(ticket_counts)
+
+@atomic
+def _determine_ticket_type_and_berth(passenger, has_child, inventory, berth_hint=None):
+    """Determine ticket type and berth allocation based on availability."""
+    # Confirmed seats come from the striped quota counters, so they need no train-wide lock.
+    quota = claim_quota(inventory, eligible_quotas(passenger))
+    if quota:
+        ticket_type = CONFIRMED
+    else:
+        _lock_inventory(inventory["train"])
+        ticket_counts = _get_current_ticket_counts(inventory)
+        policy = get_quota_policy(**inventory)
+        ticket_type = _get_available_ticket_type(ticket_counts, policy)
+
+    if _chart_closed(inventory):
+        release_quota(inventory, quota)
+        return {"error": CHART_CLOSED}
     if not ticket_type:
         return {"error": NO_TICKETS_AVAILABLE}
 
     # Handle berth allocation
     berth = None
     if not passenger.is_child:
-        berth = _allocate_berth(ticket_type, passenger.age, passenger.gender, has_child)
+        berth = _allocate_berth(ticket_type, passenger.age, passenger.gender, has_child, inventory, quota, berth_hint)
+        if not berth and ticket_type == RAC:
+            # Every side-lower berth is taken, even if the policy allows more RAC tickets; queue instead.
+            ticket_type = _get_available_ticket_type(ticket_counts, policy, rac_berth_free=False)
+            if not ticket_type:
+                return {"error": NO_TICKETS_AVAILABLE}
         if not berth and ticket_type != WAITING_LIST:
+            release_quota(inventory, quota)
             return {"error": NO_BERTH_AVAILABLE}
 
-    return {"ticket_type": ticket_type, "berth": berth}
+    return {"ticket_type": ticket_type, "berth": berth, "quota": quota}
 
 
-def _get_current_ticket_counts():
-    """Get current counts of different ticket types with locking."""
-    return {
-        "confirmed": Ticket.objects.select_for_update(nowait=True).filter(ticket_type=CONFIRMED, status=BOOKED).count(),
-        "rac": Ticket.objects.select_for_update(nowait=True).filter(ticket_type=RAC, status=BOOKED).count(),
-        "waiting": (
-            Ticket.objects.select_for_update(nowait=True).filter(ticket_type=WAITING_LIST, status=BOOKED).count()
-        ),
-    }
+def _chart_closed(inventory):
+    """
+    Whether the train run's chart has closed it to bookings.
+
+    Checked once the booking holds its quota stripe or the train row. ``prepare_chart`` locks
+    both after closing the run, so it either waits for this booking or this booking sees the chart.
+    """
+    if inventory["train"] is None or inventory["journey_date"] is None:
+        return False
+    return Chart.objects.filter(**inventory).exists()
+
 
+def _lock_inventory(train):
+    """Serialize bookings on a train by locking its row; fails fast instead of queueing on the lock."""
+    if train is not None:
+        Train.objects.select_for_update(nowait=True).get(pk=train.pk)
 
-def _get_available_ticket_type(counts):
-    """Determine available ticket type based on current counts."""
-    if counts["confirmed"] < CONFIRMED_BERTH_LIMIT:
-        return CONFIRMED
-    if counts["rac"] < RAC_TICKET_LIMIT:
+
+def _get_current_ticket_counts(inventory):
+    """Get current counts of RAC and waiting-list tickets in one pass."""
+    return Ticket.objects.filter(status=BOOKED, **inventory).aggregate(
+        rac=Count("id", filter=Q(ticket_type=RAC)),
+        waiting=Count("id", filter=Q(ticket_type=WAITING_LIST)),
+    )
+
+
+def _get_available_ticket_type(counts, policy, rac_berth_free=True):
+    """Determine the queued ticket type once confirmed quota is sold out."""
+    if counts["rac"] < policy.rac_limit and rac_berth_free:
         return RAC
-    if counts["waiting"] < WAITING_LIST_LIMIT:
+    if counts["waiting"] < policy.waiting_list_limit:
         return WAITING_LIST
     return None
 
 
-def _allocate_berth(ticket_type, age, gender, has_child):
+def _allocate_berth(ticket_type, age, gender, has_child, inventory, quota=None, berth_hint=None):
     """Allocate appropriate berth based on ticket type and passenger details."""
     if ticket_type == CONFIRMED:
-        return _allocate_confirmed_berth_with_lock(age, gender, has_child)
+        if optimistic_booking():
+            return _allocate_confirmed_berth_optimistic(age, gender, has_child, inventory, quota, berth_hint)
+        return _allocate_confirmed_berth_with_lock(age, gender, has_child, inventory, quota, berth_hint)
     elif ticket_type == RAC:
-        return _allocate_rac_berth_with_lock()
+        if optimistic_booking():
+            return _allocate_rac_berth_optimistic(inventory)
+        return _allocate_rac_berth_with_lock(inventory)
     return None
 
 
-def _create_ticket(passenger, ticket_details):
+def _create_ticket(passenger, ticket_details, inventory):
     """Create ticket and update berth status."""
+    berth = ticket_details["berth"]
     ticket = Ticket.objects.create(
         ticket_type=ticket_details["ticket_type"],
         status=BOOKED,
         passenger=passenger,
-        berth_allocation=ticket_details["berth"].berth_type if ticket_details["berth"] else None,
+        berth=berth,
+        berth_allocation=berth.berth_type if berth else None,
+        quota=ticket_details["quota"],
+        **inventory,
     )
 
-    if ticket_details["berth"]:
-        ticket_details["berth"].availability_status = BOOKED
-        ticket_details["berth"].save()
+    # Optimistic claims have already marked the berth booked.
+    if berth and berth.availability_status != BOOKED:
+        berth.availability_status = BOOKED
+        berth.version += 1
+        berth.save(update_fields=["availability_status", "version"])
 
     return ticket
 
 
-def _allocate_confirmed_berth_with_lock(age, gender, has_child):
+def _allocate_confirmed_berth_with_lock(age, gender, has_child, inventory, quota=QUOTA_GENERAL, berth_hint=None):
     """
-    Allocate berth with proper locking
+    Allocate berth from the quota's berth pool with proper locking
     """
-    available_berths = Berth.objects.select_for_update(nowait=True).filter(availability_status=AVAILABLE)
+    available_berths = _available_berths(inventory, quota).select_for_update(nowait=True)
+    return _pick_confirmed_berth(available_berths, age, gender, has_child, berth_hint)
+
 
-    if age >= SENIOR_AGE or (gender == GENDER_FEMALE and has_child):
-        lower_berth = available_berths.filter(berth_type=LOWER).first()
+def _allocate_confirmed_berth_optimistic(age, gender, has_child, inventory, quota=QUOTA_GENERAL, berth_hint=None):
+    """
+    Claim a berth from the quota's berth pool with a versioned compare-and-swap, re-picking when another booking won it
+    """
+    return _claim_berth(
+        _available_berths(inventory, quota),
+        lambda available_berths: _pick_confirmed_berth(
+            available_berths, age, gender, has_child, berth_hint, pick_one=pick_spread
+        ),
+    )
+
+
+def _available_berths(inventory, quota):
+    return Berth.objects.filter(availability_status=AVAILABLE, quota=quota, **inventory).order_by(
+        "berth_type", "berth_number", "id"
+    )
+
+
+def _pick_confirmed_berth(available_berths, age, gender, has_child, berth_hint=None, pick_one=QuerySet.first):
+    """
+    Pick the hinted berth, then a lower berth for those who need one, then a regular berth.
+
+    ``pick_one`` chooses from the candidates in berth order: the first one by default, or one
+    near the head of the list in optimistic mode.
+    """
+    if berth_hint:
+        hinted_berth = available_berths.exclude(berth_type=SIDE_LOWER).filter(id=berth_hint).first()
+        if hinted_berth:
+            return hinted_berth
+
+    if _needs_lower_berth(age, gender, has_child):
+        lower_berth = pick_one(available_berths.filter(berth_type=LOWER))
         if lower_berth:
             return lower_berth
 
-    return available_berths.exclude(berth_type=SIDE_LOWER).first()
+    return pick_one(available_berths.exclude(berth_type=SIDE_LOWER))
+
+
+def _claim_berth(available_berths, pick):
+    berth = claim_versioned(available_berths, pick, availability_status=BOOKED)
+    if berth:
+        berth.availability_status = BOOKED
+        berth.version += 1
+    return berth
+
+
+def _needs_lower_berth(age, gender, has_child):
+    """Seniors and women travelling with a child get priority for lower berths."""
+    return age >= SENIOR_AGE or (gender == GENDER_FEMALE and has_child)
 
 
-def _allocate_rac_berth_with_lock():
+def _allocate_rac_berth_with_lock(inventory):
     """
     Allocate RAC berth with proper locking
     """
-    return (
-        Berth.objects.select_for_update(nowait=True)
-        .filter(berth_type=SIDE_LOWER, availability_status=AVAILABLE)
-        .first()
+    return _available_rac_berths(inventory).select_for_update(nowait=True).first()
+
+
+def _allocate_rac_berth_optimistic(inventory):
+    """
+    Claim a side-lower berth with a versioned compare-and-swap
+    """
+    return _claim_berth(_available_rac_berths(inventory), pick_spread)
+
+
+def _available_rac_berths(inventory):
+    return Berth.objects.filter(berth_type=SIDE_LOWER, availability_status=AVAILABLE, **inventory).order_by(
+        "berth_number", "id"
     )
 
 
 def cancel_ticket(ticket_id):
+    """Cancel a ticket, hand its berth down the promotion queues and free whatever is left over."""
+    with on_shard(locate(Ticket.objects.filter(id=ticket_id))):
+        train = Train.objects.filter(tickets__id=ticket_id).first()
+        try:
+            with train_shard(train):
+                return _cancel_ticket(ticket_id)
+        except BookingConflict:
+            return None, BOOKING_CONFLICT
+
+
+def _cancel_ticket(ticket_id):
     try:
-        ticket = Ticket.objects.get(id=ticket_id)
+        ticket = Ticket.objects.select_for_update(of=("self",)).select_related("berth").get(id=ticket_id)
     except Ticket.DoesNotExist:
         return None, TICKET_NOT_FOUND
 
     if ticket.status == CANCELED:
         return None, ALREADY_CANCELED
 
+    released_berth = ticket.berth
     ticket.status = CANCELED
-    ticket.save()
+    ticket.berth = None
+    ticket.save(update_fields=["status", "berth"])
+    invalidate_ticket_status(ticket)
 
-    handle_promotions(ticket)
+    leftover_berth = handle_promotions(ticket, released_berth)
+    if leftover_berth:
+        _release_berth(leftover_berth)
 
     # Create cancellation history
     TicketHistory.objects.create(ticket=ticket, action=ACTION_CANCELED)
+    record_event(EVENT_TICKET_CANCELED, ticket)
+    bump_inventory_version(_inventory(ticket.train, ticket.journey_date))
 
     return ticket, None
 
 
-def handle_promotions(ticket):
+def handle_promotions(ticket, released_berth=None):
+    """
+    Promote queued tickets into the capacity freed by ``ticket``.
+
+    The released berth is passed straight to the promoted ticket rather than going back
+    through the availability pool. Returns the berth nobody claimed, if any.
+    """
+    inventory = _inventory(ticket.train, ticket.journey_date)
     if ticket.ticket_type == CONFIRMED:
-        promote_next_rac_ticket()
+        if released_berth:
+            released_berth = promote_next_rac_ticket(released_berth, inventory, ticket.quota)
+        else:
+            # A child's seat frees quota but no berth a RAC passenger could move to.
+            release_quota(inventory, ticket.quota)
 
-    promote_next_waiting_list_ticket()
+    if ticket.ticket_type != WAITING_LIST:
+        released_berth = promote_next_waiting_list_ticket(released_berth, inventory)
 
+    return released_berth
 
-def promote_next_rac_ticket():
-    next_rac_ticket = Ticket.objects.filter(ticket_type=RAC, status=BOOKED).first()
-    if next_rac_ticket:
-        next_rac_ticket.ticket_type = CONFIRMED
-        next_rac_ticket.save()
-        TicketHistory.objects.create(ticket=next_rac_ticket, action=ACTION_PROMOTED_RAC)
 
+def promote_next_rac_ticket(berth=None, inventory=None, quota=None):
+    """
+    Confirm the oldest RAC ticket onto ``berth`` and return the side-lower berth it gave up.
 
-def promote_next_waiting_list_ticket():
-    waiting_list_ticket = Ticket.objects.filter(ticket_type=WAITING_LIST, status=BOOKED).first()
-    if waiting_list_ticket:
-        waiting_list_ticket.ticket_type = RAC
-        waiting_list_ticket.save()
-        TicketHistory.objects.create(ticket=waiting_list_ticket, action=ACTION_MOVED_RAC)
+    The promoted ticket takes over the cancelled ticket's ``quota`` seat; with nobody queued
+    the seat goes back to its bucket.
+    """
+    inventory = inventory or _inventory()
+    next_rac_ticket = _next_in_queue(RAC, inventory)
+    if not next_rac_ticket:
+        release_quota(inventory, quota)
+        return berth
+
+    vacated_berth = next_rac_ticket.berth
+    next_rac_ticket.ticket_type = CONFIRMED
+    next_rac_ticket.berth = berth
+    next_rac_ticket.berth_allocation = berth.berth_type if berth else None
+    next_rac_ticket.quota = quota
+    next_rac_ticket.save(update_fields=["ticket_type", "berth", "berth_allocation", "quota"])
+    TicketHistory.objects.create(ticket=next_rac_ticket, action=ACTION_PROMOTED_RAC)
+    invalidate_ticket_status(next_rac_ticket)
+    record_event(EVENT_TICKET_CONFIRMED, next_rac_ticket)
+    return vacated_berth
+
+
+def promote_next_waiting_list_ticket(berth=None, inventory=None):
+    """Move the oldest waiting-list ticket to RAC on a released side-lower ``berth``."""
+    if not berth or berth.berth_type != SIDE_LOWER:
+        return berth
+
+    waiting_list_ticket = _next_in_queue(WAITING_LIST, inventory or _inventory())
+    if not waiting_list_ticket:
+        return berth
+
+    waiting_list_ticket.ticket_type = RAC
+    waiting_list_ticket.berth = berth
+    waiting_list_ticket.berth_allocation = berth.berth_type
+    waiting_list_ticket.save(update_fields=["ticket_type", "berth", "berth_allocation"])
+    TicketHistory.objects.create(ticket=waiting_list_ticket, action=ACTION_MOVED_RAC)
+    invalidate_ticket_status(waiting_list_ticket)
+    record_event(EVENT_TICKET_MOVED_RAC, waiting_list_ticket)
+    return None
 
 
-def get_booked_tickets():
-    return Ticket.objects.filter(status=BOOKED)
+def _next_in_queue(ticket_type, inventory):
+    """Lock and return the oldest booked ticket of ``ticket_type`` on a train run."""
+    return (
+        Ticket.objects.select_for_update(of=("self",))
+        .select_related("berth")
+        .filter(ticket_type=ticket_type, status=BOOKED, **inventory)
+        .order_by("created_at", "id")
+        .first()
+    )
+
 
+def _release_berth(berth):
+    """Return a berth to the availability pool."""
+    berth.availability_status = AVAILABLE
+    Berth.objects.filter(id=berth.id).update(availability_status=AVAILABLE, version=F("version") + 1)
 
-def get_available_berths():
-    return Berth.objects.filter(availability_status=AVAILABLE)
+
+def release_berth(berth_id):
+    """
+    Put a berth that is marked taken but held by no ticket or seat hold back into service.
+
+    The berth is handed down the promotion queues as a cancelled ticket's would be; a berth
+    for confirmed tickets first needs a free seat in its quota bucket. Returns ``(berth, error)``.
+    """
+    with on_shard(locate(Berth.objects.filter(id=berth_id))):
+        train = Train.objects.filter(berths__id=berth_id).first()
+        try:
+            with train_shard(train):
+                return _release_stuck_berth(berth_id)
+        except BookingConflict:
+            return None, BOOKING_CONFLICT
+
+
+def _release_stuck_berth(berth_id):
+    try:
+        berth = Berth.objects.select_for_update().get(id=berth_id)
+    except Berth.DoesNotExist:
+        return None, BERTH_NOT_FOUND
+
+    if berth.availability_status == AVAILABLE:
+        return None, BERTH_ALREADY_AVAILABLE
+    if berth.tickets.filter(status=BOOKED).exists():
+        return None, BERTH_IN_USE
+    inventory = _inventory(berth.train, berth.journey_date)
+    holds = SeatHold.objects.filter(status=HOLD_ACTIVE, **inventory).values_list("seats", flat=True)
+    if any(seat["berth_id"] == berth.id for seats in holds for seat in seats):
+        return None, BERTH_HELD
+
+    leftover_berth = berth
+    if berth.berth_type != SIDE_LOWER:
+        quota = claim_quota(inventory, [berth.quota, QUOTA_GENERAL])
+        if quota:
+            leftover_berth = promote_next_rac_ticket(berth, inventory, quota)
+    leftover_berth = promote_next_waiting_list_ticket(leftover_berth, inventory)
+    if leftover_berth is not berth and berth.availability_status != BOOKED:
+        # A queued ticket took the berth over.
+        berth.availability_status = BOOKED
+        Berth.objects.filter(id=berth.id).update(availability_status=BOOKED, version=F("version") + 1)
+    if leftover_berth:
+        _release_berth(leftover_berth)
+    bump_inventory_version(inventory)
+    return berth, None
+
+
+def resolve_inventory(train_number=None, journey_date=None):
+    """Turn a train number and ISO journey date from a request into inventory filters."""
+    train = None
+    if train_number:
+        train = Train.objects.using(shard_for_train(train_number)).filter(number=train_number).first()
+        if train is None:
+            return None, TRAIN_NOT_FOUND
+
+    parsed_date = None
+    if journey_date:
+        try:
+            parsed_date = parse_date(str(journey_date))
+        except ValueError:
+            parsed_date = None
+        if parsed_date is None:
+            return None, INVALID_JOURNEY_DATE
+
+    return _inventory(train, parsed_date), None
+
+
+def _scoped(queryset, inventory):
+    """Narrow a list query to one train run when one was requested."""
+    if inventory and inventory["train"]:
+        queryset = queryset.filter(train=inventory["train"])
+    if inventory and inventory["journey_date"]:
+        queryset = queryset.filter(journey_date=inventory["journey_date"])
+    return queryset
+
+
+def get_booked_tickets(inventory=None):
+    return _scoped(Ticket.objects.filter(status=BOOKED), inventory)
+
+
+def list_booked_tickets(inventory=None):
+    """Booked tickets with passenger, berth and train loaded, newest first, from every shard ``inventory`` spans."""
+    per_shard = fan_out(
+        lambda: list(
+            get_booked_tickets(inventory).select_related("passenger", "berth", "train").order_by("-created_at", "-id")
+        ),
+        inventory_shards(inventory),
+    )
+    return list(heapq.merge(*per_shard, key=lambda ticket: (ticket.created_at, ticket.id), reverse=True))
+
+
+def get_available_berths(inventory=None):
+    return _scoped(Berth.objects.filter(availability_status=AVAILABLE), inventory)
+
+
+def get_remaining_capacity(train=None, journey_date=None):
+    """Number of tickets of any type that can still be booked on a train run; held berths count as taken."""
+    inventory = _inventory(train, journey_date)
+    policy = get_quota_policy(**inventory)
+    with on_shard(shard_of(train)):
+        booked_count = Ticket.objects.filter(status=BOOKED, **inventory).count()
+        held_count = Berth.objects.filter(availability_status=RESERVED, **inventory).count()
+    return max(policy.confirmed_limit + policy.rac_limit + policy.waiting_list_limit - booked_count - held_count, 0)
+
+
+def get_quota_info(policy):
+    """Describe a quota policy for API responses."""
+    return {
+        "confirmed_limit": policy.confirmed_limit,
+        "rac_limit": policy.rac_limit,
+        "waiting_list_limit": policy.waiting_list_limit,
+        "ladies_quota": policy.ladies_quota,
+        "senior_quota": policy.senior_quota,
+        "general_quota": policy.general_quota,
+    }
 
 
 class BookingService:
@@ -197,22 +518,31 @@ class BookingService:
     REQUIRED_FIELDS = ["name", "age"]
 
     @classmethod
-    def process_booking_request(cls, passengers_data):
-        """Process multiple passenger booking requests."""
+    def process_booking_request(cls, passengers_data, train_number=None, journey_date=None):
+        """Process multiple passenger booking requests for one train run."""
         if not passengers_data:
             return cls._create_error_response("No passengers provided")
 
-        booking_results = cls._process_passenger_bookings(passengers_data)
+        inventory, error = resolve_inventory(train_number, journey_date)
+        if error:
+            return cls._create_error_response(error)
+
+        booking_results = cls._process_passenger_bookings(passengers_data, inventory)
         return cls._create_booking_response(booking_results)
 
     @classmethod
-    def _process_passenger_bookings(cls, passengers_data):
+    def _process_passenger_bookings(cls, passengers_data, inventory):
         """Process bookings for multiple passengers."""
         booked_tickets = []
         errors = []
-
-        for passenger_data in passengers_data:
-            booking_result = cls._process_single_booking(passenger_data)
+        with on_shard(shard_of(inventory["train"])):
+            berth_plan = cls._plan_group_berths(passengers_data, inventory) if len(passengers_data) > 1 else {}
+            profiles = cls._resolve_profiles(passengers_data)
+
+        for index, passenger_data in enumerate(passengers_data):
+            booking_result = cls._process_single_booking(
+                passenger_data, inventory, berth_plan.get(index), profiles.get(index)
+            )
             if booking_result.get("error"):
                 errors.append(booking_result)
             else:
@@ -221,7 +551,7 @@ class BookingService:
         return {"booked_tickets": booked_tickets, "errors": errors}
 
     @classmethod
-    def _process_single_booking(cls, passenger_data):
+    def _process_single_booking(cls, passenger_data, inventory, berth_hint=None, passenger=None):
         """Process booking for a single passenger."""
         if not cls._validate_passenger_data(passenger_data):
             return {"error": "Missing required fields", "passenger": passenger_data}
@@ -231,11 +561,56 @@ class BookingService:
             passenger_age=passenger_data.get("age"),
             gender=passenger_data.get("gender"),
             has_child=passenger_data.get("has_child", False),
-            parent_id=passenger_data.get("parent_id"),
+            berth_hint=berth_hint,
+            external_id=passenger_data.get("external_id"),
+            passenger=passenger,
+            **inventory,
         )
 
         return {"ticket": ticket} if ticket else {"error": error, "passenger": passenger_data}
 
+    @classmethod
+    def _resolve_profiles(cls, passengers_data):
+        """Look up or create the profiles of the whole group in one query, keyed by position in the request."""
+        valid = [
+            index
+            for index, data in enumerate(passengers_data)
+            if cls._validate_passenger_data(data) and data.get("gender")
+        ]
+        if not settings.PASSENGER_PROFILES or not valid:
+            return {}
+        passengers = upsert_passengers([passengers_data[index] for index in valid])
+        return dict(zip(valid, passengers))
+
+    @classmethod
+    def _plan_group_berths(cls, passengers_data, inventory):
+        """Plan adjacent general-quota berths for a group, keyed by the passenger's position in the request."""
+        confirmed_count = Ticket.objects.filter(ticket_type=CONFIRMED, status=BOOKED, **inventory).count()
+        remaining = get_quota_policy(**inventory).confirmed_limit - confirmed_count
+        seated = [
+            index
+            for index, passenger_data in enumerate(passengers_data)
+            if cls._validate_passenger_data(passenger_data) and passenger_data["age"] >= CHILD_AGE
+        ][: max(remaining, 0)]
+        if len(seated) < 2:
+            return {}
+
+        snapshot = (
+            Berth.objects.filter(availability_status=AVAILABLE, quota=QUOTA_GENERAL, **inventory)
+            .exclude(berth_type=SIDE_LOWER)
+            .values_list("id", "berth_number", "berth_type")
+        )
+        needs_lower = [
+            _needs_lower_berth(
+                passengers_data[index]["age"],
+                passengers_data[index].get("gender"),
+                passengers_data[index].get("has_child", False),
+            )
+            for index in seated
+        ]
+        plan = GroupBerthAllocator(snapshot).plan(needs_lower)
+        return {index: berth_id for index, berth_id in zip(seated, plan) if berth_id}
+
     @classmethod
     def _validate_passenger_data(cls, passenger_data):
         """Validate required passenger booking data."""
@@ -271,15 +646,41 @@ class BookingService:
 
 class AvailabilityService:
     @staticmethod
-    def get_availability_info():
-        """Get system-wide availability information."""
-        available_berths = get_available_berths()
+    def get_availability_summary(inventory=None):
+        """Get compact availability counts, as pushed to the availability stream."""
+        booked_counts, available_by_type = Counter(), Counter()
+        for booked, available in fan_out(
+            lambda: (
+                get_booked_tickets(inventory).order_by().values_list("ticket_type").annotate(count=Count("id")),
+                get_available_berths(inventory).order_by().values_list("berth_type").annotate(count=Count("id")),
+            ),
+            inventory_shards(inventory),
+        ):
+            booked_counts.update(dict(booked))
+            available_by_type.update(dict(available))
         return {
-            "available_berths": BerthSerializer(available_berths, many=True).data,
-            "available_berths_count": available_berths.count(),
-            "quotas": {
-                "confirmed_limit": CONFIRMED_BERTH_LIMIT,
-                "rac_limit": RAC_TICKET_LIMIT,
-                "waiting_list_limit": WAITING_LIST_LIMIT,
+            "version": get_inventory_version(),
+            "available_berths_count": sum(available_by_type.values()),
+            "available_by_type": dict(available_by_type),
+            "booked": {
+                "confirmed": booked_counts.get(CONFIRMED, 0),
+                "rac": booked_counts.get(RAC, 0),
+                "waiting_list": booked_counts.get(WAITING_LIST, 0),
             },
+            "quotas": get_quota_info(get_quota_policy(**(inventory or {}))),
+            "quota_buckets": get_quota_buckets(inventory),
+        }
+
+    @staticmethod
+    def get_availability_info(inventory=None):
+        """Get availability information, for one train run when ``inventory`` names one."""
+        per_shard = fan_out(
+            lambda: BerthSerializer(get_available_berths(inventory), many=True).data, inventory_shards(inventory)
+        )
+        available_berths = [berth for berths in per_shard for berth in berths]
+        return {
+            "available_berths": available_berths,
+            "available_berths_count": len(available_berths),
+            "quotas": get_quota_info(get_quota_policy(**(inventory or {}))),
+            "quota_buckets": get_quota_buckets(inventory),
         }
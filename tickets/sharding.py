@@ -0,0 +1,304 @@
+"""
+Horizontal sharding of trains across databases.
+
+Every database in ``SHARD_DATABASES`` carries the full booking schema. A train lives on exactly
+one of them together with its quota policies and counters, berths, tickets, ticket history,
+seat holds and charts, so booking stays a single-database transaction. ``TrainShard`` rows in the
+``default`` database map train numbers to shards; trains without a row and bookings without a
+train stay on ``default``, so a single-database deployment needs no configuration.
+
+Code working on one train runs inside ``on_shard``, or ``train_shard`` which also opens the
+transaction, and ``ShardRouter`` sends every query on a sharded model there. Reads spanning
+trains use ``fan_out`` to query all shards in parallel and merge the results themselves.
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from .concurrency import BookingConflict
+from .constants import TRAIN_ALREADY_ON_SHARD, TRAIN_NOT_FOUND, UNKNOWN_SHARD
+from .models import (
+    Berth,
+    Chart,
+    Passenger,
+    QuotaCounter,
+    QuotaPolicy,
+    SeatHold,
+    Ticket,
+    TicketHistory,
+    Train,
+    TrainShard,
+)
+from .throttling import timed_queries
+
+# Models stored once, in the default database, instead of on every shard.
+GLOBAL_MODELS = {"trainshard", "inventoryversion", "admissiontoken"}
+
+# Models whose ids must be unique across shards: tickets are looked up by id (the PNR) and every
+# row a train owns keeps its id when the train moves to another shard.
+STRIDED_MODELS = [Train, QuotaPolicy, QuotaCounter, Passenger, Berth, Ticket, TicketHistory, SeatHold, Chart]
+
+_current_shard = ContextVar("current_shard", default=DEFAULT_DB_ALIAS)
+
+
+class ShardRouter:
+    """Send sharded models to the current shard, or to the shard an instance was loaded from."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != "tickets":
+            return None
+        if model._meta.model_name in GLOBAL_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return current_shard()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db and obj2._state.db:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == "tickets" and model_name in GLOBAL_MODELS:
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+def shard_aliases():
+    return settings.SHARD_DATABASES
+
+
+def current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def on_shard(alias):
+    """Route queries on sharded models to the ``alias`` database for the duration of the block."""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def atomic(func):
+    """``transaction.atomic`` on the shard that is current when ``func`` is called."""
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        with transaction.atomic(using=current_shard()):
+            return func(*args, **kwargs)
+
+    return inner
+
+
+def on_commit(func):
+    """Run ``func`` once the transaction on the current shard commits."""
+    transaction.on_commit(func, using=current_shard())
+
+
+def shard_for_train(train_number):
+    """Alias of the database holding train ``train_number``."""
+    shard = TrainShard.objects.filter(train_number=train_number).values_list("shard", flat=True).first()
+    return shard or DEFAULT_DB_ALIAS
+
+
+def shard_of(train):
+    """Alias of the database ``train`` was loaded from; inventory without a train is on the current shard."""
+    return train._state.db if train is not None else current_shard()
+
+
+def inventory_shards(inventory):
+    """Shards a read over ``inventory`` has to visit: the train's own, or every shard when no train is named."""
+    if inventory and inventory["train"]:
+        return [shard_of(inventory["train"])]
+    return list(shard_aliases())
+
+
+@contextmanager
+def train_shard(train):
+    """
+    Run the block in a transaction on the shard of ``train``.
+
+    With several shards the transaction holds a shared advisory lock on the train, which
+    ``move_train`` waits for, and raises ``BookingConflict`` when the train is being moved or
+    has moved away since it was looked up. Take it before locking any row of the train.
+    """
+    alias = shard_of(train)
+    with on_shard(alias), transaction.atomic(using=alias):
+        if train is not None and len(shard_aliases()) > 1:
+            _advisory_lock(alias, train, "pg_advisory_xact_lock_shared")
+            entry = TrainShard.objects.filter(train_number=train.number).values_list("shard", "moving").first()
+            shard, moving = entry or (DEFAULT_DB_ALIAS, False)
+            if moving or shard != alias:
+                raise BookingConflict
+        yield alias
+
+
+def fan_out(func, aliases=None):
+    """
+    Call ``func()`` once on every shard, inside ``on_shard``, and return the results in shard order.
+
+    With several shards the calls run in parallel threads, each on its own connections, which
+    are closed when the call returns.
+    """
+    aliases = list(aliases or shard_aliases())
+    if len(aliases) == 1:
+        with on_shard(aliases[0]):
+            return [func()]
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        return list(executor.map(functools.partial(_call_on_shard, func), aliases))
+
+
+def _call_on_shard(func, alias):
+    try:
+        with on_shard(alias), timed_queries([alias]):
+            return func()
+    finally:
+        connections.close_all()
+
+
+def locate(*querysets):
+    """Alias of the first shard where any of ``querysets`` has a row, or the current shard when none does."""
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return current_shard()
+    found = fan_out(lambda: any(queryset.exists() for queryset in querysets), aliases)
+    return next((alias for alias, hit in zip(aliases, found) if hit), current_shard())
+
+
+def stride_id_sequences():
+    """
+    Let each shard hand out its own residue class of ids, above every id in use on any shard.
+
+    Shard ``i`` of ``n`` gets ids congruent to ``i`` modulo ``n``, so ids of the strided models
+    never collide across shards. PostgreSQL only; run it after adding a shard, before the new
+    shard takes bookings.
+    """
+    aliases = shard_aliases()
+    for model in STRIDED_MODELS:
+        highest = max(model.objects.using(alias).aggregate(highest=Max("id"))["highest"] or 0 for alias in aliases)
+        for index, alias in enumerate(aliases):
+            start = highest + 1 + (index - highest - 1) % len(aliases)
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [model._meta.db_table])
+                (sequence,) = cursor.fetchone()
+                cursor.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {len(aliases)} RESTART WITH {start}")
+
+
+def move_train(train_number, target):
+    """
+    Move a train and everything it owns to the ``target`` shard; returns ``(tickets_moved, error)``.
+
+    The directory marks the train as moving first, so new bookings on it fail with
+    ``BookingConflict``, and the copy waits for bookings already in flight. Rows keep their
+    ids. Outbox events and archived tickets stay where they were written. If the move fails
+    after the target committed, rerunning it replaces the partial copy.
+    """
+    from .inventory import bump_inventory_version  # inventory imports this module
+
+    if target not in shard_aliases():
+        return None, UNKNOWN_SHARD
+    source = shard_for_train(train_number)
+    if source == target:
+        return None, TRAIN_ALREADY_ON_SHARD
+    if not Train.objects.using(source).filter(number=train_number).exists():
+        return None, TRAIN_NOT_FOUND
+
+    TrainShard.objects.update_or_create(train_number=train_number, defaults={"shard": source, "moving": True})
+    try:
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            train = Train.objects.using(source).get(number=train_number)
+            _advisory_lock(source, train, "pg_advisory_xact_lock")
+            _delete_train(target, train_number)
+            moved = _copy_train(train, source, target)
+            _delete_train(source, train_number)
+    except Exception:
+        TrainShard.objects.filter(train_number=train_number).update(moving=False)
+        raise
+
+    TrainShard.objects.filter(train_number=train_number).update(shard=target, moving=False)
+    bump_inventory_version()
+    return moved, None
+
+
+def _advisory_lock(alias, train, function):
+    connection = connections[alias]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT {function}(%s)", [train.pk])
+
+
+def _copy_train(train, source, target):
+    tickets = list(Ticket.objects.using(source).filter(train=train))
+    passenger_ids = _copy_passengers({ticket.passenger_id for ticket in tickets}, source, target)
+    for ticket in tickets:
+        ticket.passenger_id = passenger_ids[ticket.passenger_id]
+
+    _copy_rows(Train, [train], target)
+    for model in (QuotaPolicy, QuotaCounter, Berth):
+        _copy_rows(model, list(model.objects.using(source).filter(train=train)), target)
+    _copy_rows(Ticket, tickets, target)
+    _copy_rows(TicketHistory, list(TicketHistory.objects.using(source).filter(ticket__train=train)), target)
+    for model in (SeatHold, Chart):
+        _copy_rows(model, list(model.objects.using(source).filter(train=train)), target)
+    return len(tickets)
+
+
+def _copy_passengers(passenger_ids, source, target):
+    """Copy the passengers of moved tickets; returns their ids on the target, where profiles may already exist."""
+    passengers = list(Passenger.objects.using(source).filter(id__in=passenger_ids))
+    profiles = dict(
+        Passenger.objects.using(target)
+        .filter(lookup_key__in=[passenger.lookup_key for passenger in passengers if passenger.lookup_key])
+        .values_list("lookup_key", "id")
+    )
+    present = set(Passenger.objects.using(target).filter(id__in=passenger_ids).values_list("id", flat=True))
+
+    target_ids, missing = {}, []
+    for passenger in passengers:
+        target_ids[passenger.id] = profiles.get(passenger.lookup_key, passenger.id)
+        if passenger.lookup_key not in profiles and passenger.id not in present:
+            missing.append(passenger)
+    _copy_rows(Passenger, missing, target)
+    return target_ids
+
+
+def _copy_rows(model, rows, target):
+    """Insert ``rows`` on ``target`` as they are, including the timestamps ``bulk_create`` would overwrite."""
+    stamped = [
+        field.name
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    stamps = [[getattr(row, name) for name in stamped] for row in rows]
+    model.objects.using(target).bulk_create(rows, batch_size=1000)
+    if stamped and rows:
+        for row, values in zip(rows, stamps):
+            for name, value in zip(stamped, values):
+                setattr(row, name, value)
+        model.objects.using(target).bulk_update(rows, stamped, batch_size=1000)
+
+
+def _delete_train(alias, train_number):
+    train = Train.objects.using(alias).filter(number=train_number).first()
+    if train is None:
+        return
+    passenger_ids = list(Ticket.objects.using(alias).filter(train=train).values_list("passenger_id", flat=True))
+    for model in (SeatHold, Chart):
+        model.objects.using(alias).filter(train=train).delete()
+    TicketHistory.objects.using(alias).filter(ticket__train=train).delete()
+    for model in (Ticket, Berth, QuotaCounter, QuotaPolicy):
+        model.objects.using(alias).filter(train=train).delete()
+    train.delete()
+    Passenger.objects.using(alias).filter(id__in=passenger_ids, tickets__isnull=True).delete()
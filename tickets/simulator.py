@@ -0,0 +1,398 @@
+"""
+Offline allocation-policy simulator.
+
+``AllocationSimulator`` replays booking and cancellation traces against an in-memory model of
+one train run. It applies the same rules as the service layer:
+- confirmed seats come from quota buckets (``eligible_quotas``, ``bucket_capacities``), with
+  berths taken from the bucket's pool, lower berths first for ``_needs_lower_berth`` passengers
+- RAC tickets get a side-lower berth, and the waiting list takes no berth
+- cancellations promote the oldest RAC ticket onto the released berth, then move the oldest
+  waiting-list ticket onto a released side-lower berth
+
+It never touches the database, so quota and rule changes can be tried on large synthetic or
+recorded traces. ``verify_against_service`` replays a small trace through ``book_ticket`` and
+``cancel_ticket`` in a rolled-back transaction and reports every outcome that differs.
+"""
+
+import heapq
+import random
+
+from django.db import transaction
+
+from .constants import (
+    ACTION_CANCELED,
+    ALREADY_CANCELED,
+    BERTH_TYPES,
+    BOOKED,
+    CANCELED,
+    CHILD_AGE,
+    COMPARTMENT_LAYOUT,
+    CONFIRMED,
+    GENDER_FEMALE,
+    GENDER_MALE,
+    LOWER,
+    NO_BERTH_AVAILABLE,
+    NO_TICKETS_AVAILABLE,
+    QUOTA_GENERAL,
+    QUOTA_LADIES,
+    QUOTA_SENIOR,
+    RAC,
+    SENIOR_AGE,
+    SIDE_LOWER,
+    TICKET_NOT_FOUND,
+    WAITING_LIST,
+)
+from .quotas import bucket_capacities, eligible_quotas
+from .services import _needs_lower_berth
+
+BOOK = "book"
+CANCEL = "cancel"
+
+# Confirmed berths are picked like the service layer does: by type name, then by berth number.
+CONFIRMED_BERTH_ORDER = sorted(berth_type for berth_type, _ in BERTH_TYPES if berth_type != SIDE_LOWER)
+
+
+class SimPassenger:
+    __slots__ = ("age", "gender", "is_child")
+
+    def __init__(self, age, gender):
+        self.age = age
+        self.gender = gender
+        self.is_child = age < CHILD_AGE
+
+
+class SimTicket:
+    __slots__ = ("id", "ticket_type", "status", "berth", "quota", "was_waiting")
+
+    def __init__(self, ticket_id, ticket_type, berth, quota):
+        self.id = ticket_id
+        self.ticket_type = ticket_type
+        self.status = BOOKED
+        self.berth = berth
+        self.quota = quota
+        self.was_waiting = ticket_type == WAITING_LIST
+
+
+class AllocationSimulator:
+    """
+    In-memory model of one train run.
+
+    ``policy`` is anything with the ``QuotaPolicy`` limit attributes, such as an unsaved
+    ``QuotaPolicy``. ``berths`` lists the berth types in berth-number order and defaults to
+    ``compartments`` compartments of the standard layout.
+    """
+
+    def __init__(self, policy, compartments=9, berths=None):
+        self.policy = policy
+        self.berth_types = list(berths or COMPARTMENT_LAYOUT * compartments)
+        self.capacity = bucket_capacities(policy, self.berth_types)
+        self.booked = dict.fromkeys(self.capacity, 0)
+        self.berth_quota = self._assign_berth_pools()
+        self.free = {}
+        for berth_id, berth_type in enumerate(self.berth_types, 1):
+            heapq.heappush(self.free.setdefault((self.berth_quota[berth_id], berth_type), []), berth_id)
+
+        self.tickets = {}
+        self.booking_refs = []
+        self.rac_queue = []
+        self.waiting_queue = []
+        self.rac_count = 0
+        self.waiting_count = 0
+        self.stats = dict.fromkeys(
+            (
+                "bookings",
+                "cancellations",
+                "confirmed",
+                "rac",
+                "waiting_list",
+                "rejected",
+                "no_berth",
+                "promoted_to_confirmed",
+                "moved_to_rac",
+                "cancel_errors",
+            ),
+            0,
+        )
+        self.peak_occupied = 0
+        self.occupied = 0
+
+    def _assign_berth_pools(self):
+        """Same pools as ``create_quota_buckets``: first lower berths for seniors, next berths for ladies."""
+        seated = [berth_id for berth_id, berth_type in enumerate(self.berth_types, 1) if berth_type != SIDE_LOWER]
+        lower = [berth_id for berth_id in seated if self.berth_types[berth_id - 1] == LOWER]
+        senior = set(lower[: self.capacity[QUOTA_SENIOR]])
+        ladies = [berth_id for berth_id in seated if berth_id not in senior][: self.capacity[QUOTA_LADIES]]
+        quotas = dict.fromkeys(range(1, len(self.berth_types) + 1), QUOTA_GENERAL)
+        quotas.update(dict.fromkeys(senior, QUOTA_SENIOR))
+        quotas.update(dict.fromkeys(ladies, QUOTA_LADIES))
+        return quotas
+
+    def run(self, trace):
+        """Replay ``trace`` and return the outcome of every event, in order."""
+        return [self.apply(event) for event in trace]
+
+    def apply(self, event):
+        if event[0] == BOOK:
+            return self.book(*event[1:])
+        return self.cancel(event[1])
+
+    def book(self, age, gender, has_child=False):
+        """Book one passenger; returns ``(ticket_id, ticket_type, berth_id)`` or ``(None, error, None)``."""
+        self.stats["bookings"] += 1
+        self.booking_refs.append(None)
+        passenger = SimPassenger(age, gender)
+        quota = next((quota for quota in eligible_quotas(passenger) if self.booked[quota] < self.capacity[quota]), None)
+        if quota:
+            self.booked[quota] += 1
+            ticket_type = CONFIRMED
+        elif self.rac_count < self.policy.rac_limit and (
+            passenger.is_child or self.free.get((QUOTA_GENERAL, SIDE_LOWER))
+        ):
+            ticket_type = RAC
+        elif self.waiting_count < self.policy.waiting_list_limit:
+            ticket_type = WAITING_LIST
+        else:
+            self.stats["rejected"] += 1
+            return None, NO_TICKETS_AVAILABLE, None
+
+        berth = None
+        if not passenger.is_child:
+            if ticket_type == CONFIRMED:
+                berth = self._take_confirmed_berth(quota, _needs_lower_berth(age, gender, has_child))
+            elif ticket_type == RAC:
+                berth = self._take_berth(QUOTA_GENERAL, SIDE_LOWER)
+            if berth is None and ticket_type != WAITING_LIST:
+                if quota:
+                    self.booked[quota] -= 1
+                self.stats["no_berth"] += 1
+                return None, NO_BERTH_AVAILABLE, None
+
+        ticket = SimTicket(len(self.tickets) + 1, ticket_type, berth, quota)
+        self.tickets[ticket.id] = self.booking_refs[-1] = ticket
+        if ticket_type == CONFIRMED:
+            self.stats["confirmed"] += 1
+        elif ticket_type == RAC:
+            self.stats["rac"] += 1
+            self.rac_count += 1
+            heapq.heappush(self.rac_queue, ticket.id)
+        else:
+            self.stats["waiting_list"] += 1
+            self.waiting_count += 1
+            heapq.heappush(self.waiting_queue, ticket.id)
+        return ticket.id, ticket_type, berth
+
+    def _take_confirmed_berth(self, quota, needs_lower):
+        if needs_lower:
+            berth = self._take_berth(quota, LOWER)
+            if berth:
+                return berth
+        for berth_type in CONFIRMED_BERTH_ORDER:
+            berth = self._take_berth(quota, berth_type)
+            if berth:
+                return berth
+        return None
+
+    def _take_berth(self, quota, berth_type):
+        pool = self.free.get((quota, berth_type))
+        if not pool:
+            return None
+        self.occupied += 1
+        self.peak_occupied = max(self.peak_occupied, self.occupied)
+        return heapq.heappop(pool)
+
+    def _release_berth(self, berth):
+        self.occupied -= 1
+        heapq.heappush(self.free[(self.berth_quota[berth], self.berth_types[berth - 1])], berth)
+
+    def cancel(self, booking):
+        """
+        Cancel the ticket of the ``booking``-th booking (1-based) and run the promotions.
+
+        Returns ``(ticket_id, error)``; cancelling a booking that was refused is ``TICKET_NOT_FOUND``.
+        """
+        ticket = self.booking_refs[booking - 1] if 0 < booking <= len(self.booking_refs) else None
+        if ticket is None:
+            self.stats["cancel_errors"] += 1
+            return None, TICKET_NOT_FOUND
+        if ticket.status == CANCELED:
+            self.stats["cancel_errors"] += 1
+            return None, ALREADY_CANCELED
+
+        self.stats["cancellations"] += 1
+        released, ticket.berth, ticket.status = ticket.berth, None, CANCELED
+        if ticket.ticket_type == RAC:
+            self.rac_count -= 1
+        elif ticket.ticket_type == WAITING_LIST:
+            self.waiting_count -= 1
+
+        if ticket.ticket_type == CONFIRMED:
+            if released:
+                released = self._promote_rac(released, ticket.quota)
+            elif ticket.quota:
+                # A child's seat frees quota but no berth a RAC passenger could move to.
+                self.booked[ticket.quota] -= 1
+        if ticket.ticket_type != WAITING_LIST:
+            released = self._promote_waiting(released)
+        if released:
+            self._release_berth(released)
+        return ticket.id, None
+
+    def _next_in_queue(self, queue, ticket_type):
+        while queue:
+            ticket = self.tickets[queue[0]]
+            if ticket.status == BOOKED and ticket.ticket_type == ticket_type:
+                return ticket
+            heapq.heappop(queue)
+        return None
+
+    def _promote_rac(self, berth, quota):
+        ticket = self._next_in_queue(self.rac_queue, RAC)
+        if ticket is None:
+            if quota:
+                self.booked[quota] -= 1
+            return berth
+
+        heapq.heappop(self.rac_queue)
+        self.rac_count -= 1
+        self.stats["promoted_to_confirmed"] += 1
+        vacated, ticket.berth, ticket.ticket_type, ticket.quota = ticket.berth, berth, CONFIRMED, quota
+        return vacated
+
+    def _promote_waiting(self, berth):
+        if not berth or self.berth_types[berth - 1] != SIDE_LOWER:
+            return berth
+        ticket = self._next_in_queue(self.waiting_queue, WAITING_LIST)
+        if ticket is None:
+            return berth
+
+        heapq.heappop(self.waiting_queue)
+        self.waiting_count -= 1
+        self.rac_count += 1
+        heapq.heappush(self.rac_queue, ticket.id)
+        self.stats["moved_to_rac"] += 1
+        ticket.ticket_type, ticket.berth = RAC, berth
+        return None
+
+    def report(self):
+        """Utilization, confirmation and waiting-list clearance figures for the replayed trace."""
+        issued = len(self.tickets)
+        active = [ticket for ticket in self.tickets.values() if ticket.status == BOOKED]
+        waiting_issued = sum(ticket.was_waiting for ticket in self.tickets.values())
+        waiting_cleared = sum(
+            ticket.was_waiting and ticket.ticket_type != WAITING_LIST for ticket in self.tickets.values()
+        )
+        berths = len(self.berth_types)
+        return {
+            **self.stats,
+            "tickets_issued": issued,
+            "berths": berths,
+            "berth_utilization": round(self.occupied / berths, 4) if berths else 0.0,
+            "peak_berth_utilization": round(self.peak_occupied / berths, 4) if berths else 0.0,
+            "confirmation_rate": round(self.stats["confirmed"] / issued, 4) if issued else 0.0,
+            "final_confirmation_rate": (
+                round(sum(ticket.ticket_type == CONFIRMED for ticket in active) / len(active), 4) if active else 0.0
+            ),
+            "waiting_list_clearance": round(waiting_cleared / waiting_issued, 4) if waiting_issued else 0.0,
+            "quota_buckets": {
+                quota: {"capacity": self.capacity[quota], "booked": self.booked[quota]} for quota in self.capacity
+            },
+        }
+
+
+def synthetic_trace(
+    events, cancel_rate=0.2, senior_share=0.15, female_share=0.45, child_share=0.05, with_child_share=0.05, seed=None
+):
+    """
+    Generate a random trace of ``events`` bookings and cancellations.
+
+    Cancellations refer to an earlier booking by its 1-based position among the bookings;
+    bookings are ``(BOOK, age, gender, has_child)``.
+    """
+    rng = random.Random(seed)
+    trace = []
+    bookings = 0
+    for _ in range(events):
+        if bookings and rng.random() < cancel_rate:
+            trace.append((CANCEL, rng.randint(1, bookings)))
+            continue
+        bookings += 1
+        roll = rng.random()
+        if roll < child_share:
+            age = rng.randint(0, CHILD_AGE - 1)
+        elif roll < child_share + senior_share:
+            age = rng.randint(SENIOR_AGE, 85)
+        else:
+            age = rng.randint(CHILD_AGE, SENIOR_AGE - 1)
+        gender = GENDER_FEMALE if rng.random() < female_share else GENDER_MALE
+        trace.append((BOOK, age, gender, gender == GENDER_FEMALE and rng.random() < with_child_share))
+    return trace
+
+
+def recorded_trace(tickets):
+    """
+    Build a trace from stored tickets, in the order they were booked and canceled.
+
+    ``tickets`` is a ``Ticket`` queryset, for example of one train run. Whether a passenger
+    travelled with a child is not stored, so recorded bookings never claim it.
+    """
+    events = []
+    tickets = tickets.select_related("passenger").prefetch_related("history").order_by("created_at", "id")
+    for booking, ticket in enumerate(tickets, 1):
+        events.append((ticket.created_at, 0, (BOOK, ticket.passenger.age, ticket.passenger.gender, False)))
+        for history in ticket.history.all():
+            if history.action == ACTION_CANCELED:
+                events.append((history.timestamp, 1, (CANCEL, booking)))
+    return [event for _, _, event in sorted(events, key=lambda event: event[:2])]
+
+
+def verify_against_service(trace, policy, compartments=9, berths=None):
+    """
+    Replay ``trace`` through the simulator and the real service layer and list the differences.
+
+    The service-layer run books against a scratch train inside a transaction that is rolled
+    back, so nothing is kept. Each difference is ``(event_index, simulated, actual)``, where
+    outcomes are the ticket type (or error) and berth number of a booking, or the error of a
+    cancellation. Meant for small traces.
+    """
+    from .models import Berth, QuotaPolicy, Train
+    from .services import book_ticket, cancel_ticket
+
+    simulator = AllocationSimulator(policy, compartments, berths)
+    simulated = simulator.run(trace)
+    actual = []
+    with transaction.atomic():
+        train = Train.objects.create(number=f"SIM{random.randrange(10**6):06d}", name="Allocation simulator")
+        QuotaPolicy.objects.create(
+            train=train,
+            confirmed_limit=policy.confirmed_limit,
+            rac_limit=policy.rac_limit,
+            waiting_list_limit=policy.waiting_list_limit,
+            ladies_quota=policy.ladies_quota,
+            senior_quota=policy.senior_quota,
+        )
+        Berth.objects.bulk_create(
+            [
+                Berth(train=train, berth_number=number, berth_type=berth_type)
+                for number, berth_type in enumerate(simulator.berth_types, 1)
+            ]
+        )
+        bookings = []
+        for event in trace:
+            if event[0] == BOOK:
+                _, age, gender, has_child = event
+                ticket, error = book_ticket(f"sim-{len(actual)}", age, gender, has_child, train=train)
+                bookings.append(ticket.id if ticket else None)
+                if ticket:
+                    actual.append((ticket.ticket_type, ticket.berth.berth_number if ticket.berth else None))
+                else:
+                    actual.append(error)
+            else:
+                ticket_id = bookings[event[1] - 1] if 0 < event[1] <= len(bookings) else None
+                actual.append(cancel_ticket(ticket_id)[1] if ticket_id else TICKET_NOT_FOUND)
+        transaction.set_rollback(True)
+
+    expected = [
+        (outcome[1], outcome[2]) if event[0] == BOOK and outcome[0] else outcome[1]
+        for event, outcome in zip(trace, simulated)
+    ]
+    return [(index, sim, real) for index, (sim, real) in enumerate(zip(expected, actual)) if sim != real]
@@ -0,0 +1,136 @@
+"""
+Read-through cache of ticket status.
+
+Customers poll the status of their ticket (type, berth and RAC/waiting-list position) far
+more often than it changes. Status is cached per ticket together with the queue generation of
+its train run at the time it was read. Cancellations and promotions move every queued ticket
+behind them, so instead of deleting entries one by one they replace the run's generation once
+the change commits, which turns every cached status of that run stale at once. Bookings only
+append to the queues and leave the generation alone.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .constants import BOOKED, CONFIRMED, TICKET_NOT_FOUND
+from .lifecycle import find_ticket
+from .models import ArchivedTicket, Ticket
+from .sharding import locate, on_commit, on_shard
+
+
+def get_ticket_status(ticket_id):
+    """Return ``(status, error)`` for a ticket id (PNR), from the cache when it is still current."""
+    return get_ticket_statuses([ticket_id])[ticket_id]
+
+
+def get_ticket_statuses(ticket_ids):
+    """Look up several tickets, such as a group booking, with one cache round trip for the hits."""
+    entries = cache.get_many([_status_key(ticket_id) for ticket_id in ticket_ids])
+    generations = cache.get_many({entry["run"] for entry in entries.values() if entry["run"]})
+
+    results = {}
+    for ticket_id in ticket_ids:
+        entry = entries.get(_status_key(ticket_id))
+        if entry and (entry["run"] is None or generations.get(entry["run"]) == entry["generation"]):
+            results[ticket_id] = entry["status"], None
+        else:
+            results[ticket_id] = _load(ticket_id)
+    return results
+
+
+def invalidate_ticket_status(ticket):
+    """Mark every cached status on the ticket's train run stale once the current transaction commits."""
+    run = _run_key(ticket.train_id, ticket.journey_date)
+    on_commit(lambda: cache.set(run, time.time_ns(), None))
+
+
+def _load(ticket_id):
+    with on_shard(locate(Ticket.objects.filter(id=ticket_id), ArchivedTicket.objects.filter(id=ticket_id))):
+        return _load_from_shard(ticket_id)
+
+
+def _load_from_shard(ticket_id):
+    run = generation = None
+    live = Ticket.objects.filter(id=ticket_id).values_list("train_id", "journey_date").first()
+    if live:
+        # Read the generation before the ticket, so a change committed in between leaves the entry stale.
+        run = _run_key(*live)
+        generation = _current_generation(run)
+
+    ticket, archived = find_ticket(ticket_id)
+    if ticket is None:
+        return None, TICKET_NOT_FOUND
+    if archived:
+        # Archived tickets never change again.
+        run = generation = None
+    status = _archived_status(ticket) if archived else _live_status(ticket)
+
+    cache.set(
+        _status_key(ticket_id),
+        {"status": status, "run": run, "generation": generation},
+        settings.TICKET_STATUS_CACHE_TIMEOUT,
+    )
+    return status, None
+
+
+def _current_generation(run):
+    generation = cache.get(run)
+    if generation is None:
+        cache.add(run, time.time_ns(), None)
+        generation = cache.get(run)
+    return generation
+
+
+def _live_status(ticket):
+    berth = ticket.berth
+    queue_position = None
+    if ticket.status == BOOKED and ticket.ticket_type != CONFIRMED:
+        queue = Ticket.objects.filter(
+            ticket_type=ticket.ticket_type, status=BOOKED, train_id=ticket.train_id, journey_date=ticket.journey_date
+        )
+        queue_position = (
+            queue.filter(
+                Q(created_at__lt=ticket.created_at) | Q(created_at=ticket.created_at, id__lt=ticket.id)
+            ).count()
+            + 1
+        )
+    return {
+        "id": ticket.id,
+        "ticket_type": ticket.ticket_type,
+        "status": ticket.status,
+        "queue_position": queue_position,
+        "passenger_name": ticket.passenger.name,
+        "train": ticket.train.number if ticket.train_id else None,
+        "journey_date": ticket.journey_date,
+        "quota": ticket.quota,
+        "berth_number": berth.berth_number if berth else None,
+        "berth_type": berth.berth_type if berth else None,
+        "archived": False,
+    }
+
+
+def _archived_status(ticket):
+    return {
+        "id": ticket.id,
+        "ticket_type": ticket.ticket_type,
+        "status": ticket.status,
+        "queue_position": None,
+        "passenger_name": ticket.passenger_name,
+        "train": ticket.train_number,
+        "journey_date": ticket.journey_date,
+        "quota": ticket.quota,
+        "berth_number": ticket.berth_number,
+        "berth_type": ticket.berth_type,
+        "archived": True,
+    }
+
+
+def _status_key(ticket_id):
+    return f"ticket-status:{ticket_id}"
+
+
+def _run_key(train_id, journey_date):
+    return f"ticket-queue:{train_id}:{journey_date}"
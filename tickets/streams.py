@@ -0,0 +1,202 @@
+"""
+Server-Sent Events stream of availability changes.
+
+Clients narrow the stream with ``?train=<number>&journey_date=<YYYY-MM-DD>`` (either or both),
+as on the list endpoints, or get the totals over every run without them. Each worker process
+runs one ``AvailabilityHub``. The hub LISTENs for inventory changes on PostgreSQL (so changes
+committed by other workers arrive too); each notification names the run that changed, or none
+for jobs that change many runs.
+At most ``SSE_MAX_UPDATES_PER_SECOND`` times a second the hub recomputes the summaries that
+changed and fans each delta out to the clients of that summary only. Clients that fall behind
+get their pending deltas merged, so an idle or slow connection costs one small dict and never
+queues up events.
+"""
+
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .inventory import INVENTORY_CHANNEL
+from .services import AvailabilityService, resolve_inventory
+
+AVAILABILITY_STREAM_PATH = "/api/v1/tickets/stream/availability"
+
+
+class Subscriber:
+    """One connected client and the changes it has not been sent yet."""
+
+    def __init__(self, snapshot):
+        self.pending = dict(snapshot or {})
+        self.changed = asyncio.Event()
+        if self.pending:
+            self.changed.set()
+
+    def push(self, delta):
+        self.pending.update(delta)
+        self.changed.set()
+
+    def drain(self):
+        pending, self.pending = self.pending, {}
+        self.changed.clear()
+        return pending
+
+
+def subscription_key(inventory):
+    """Key of the summary a stream watches: ``"<train>:<date>"``, either part empty when not filtered on."""
+    inventory = inventory or {}
+    train, journey_date = inventory.get("train"), inventory.get("journey_date")
+    return f"{train.number if train else ''}:{journey_date or ''}"
+
+
+class AvailabilityHub:
+    """
+    In-process pub/sub for availability deltas, fed by PostgreSQL LISTEN/NOTIFY.
+
+    Subscribers are grouped by ``subscription_key``, so each summary is computed once however many
+    clients watch it.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.inventories = {}
+        self.snapshots = {}
+        self._dirty = set()
+        self._changed = None
+        self._listener = None
+        self._task = None
+
+    async def subscribe(self, inventory=None):
+        self._start()
+        key = subscription_key(inventory)
+        self.inventories.setdefault(key, inventory)
+        if key not in self.snapshots:
+            await self._publish({key})
+        subscriber = Subscriber(self.snapshots[key])
+        self.subscribers.setdefault(key, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for key, subscribers in list(self.subscribers.items()):
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[key]
+                self.inventories.pop(key, None)
+                self.snapshots.pop(key, None)
+
+    def _start(self):
+        if self._task:
+            return
+        self._changed = asyncio.Event()
+        self._listen()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _listen(self):
+        """Attach a dedicated LISTEN connection to the event loop; fall back to polling without PostgreSQL."""
+        listener = connections.create_connection("default")
+        if listener.vendor != "postgresql":
+            return
+        listener.ensure_connection()
+        raw_connection = listener.connection
+        raw_connection.autocommit = True
+        with raw_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {INVENTORY_CHANNEL}")
+        asyncio.get_running_loop().add_reader(raw_connection, self._on_notify, raw_connection)
+        self._listener = listener
+
+    def _on_notify(self, raw_connection):
+        raw_connection.poll()
+        for notify in raw_connection.notifies:
+            if notify.payload:
+                # A change to one run also changes the summaries of its train, its date and every run.
+                train_number, journey_date = notify.payload.split(":", 1)
+                self._dirty.update((notify.payload, f"{train_number}:", f":{journey_date}", subscription_key(None)))
+            else:
+                self._dirty.update(self.subscribers)
+        raw_connection.notifies.clear()
+        self._changed.set()
+
+    async def _run(self):
+        interval = 1 / settings.SSE_MAX_UPDATES_PER_SECOND
+        while True:
+            if self._listener:
+                await self._changed.wait()
+                self._changed.clear()
+            # Sleeping after each publish coalesces bursts of changes into one update per interval.
+            await self._publish(self._take_dirty())
+            await asyncio.sleep(interval)
+
+    def _take_dirty(self):
+        """Keys of the summaries to recompute: those notified as changed, or every one when polling."""
+        if not self._listener:
+            return set(self.subscribers)
+        dirty, self._dirty = self._dirty, set()
+        return dirty & set(self.subscribers)
+
+    async def _publish(self, keys):
+        for key in keys:
+            summary = await sync_to_async(AvailabilityService.get_availability_summary)(self.inventories.get(key))
+            snapshot = self.snapshots.get(key)
+            delta = {name: value for name, value in summary.items() if (snapshot or {}).get(name) != value}
+            self.snapshots[key] = summary
+            # The version moves with every run; a run whose own figures are unchanged is not woken.
+            if snapshot is None or set(delta) == {"version"}:
+                continue
+            for subscriber in self.subscribers.get(key, ()):
+                subscriber.push(delta)
+
+
+hub = AvailabilityHub()
+
+
+async def availability_stream(scope, receive, send):
+    """ASGI application streaming availability deltas as Server-Sent Events."""
+    await receive()  # The request body of a GET is empty.
+    query = parse_qs(scope.get("query_string", b"").decode())
+    inventory, error = await sync_to_async(resolve_inventory)(
+        query.get("train", [None])[0], query.get("journey_date", [None])[0]
+    )
+    if error:
+        body = json.dumps({"error": error}).encode()
+        await send({"type": "http.response.start", "status": 400, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+
+    subscriber = await hub.subscribe(inventory)
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        while not disconnected.done():
+            changed = asyncio.ensure_future(subscriber.changed.wait())
+            await asyncio.wait(
+                {changed, disconnected},
+                timeout=settings.SSE_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            changed.cancel()
+            if disconnected.done():
+                break
+
+            if subscriber.changed.is_set():
+                delta = subscriber.drain()
+                body = f"id: {delta.get('version', '')}\nevent: availability\ndata: {json.dumps(delta)}\n\n"
+            else:
+                body = ": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": body.encode(), "more_body": True})
+    finally:
+        hub.unsubscribe(subscriber)
+        disconnected.cancel()
@@ -2,6 +2,17 @@ from drf_yasg import openapi
 
 from .serializers import BerthSerializer, TicketSerializer
 
+inventory_parameters = [
+    openapi.Parameter("train", openapi.IN_QUERY, description="Train number", type=openapi.TYPE_STRING),
+    openapi.Parameter(
+        "journey_date",
+        openapi.IN_QUERY,
+        description="Journey date",
+        type=openapi.TYPE_STRING,
+        format=openapi.FORMAT_DATE,
+    ),
+]
+
 cancel_ticket_schema = {
     "operation_description": "Cancels the ticket and handles the promotion logic.",
     "manual_parameters": [
@@ -36,11 +47,17 @@ cancel_ticket_schema = {
 }
 
 book_ticket_schema = {
-    "operation_description": "Books tickets for multiple passengers.",
+    "operation_description": (
+        "Books tickets for multiple passengers. In flash-sale mode, booking the train run on sale needs a "
+        "waiting-room token admitted for that run in the X-Admission-Token header, and FLASH_SALE_MAX_PASSENGERS "
+        "passengers at most."
+    ),
     "request_body": openapi.Schema(
         type=openapi.TYPE_OBJECT,
         required=["passengers"],
         properties={
+            "train": openapi.Schema(type=openapi.TYPE_STRING, description="Train number"),
+            "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
             "passengers": openapi.Schema(
                 type=openapi.TYPE_ARRAY,
                 items=openapi.Schema(
@@ -51,6 +68,9 @@ book_ticket_schema = {
                         "age": openapi.Schema(type=openapi.TYPE_INTEGER),
                         "gender": openapi.Schema(type=openapi.TYPE_STRING, enum=["M", "F"]),
                         "has_child": openapi.Schema(type=openapi.TYPE_BOOLEAN, default=False),
+                        "external_id": openapi.Schema(
+                            type=openapi.TYPE_STRING, description="Profile id, such as a loyalty number"
+                        ),
                     },
                 ),
             ),
@@ -100,12 +120,88 @@ book_ticket_schema = {
                 },
             ),
         ),
+        429: openapi.Response(
+            description="Flash sale in progress and no admitted waiting-room token was presented",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+}
+
+book_itinerary_schema = {
+    "operation_description": (
+        "Books the passengers on every leg of a journey over connecting trains, or on none of them. Each leg "
+        "gets confirmed, RAC or waiting-list tickets as a regular booking would; when the legs' trains are on "
+        "different shard databases every leg must have confirmed berths. In flash-sale mode, an itinerary with "
+        "a leg on the train run on sale needs a waiting-room token admitted for that run in the "
+        "X-Admission-Token header."
+    ),
+    "request_body": openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=["legs", "passengers"],
+        properties={
+            "legs": openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    required=["train", "journey_date"],
+                    properties={
+                        "train": openapi.Schema(type=openapi.TYPE_STRING, description="Train number"),
+                        "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                    },
+                ),
+            ),
+            "passengers": book_ticket_schema["request_body"].properties["passengers"],
+        },
+    ),
+    "responses": {
+        201: openapi.Response(
+            description="Every leg booked",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "legs": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "train": openapi.Schema(type=openapi.TYPE_STRING),
+                                "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                                "tickets": openapi.Schema(
+                                    type=openapi.TYPE_ARRAY,
+                                    items=openapi.Schema(type=openapi.TYPE_OBJECT),
+                                    description="Tickets of the leg with their berth and ticket type",
+                                ),
+                            },
+                        ),
+                    )
+                },
+            ),
+        ),
+        400: openapi.Response(
+            description="Invalid itinerary, or a leg could not be booked and nothing was booked",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "error": openapi.Schema(type=openapi.TYPE_STRING),
+                    "leg": openapi.Schema(type=openapi.TYPE_INTEGER, description="Index of the leg that failed"),
+                    "passenger": openapi.Schema(type=openapi.TYPE_OBJECT),
+                },
+            ),
+        ),
+        429: book_ticket_schema["responses"][429],
     },
 }
 
 get_booked_tickets_schema = {
-    "operation_description": "Fetches a list of all booked tickets (i.e., confirmed and RAC tickets).",
+    "operation_description": (
+        "Fetches a list of all booked tickets (i.e., confirmed and RAC tickets). Responses carry an ETag tied to "
+        "the inventory version; send it back in If-None-Match to get a 304 while nothing has changed."
+    ),
+    "manual_parameters": inventory_parameters,
     "responses": {
+        304: openapi.Response(description="Inventory unchanged since the ETag sent in If-None-Match"),
         200: openapi.Response(
             description="List of booked tickets",
             schema=openapi.Schema(
@@ -121,13 +217,18 @@ get_booked_tickets_schema = {
                     },
                 ),
             ),
-        )
+        ),
     },
 }
 
 get_available_berths_schema = {
-    "operation_description": "Fetches available berths and count information.",
+    "operation_description": (
+        "Fetches available berths and count information. Responses carry an ETag tied to the inventory version; "
+        "send it back in If-None-Match to get a 304 while nothing has changed."
+    ),
+    "manual_parameters": inventory_parameters,
     "responses": {
+        304: openapi.Response(description="Inventory unchanged since the ETag sent in If-None-Match"),
         200: openapi.Response(
             description="Available berths information",
             schema=openapi.Schema(
@@ -139,6 +240,7 @@ get_available_berths_schema = {
                             type=openapi.TYPE_OBJECT,
                             properties={
                                 "id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "berth_number": openapi.Schema(type=openapi.TYPE_INTEGER),
                                 "berth_type": openapi.Schema(type=openapi.TYPE_STRING),
                                 "status": openapi.Schema(type=openapi.TYPE_STRING),
                             },
@@ -151,10 +253,347 @@ get_available_berths_schema = {
                             "confirmed_limit": openapi.Schema(type=openapi.TYPE_INTEGER),
                             "rac_limit": openapi.Schema(type=openapi.TYPE_INTEGER),
                             "waiting_list_limit": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            "ladies_quota": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            "senior_quota": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            "general_quota": openapi.Schema(type=openapi.TYPE_INTEGER),
                         },
                     ),
+                    "quota_buckets": openapi.Schema(
+                        type=openapi.TYPE_OBJECT,
+                        description="Seats per quota bucket (general, ladies, senior)",
+                        additional_properties=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "capacity": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "booked": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "available": openapi.Schema(type=openapi.TYPE_INTEGER),
+                            },
+                        ),
+                    ),
                 },
             ),
-        )
+        ),
+    },
+}
+
+export_manifest_schema = {
+    "operation_description": (
+        "Streams the passenger manifest of all booked tickets with passenger, berth and RAC/waiting-list queue "
+        "position columns."
+    ),
+    "manual_parameters": [
+        openapi.Parameter(
+            "export_format",
+            openapi.IN_QUERY,
+            description="Export format (parquet needs pyarrow on the server)",
+            type=openapi.TYPE_STRING,
+            enum=["csv", "ndjson", "parquet"],
+            default="csv",
+        ),
+        *inventory_parameters,
+    ],
+    "responses": {
+        200: openapi.Response(description="Manifest file, streamed"),
+        400: openapi.Response(
+            description="Unsupported format",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+}
+
+waiting_room_token_response = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "token": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_UUID),
+        "status": openapi.Schema(type=openapi.TYPE_STRING, enum=["waiting", "admitted", "booking", "used", "expired"]),
+        "remaining_capacity": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "position": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "eta_seconds": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "expires_at": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+    },
+)
+
+join_waiting_room_schema = {
+    "operation_description": (
+        "Joins the flash-sale waiting room. Once admitted, send the token in the X-Admission-Token header "
+        "when booking."
+    ),
+    "responses": {
+        201: openapi.Response(description="Waiting room token issued", schema=waiting_room_token_response),
+    },
+}
+
+waiting_room_status_schema = {
+    "operation_description": "Fetches queue position and ETA, or admission details, for a waiting-room token.",
+    "manual_parameters": [
+        openapi.Parameter(
+            "token",
+            openapi.IN_PATH,
+            description="Waiting-room token",
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_UUID,
+            required=True,
+        ),
+    ],
+    "responses": {
+        200: openapi.Response(description="Waiting room status", schema=waiting_room_token_response),
+        404: openapi.Response(
+            description="Token not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+}
+
+seat_hold_token_parameter = openapi.Parameter(
+    "token",
+    openapi.IN_PATH,
+    description="Seat hold token",
+    type=openapi.TYPE_STRING,
+    format=openapi.FORMAT_UUID,
+    required=True,
+)
+
+hold_error_responses = {
+    400: openapi.Response(
+        description="Hold expired or already confirmed or released",
+        schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}),
+    ),
+    404: openapi.Response(
+        description="Hold not found",
+        schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}),
+    ),
+}
+
+hold_seats_schema = {
+    "operation_description": (
+        "Reserves confirmed berths for the passengers without booking them, for example while the client takes "
+        "payment. Confirm the hold before expires_at or the berths go back on sale. Passengers who cannot get a "
+        "confirmed seat are listed in errors and can be booked onto RAC or the waiting list with the book endpoint. "
+        "In flash-sale mode, holding seats on the train run on sale needs a waiting-room token admitted for that run "
+        "in the X-Admission-Token header."
+    ),
+    "request_body": book_ticket_schema["request_body"],
+    "responses": {
+        201: openapi.Response(
+            description="Seats held",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "token": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_UUID),
+                    "status": openapi.Schema(
+                        type=openapi.TYPE_STRING, enum=["active", "confirmed", "released", "expired"]
+                    ),
+                    "train": openapi.Schema(type=openapi.TYPE_STRING),
+                    "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                    "seats": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "name": openapi.Schema(type=openapi.TYPE_STRING),
+                                "age": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "quota": openapi.Schema(type=openapi.TYPE_STRING),
+                                "berth_number": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "berth_type": openapi.Schema(type=openapi.TYPE_STRING),
+                            },
+                        ),
+                    ),
+                    "expires_at": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+                    "errors": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                },
+            ),
+        ),
+        400: openapi.Response(
+            description="No seat could be held",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "errors": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+                },
+            ),
+        ),
+        429: book_ticket_schema["responses"][429],
+    },
+}
+
+confirm_seat_hold_schema = {
+    "operation_description": "Books confirmed tickets on the berths reserved by an active seat hold.",
+    "manual_parameters": [seat_hold_token_parameter],
+    "responses": {
+        201: book_ticket_schema["responses"][201],
+        **hold_error_responses,
+    },
+}
+
+release_seat_hold_schema = {
+    "operation_description": "Releases the berths of an active seat hold before it expires.",
+    "manual_parameters": [seat_hold_token_parameter],
+    "responses": {
+        200: openapi.Response(
+            description="Seat hold released",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"message": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+        **hold_error_responses,
+    },
+}
+
+ticket_status_response = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "id": openapi.Schema(type=openapi.TYPE_INTEGER, description="Ticket id (PNR)"),
+        "ticket_type": openapi.Schema(type=openapi.TYPE_STRING, enum=["confirmed", "RAC", "waiting-list"]),
+        "status": openapi.Schema(type=openapi.TYPE_STRING, enum=["booked", "canceled"]),
+        "queue_position": openapi.Schema(
+            type=openapi.TYPE_INTEGER, description="Position in the RAC or waiting-list queue", x_nullable=True
+        ),
+        "passenger_name": openapi.Schema(type=openapi.TYPE_STRING),
+        "train": openapi.Schema(type=openapi.TYPE_STRING),
+        "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        "quota": openapi.Schema(type=openapi.TYPE_STRING),
+        "berth_number": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "berth_type": openapi.Schema(type=openapi.TYPE_STRING),
+        "archived": openapi.Schema(type=openapi.TYPE_BOOLEAN, description="Ticket was moved to the archive"),
+    },
+)
+
+ticket_status_schema = {
+    "operation_description": (
+        "Fetches the status, berth and RAC/waiting-list position of a ticket. Served from a cache that "
+        "cancellations and promotions invalidate, so polling is cheap."
+    ),
+    "manual_parameters": [
+        openapi.Parameter(
+            "ticket_id", openapi.IN_PATH, description="Ticket id (PNR)", type=openapi.TYPE_INTEGER, required=True
+        ),
+    ],
+    "responses": {
+        200: openapi.Response(description="Ticket status", schema=ticket_status_response),
+        404: openapi.Response(
+            description="Ticket not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+}
+
+ticket_status_lookup_schema = {
+    "operation_description": "Fetches the status of several tickets at once, such as all tickets of a group booking.",
+    "manual_parameters": [
+        openapi.Parameter(
+            "ids",
+            openapi.IN_QUERY,
+            description="Comma-separated ticket ids",
+            type=openapi.TYPE_STRING,
+            required=True,
+        ),
+    ],
+    "responses": {
+        200: openapi.Response(
+            description="Ticket statuses",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "tickets": openapi.Schema(type=openapi.TYPE_ARRAY, items=ticket_status_response),
+                    "not_found": openapi.Schema(
+                        type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)
+                    ),
+                },
+            ),
+        ),
+        400: openapi.Response(
+            description="Missing, malformed or too many ticket ids",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
+    },
+}
+
+search_tickets_schema = {
+    "operation_description": (
+        "Searches tickets by passenger name fragment, passenger age, ticket type, status and booking time. Only "
+        "booked tickets are searched unless status is given. Results come newest first; pass next_cursor back as "
+        "cursor to fetch the following page."
+    ),
+    "manual_parameters": [
+        openapi.Parameter(
+            "name",
+            openapi.IN_QUERY,
+            description="Part of the passenger name, case-insensitive, at least 3 characters",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter("age_min", openapi.IN_QUERY, description="Youngest passenger age", type=openapi.TYPE_INTEGER),
+        openapi.Parameter("age_max", openapi.IN_QUERY, description="Oldest passenger age", type=openapi.TYPE_INTEGER),
+        openapi.Parameter(
+            "ticket_type",
+            openapi.IN_QUERY,
+            description="Ticket type",
+            type=openapi.TYPE_STRING,
+            enum=["confirmed", "RAC", "waiting-list"],
+        ),
+        openapi.Parameter(
+            "status",
+            openapi.IN_QUERY,
+            description="Ticket status, booked by default",
+            type=openapi.TYPE_STRING,
+            enum=["booked", "canceled"],
+        ),
+        openapi.Parameter(
+            "created_from",
+            openapi.IN_QUERY,
+            description="Booked at or after this date or time",
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+        ),
+        openapi.Parameter(
+            "created_to",
+            openapi.IN_QUERY,
+            description="Booked before this date or time",
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATETIME,
+        ),
+        openapi.Parameter("limit", openapi.IN_QUERY, description="Page size, 1 to 100", type=openapi.TYPE_INTEGER),
+        openapi.Parameter(
+            "cursor", openapi.IN_QUERY, description="next_cursor of the previous page", type=openapi.TYPE_STRING
+        ),
+    ],
+    "responses": {
+        200: openapi.Response(
+            description="A page of matching tickets",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "tickets": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Schema(
+                            type=openapi.TYPE_OBJECT,
+                            properties={
+                                "id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                                "ticket_type": openapi.Schema(type=openapi.TYPE_STRING),
+                                "status": openapi.Schema(type=openapi.TYPE_STRING),
+                                "train": openapi.Schema(type=openapi.TYPE_STRING),
+                                "journey_date": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+                                "created_at": openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME),
+                                "passenger": openapi.Schema(type=openapi.TYPE_OBJECT),
+                            },
+                        ),
+                    ),
+                    "next_cursor": openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+                },
+            ),
+        ),
+        400: openapi.Response(
+            description="Invalid filter or cursor",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)}
+            ),
+        ),
     },
 }
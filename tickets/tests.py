@@ -1,3 +1,1449 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import urllib.error
+from datetime import date, timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from drf_yasg import openapi
+from drf_yasg.generators import OpenAPISchemaGenerator
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import urls as ticket_urls
+from .admin import AFTER_VAR, TicketAdmin
+from .allocation import GroupBerthAllocator, compartment_of
+from .charts import ChartCascade, prepare_chart
+from .constants import (
+    ACTION_MOVED_RAC,
+    ACTION_PROMOTED_RAC,
+    ADMISSION_ADMITTED,
+    ADMISSION_BOOKING,
+    ADMISSION_EXPIRED,
+    ADMISSION_TOO_MANY_PASSENGERS,
+    ADMISSION_USED,
+    ADMISSION_WAITING,
+    ADMISSION_WRONG_TRAIN_RUN,
+    AVAILABLE,
+    BOOKED,
+    CANCELED,
+    CHART_ALREADY_PREPARED,
+    CHART_CLOSED,
+    CHART_PREPARED,
+    CHART_PREPARING,
+    COMPARTMENT_LAYOUT,
+    CONFIRMED,
+    EVENT_TICKET_BOOKED,
+    EVENT_TICKET_CONFIRMED,
+    EVENT_TICKET_MOVED_RAC,
+    HOLD_CONFIRMED,
+    HOLD_EXPIRED,
+    HOLD_NOT_ACTIVE,
+    HOLD_RELEASED,
+    INVALID_SEARCH_CURSOR,
+    INVALID_TICKET_IDS,
+    LOWER,
+    NO_TICKETS_AVAILABLE,
+    QUOTA_GENERAL,
+    QUOTA_LADIES,
+    QUOTA_SENIOR,
+    RAC,
+    RESERVED,
+    SEARCH_NAME_TOO_SHORT,
+    SERVICE_OVERLOADED,
+    SIDE_LOWER,
+    STATUS_LOOKUP_LIMIT,
+    TICKET_NOT_FOUND,
+    TRAIN_ALREADY_ON_SHARD,
+    UNKNOWN_SHARD,
+    WAITING_LIST,
+)
+from .holds import confirm_hold, hold_seats, release_expired_holds
+from .inventory import get_inventory_version
+from .itineraries import _book_leg, book_itinerary
+from .lifecycle import archive_batch, purge_departed_inventory
+from .management.commands.explain_hot_queries import Command as ExplainHotQueries
+from .middleware import CompressionMiddleware, brotli
+from .models import (
+    AdmissionToken,
+    Berth,
+    Chart,
+    ConsumerOffset,
+    OutboxEvent,
+    Passenger,
+    QuotaCounter,
+    QuotaPolicy,
+    SeatHold,
+    Ticket,
+    TicketHistory,
+    Train,
+    TrainShard,
+)
+from .openapi import CachedSchemaGenerator
+from .outbox import SegmentFileSink, WebhookSink, read_segments, relay_batch
+from .profiling import PROFILE_HEADER, PROFILE_ID_HEADER, ProfilingMiddleware, profile_token
+from .query_plans import regressions, summarize
+from .quotas import _split, create_quota_buckets, get_quota_buckets, rollover_quotas
+from .renderers import FastJSONRenderer, orjson
+from .search import search_tickets
+from .serializers import TicketSerializer
+from .services import AvailabilityService, book_ticket, cancel_ticket, resolve_inventory
+from .sharding import fan_out, locate, move_train, on_shard
+from .simulator import BOOK, CANCEL, AllocationSimulator, verify_against_service
+from .status import get_ticket_status
+from .streams import AvailabilityHub, subscription_key
+from .throttling import LoadMonitor, TokenBucketThrottle
+from .waiting_room import WaitingRoomService
+
+JOURNEY_DATE = date(2026, 11, 1)
+
+
+def create_ticket(name, age, ticket_type=CONFIRMED, status=BOOKED, created_at=None):
+    passenger = Passenger.objects.create(name=name, age=age, gender="M")
+    ticket = Ticket.objects.create(passenger=passenger, ticket_type=ticket_type, status=status)
+    if created_at:
+        Ticket.objects.filter(id=ticket.id).update(created_at=created_at)
+    return ticket
+
+
+def create_train_run(number, compartments=1, journey_date=JOURNEY_DATE, **policy):
+    """A train with ``compartments`` compartments of berths on ``journey_date`` and a quota policy."""
+    train = Train.objects.create(number=number, name=f"Train {number}")
+    Berth.objects.bulk_create(
+        Berth(train=train, journey_date=journey_date, berth_number=number, berth_type=berth_type)
+        for number, berth_type in enumerate(COMPARTMENT_LAYOUT * compartments, 1)
+    )
+    QuotaPolicy.objects.create(train=train, **policy)
+    return train
+
+
+def book(train, name, age=30, gender="M", journey_date=JOURNEY_DATE):
+    ticket, error = book_ticket(name, age, gender, train=train, journey_date=journey_date)
+    assert error is None, error
+    return ticket
+
+
+class SearchTicketsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.tickets = [
+            create_ticket("John Smith", 34, created_at=cls.now - timedelta(hours=3)),
+            create_ticket("Johnny Walker", 61, ticket_type=RAC, created_at=cls.now - timedelta(hours=2)),
+            create_ticket("Mary Johnson", 28, created_at=cls.now - timedelta(hours=2)),
+            create_ticket("Joan Baker", 45, status=CANCELED, created_at=cls.now - timedelta(hours=1)),
+            create_ticket("Anil Kumar", 52, created_at=cls.now),
+        ]
+
+    def search(self, **params):
+        page, error = search_tickets({key: str(value) for key, value in params.items()})
+        self.assertIsNone(error)
+        return page
+
+    def test_filters_on_name_fragment_age_type_and_status(self):
+        names = [ticket.passenger.name for ticket in self.search(name="JOHN")["tickets"]]
+        self.assertEqual(names, ["Mary Johnson", "Johnny Walker", "John Smith"])
+        self.assertEqual(len(self.search(name="john", age_min=30, age_max=40)["tickets"]), 1)
+        self.assertEqual([ticket.ticket_type for ticket in self.search(name="john", ticket_type=RAC)["tickets"]], [RAC])
+        self.assertEqual([ticket.status for ticket in self.search(name="oan", status=CANCELED)["tickets"]], [CANCELED])
+
+    def test_filters_on_booking_time(self):
+        page = self.search(created_from=(self.now - timedelta(hours=2)).isoformat(), created_to=self.now.isoformat())
+        self.assertEqual({ticket.passenger.name for ticket in page["tickets"]}, {"Johnny Walker", "Mary Johnson"})
+
+    def test_keyset_pages_cover_every_match_once(self):
+        seen, cursor = [], None
+        while True:
+            page = self.search(limit=1, **({"cursor": cursor} if cursor else {}))
+            seen.extend(ticket.id for ticket in page["tickets"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        booked = Ticket.objects.filter(status=BOOKED).order_by("-created_at", "-id")
+        self.assertEqual(seen, list(booked.values_list("id", flat=True)))
+
+    def test_rejects_short_names_and_bad_cursors(self):
+        self.assertEqual(search_tickets({"name": "jo"}), (None, SEARCH_NAME_TOO_SHORT))
+        self.assertEqual(search_tickets({"cursor": "not-a-cursor"}), (None, INVALID_SEARCH_CURSOR))
+        self.assertIsNotNone(search_tickets({"age_min": "old"})[1])
+
+
+@skipUnless(connection.vendor == "postgresql", "Index plans are PostgreSQL specific")
+class SearchIndexPlanTests(TestCase):
+    """The search filters must be answerable from the search indexes rather than by scanning the tables."""
+
+    def setUp(self):
+        # The test tables are tiny, so forbid sequential scans to see which indexes the planner can use.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def test_name_fragment_uses_trigram_index(self):
+        plan = Passenger.objects.filter(name__icontains="ohn").explain()
+        self.assertIn("passenger_name_trgm_idx", plan)
+
+    def test_status_and_booking_time_use_composite_index(self):
+        index = next(index.name for index in Ticket._meta.indexes if index.fields == ["status", "created_at"])
+        tickets = Ticket.objects.filter(status=BOOKED, created_at__gte=timezone.now() - timedelta(days=1))
+        plan = tickets.order_by("-created_at", "-id").explain()
+        self.assertIn(index, plan)
+
+
+def stored_plan(*nodes, buffers=10):
+    """A JSON plan as EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) returns it, with ``nodes`` under the top node."""
+    return {
+        "Plan": {"Node Type": "Limit", "Shared Hit Blocks": buffers, "Plans": list(nodes)},
+        "Execution Time": 0.5,
+    }
+
+
+class QueryPlanTests(SimpleTestCase):
+    """Plan summaries and their comparison with the baseline, on stored plans."""
+
+    index_scan = {"Node Type": "Index Scan", "Relation Name": "tickets_ticket", "Index Name": "ticket_queue_idx"}
+    seq_scan = {"Node Type": "Seq Scan", "Relation Name": "tickets_ticket", "Actual Rows": 40, "Actual Loops": 1}
+
+    def test_summary_flags_large_sequential_scans_and_sorts(self):
+        sort = {"Node Type": "Sort", "Sort Key": ["created_at"], "Actual Rows": 5, "Plans": [self.index_scan]}
+        summary = summarize(stored_plan(sort, {**self.seq_scan, "Rows Removed by Filter": 960}, buffers=12), 1000)
+        self.assertEqual(
+            summary["scans"],
+            ["Index Scan on tickets_ticket", "Index Scan using ticket_queue_idx", "Seq Scan on tickets_ticket"],
+        )
+        self.assertEqual(summary["flags"], ["Seq Scan on tickets_ticket", "Sort by created_at"])
+        self.assertEqual(summary["buffers"], 12)
+        # Below min_rows a sequential scan is cheaper than an index and is not flagged.
+        self.assertEqual(summarize(stored_plan(self.seq_scan), 1000)["flags"], [])
+
+    def test_regressions_against_the_baseline(self):
+        baseline = summarize(stored_plan(self.index_scan, buffers=100), 1000)
+        self.assertEqual(regressions(baseline, baseline, 2.0), [])
+
+        lost_index = summarize(stored_plan({**self.seq_scan, "Actual Rows": 5000}, buffers=100), 1000)
+        self.assertEqual(
+            regressions(lost_index, baseline, 2.0),
+            ["new Seq Scan on tickets_ticket", "no longer uses Index Scan using ticket_queue_idx"],
+        )
+
+        self.assertEqual(regressions(summarize(stored_plan(self.index_scan, buffers=190), 1000), baseline, 2.0), [])
+        self.assertEqual(
+            regressions(summarize(stored_plan(self.index_scan, buffers=210), 1000), baseline, 2.0),
+            ["buffers grew from 100 to 210"],
+        )
+
+    def test_check_fails_on_statements_missing_from_the_baseline(self):
+        summary = {**summarize(stored_plan(self.index_scan), 1000), "query": "ticket_counts", "sql": "SELECT 1"}
+        baseline = {"ticket_counts:removed": {**summary, "sql": "SELECT 2"}}
+        output = StringIO()
+        command = ExplainHotQueries(stdout=output)
+
+        self.assertEqual(command.report({"ticket_counts:new": summary}, baseline, 2.0), 0)
+        self.assertEqual(command.report({"ticket_counts:new": summary}, baseline, 2.0, strict=True), 2)
+        self.assertIn("ticket_counts:removed", output.getvalue())
+
+
+def berth_snapshot(compartments, free=None):
+    """Snapshot rows for the non-side-lower berths of ``compartments``; ``free`` limits them to these berth numbers."""
+    rows = []
+    for compartment in compartments:
+        for offset, berth_type in enumerate(COMPARTMENT_LAYOUT, 1):
+            number = compartment * len(COMPARTMENT_LAYOUT) + offset
+            if berth_type != SIDE_LOWER and (free is None or number in free):
+                rows.append((number * 10, number, berth_type))
+    return rows
+
+
+class GroupBerthAllocatorTests(SimpleTestCase):
+    def plan(self, snapshot, needs_lower):
+        types = {berth_id: (number, berth_type) for berth_id, number, berth_type in snapshot}
+        plan = GroupBerthAllocator(snapshot).plan(needs_lower)
+        return [types[berth_id] if berth_id else None for berth_id in plan]
+
+    def test_keeps_the_group_in_one_compartment(self):
+        # Compartment 0 has two berths left, compartment 2 is empty: the group of four goes to compartment 2.
+        snapshot = berth_snapshot([0], free={1, 2}) + berth_snapshot([2])
+        plan = self.plan(snapshot, [False] * 4)
+        self.assertEqual({compartment_of(number) for number, _ in plan}, {2})
+        self.assertEqual(len(set(plan)), 4)
+
+    def test_gives_lower_berths_to_seniors_and_women_with_children(self):
+        plan = self.plan(berth_snapshot([0, 1]), [False, True, False, True])
+        self.assertEqual([berth_type == LOWER for _, berth_type in plan], [False, True, False, True])
+        self.assertEqual({compartment_of(number) for number, _ in plan}, {0})
+
+    def test_looks_further_for_a_lower_berth(self):
+        # Only compartment 5 still has a lower berth free.
+        snapshot = berth_snapshot([0], free={2, 3}) + berth_snapshot([5], free={41})
+        plan = self.plan(snapshot, [True, False])
+        self.assertEqual(plan[0], (41, LOWER))
+        self.assertEqual(compartment_of(plan[1][0]), 0)
+
+    def test_spreads_over_neighbouring_compartments_when_fragmented(self):
+        # One berth left in each of compartments 0, 3, 4, 5 and 8.
+        snapshot = berth_snapshot([0, 3, 4, 5, 8], free={2, 26, 34, 42, 66})
+        plan = self.plan(snapshot, [False] * 3)
+        self.assertEqual(sorted(compartment_of(number) for number, _ in plan), [3, 4, 5])
+
+    def test_leaves_passengers_unplanned_when_berths_run_out(self):
+        plan = self.plan(berth_snapshot([0], free={1, 2}), [False, True, False])
+        self.assertEqual(plan.count(None), 1)
+        self.assertEqual(plan[1], (1, LOWER))
+
+
+@override_settings(FLASH_SALE_TRAIN="12951", FLASH_SALE_JOURNEY_DATE="2026-11-01", FLASH_SALE_MAX_ADMITTED=10)
+class WaitingRoomTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Three tickets left on the run on sale; another train has plenty, which must not count.
+        create_train_run("12951", confirmed_limit=3, rac_limit=0, waiting_list_limit=0, ladies_quota=0, senior_quota=0)
+        create_train_run("12952", confirmed_limit=50, ladies_quota=0, senior_quota=0)
+
+    def join(self, count):
+        return [WaitingRoomService.join()[0]["token"] for _ in range(count)]
+
+    def statuses(self, tokens):
+        return [AdmissionToken.objects.get(token=token).status for token in tokens]
+
+    def test_admits_in_order_up_to_the_capacity_of_the_run_on_sale(self):
+        tokens = self.join(5)
+        self.assertEqual(self.statuses(tokens), [ADMISSION_WAITING] * 5)
+        self.assertEqual(WaitingRoomService.admit(), (3, None))
+        self.assertEqual(self.statuses(tokens), [ADMISSION_ADMITTED] * 3 + [ADMISSION_WAITING] * 2)
+        self.assertEqual(WaitingRoomService.admit(), (0, None))
+        self.assertEqual(WaitingRoomService.get_status(tokens[3])[0]["position"], 1)
+
+    @override_settings(FLASH_SALE_MAX_ADMITTED=1)
+    def test_claimed_token_keeps_its_slot_until_the_booking_finishes(self):
+        first, second = self.join(2)
+        WaitingRoomService.admit()
+        self.assertEqual(WaitingRoomService.claim(first), (True, None))
+        self.assertEqual(self.statuses([first]), [ADMISSION_BOOKING])
+        self.assertEqual(WaitingRoomService.admit(), (0, None))
+
+        WaitingRoomService.finish(first)
+        self.assertEqual(WaitingRoomService.admit(), (1, None))
+        self.assertEqual(self.statuses([first, second]), [ADMISSION_USED, ADMISSION_ADMITTED])
+        self.assertFalse(WaitingRoomService.claim(first)[0])
+
+    @override_settings(FLASH_SALE_MAX_ADMITTED=1)
+    def test_lapsed_admissions_expire_and_free_their_slot(self):
+        first, second = self.join(2)
+        WaitingRoomService.admit()
+        AdmissionToken.objects.filter(token=first).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(WaitingRoomService.claim(first)[0])
+        self.assertEqual(WaitingRoomService.admit(), (1, None))
+        self.assertEqual(self.statuses([first, second]), [ADMISSION_EXPIRED, ADMISSION_ADMITTED])
+
+    def test_polling_only_reads(self):
+        (token,) = self.join(1)
+        with CaptureQueriesContext(connection) as queries:
+            data, error = WaitingRoomService.get_status(token)
+        self.assertIsNone(error)
+        self.assertEqual((data["status"], data["remaining_capacity"]), (ADMISSION_WAITING, 3))
+        self.assertTrue(all(query["sql"].lstrip().upper().startswith("SELECT") for query in queries))
+
+    def post_booking(self, train, passengers, token=None):
+        data = {
+            "train": train,
+            "journey_date": "2026-11-01",
+            "passengers": [{"name": f"Passenger {index}", "age": 30, "gender": "M"} for index in range(passengers)],
+        }
+        headers = {"HTTP_X_ADMISSION_TOKEN": token} if token else {}
+        return self.client.post(reverse("book_ticket"), data, content_type="application/json", **headers)
+
+    @override_settings(FLASH_SALE_MODE=True)
+    def test_token_is_refused_for_another_train_run(self):
+        (token,) = self.join(1)
+        WaitingRoomService.admit()
+
+        # The sale moved on to another run: the token cannot book it and is not spent.
+        with override_settings(FLASH_SALE_TRAIN="12952"):
+            response = self.post_booking("12952", 1, token)
+        self.assertEqual((response.status_code, response.json()["error"]), (403, ADMISSION_WRONG_TRAIN_RUN))
+        self.assertEqual(self.statuses([token]), [ADMISSION_ADMITTED])
+
+        # Runs that are not on sale are not metered, and do not spend the token either.
+        self.assertEqual(self.post_booking("12952", 1).status_code, 201)
+        self.assertEqual(self.post_booking("12951", 1).status_code, 429)
+        self.assertEqual(self.statuses([token]), [ADMISSION_ADMITTED])
+
+    @override_settings(FLASH_SALE_MODE=True, FLASH_SALE_MAX_PASSENGERS=2)
+    def test_admission_books_at_most_the_passenger_cap(self):
+        (token,) = self.join(1)
+        WaitingRoomService.admit()
+
+        response = self.post_booking("12951", 3, token)
+        self.assertEqual(
+            (response.status_code, response.json()["error"]), (400, ADMISSION_TOO_MANY_PASSENGERS.format(2))
+        )
+        self.assertEqual(self.statuses([token]), [ADMISSION_ADMITTED])
+
+        self.assertEqual(self.post_booking("12951", 2, token).status_code, 201)
+        self.assertEqual(Ticket.objects.filter(train__number="12951").count(), 2)
+        self.assertEqual(self.statuses([token]), [ADMISSION_USED])
+
+
+class TokenBucketThrottleTests(SimpleTestCase):
+    class BookView:
+        throttle_scope = "book"  # 30/min
+
+    def setUp(self):
+        cache.clear()
+        self.clock = 1_000_000.0
+        timer = mock.patch.object(TokenBucketThrottle, "timer", side_effect=lambda: self.clock)
+        timer.start()
+        self.addCleanup(timer.stop)
+
+    def requests(self, count, **headers):
+        allowed = 0
+        for _ in range(count):
+            request = RequestFactory().post("/", **headers)
+            request.user = AnonymousUser()
+            allowed += TokenBucketThrottle().allow_request(Request(request), self.BookView())
+        return allowed
+
+    def test_bursts_up_to_the_rate_then_refills_at_the_average(self):
+        self.assertEqual(self.requests(35), 30)
+        self.clock += 10
+        self.assertEqual(self.requests(10), 5)
+        self.clock += 300
+        self.assertEqual(self.requests(40), 30)
+
+    def test_client_supplied_keys_do_not_open_new_buckets(self):
+        allowed = sum(self.requests(1, HTTP_X_API_KEY=str(key)) for key in range(40))
+        self.assertEqual(allowed, 30)
+
+
+class LoadSheddingTests(TestCase):
+    """While the database is overloaded, bookings and cancellations are shed before they reach it."""
+
+    def setUp(self):
+        cache.clear()
+        self.monitor = LoadMonitor()
+        patcher = mock.patch("tickets.throttling.load_monitor", self.monitor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        create_train_run("12951", ladies_quota=0, senior_quota=0)
+
+    def post_booking(self):
+        data = {
+            "train": "12951",
+            "journey_date": JOURNEY_DATE.isoformat(),
+            "passengers": [{"name": "Asha", "age": 30, "gender": "F"}],
+        }
+        return self.client.post(reverse("book_ticket"), data, content_type="application/json")
+
+    def test_slow_database_sheds_bookings_but_serves_reads(self):
+        for _ in range(settings.LOAD_SHEDDING["MIN_SAMPLES"] * 2):
+            self.monitor.record_query(settings.LOAD_SHEDDING["DB_LATENCY_MS"] * 4)
+
+        response = self.post_booking()
+        self.assertEqual((response.status_code, response.json()["detail"]), (503, SERVICE_OVERLOADED))
+        self.assertEqual(response["Retry-After"], str(settings.LOAD_SHEDDING["RETRY_AFTER"]))
+        self.assertFalse(Ticket.objects.exists())
+
+        params = {"train": "12951", "journey_date": JOURNEY_DATE.isoformat()}
+        self.assertEqual(self.client.get(reverse("get_available_tickets"), params).status_code, 200)
+
+    def test_failing_locks_shed_bookings_with_429(self):
+        for _ in range(settings.LOAD_SHEDDING["MIN_SAMPLES"] * 2):
+            self.monitor.record_lock_attempt(failed=True)
+
+        response = self.post_booking()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], str(settings.LOAD_SHEDDING["RETRY_AFTER"]))
+
+
+class OpenAPISchemaCacheTests(SimpleTestCase):
+    """The schema is generated once, and again only when the URLs or settings it is built from change."""
+
+    def setUp(self):
+        schemas = mock.patch.dict(CachedSchemaGenerator._schemas, clear=True)
+        schemas.start()
+        self.addCleanup(schemas.stop)
+        generate = mock.patch.object(
+            OpenAPISchemaGenerator, "get_endpoints", autospec=True, side_effect=OpenAPISchemaGenerator.get_endpoints
+        )
+        self.generations = generate.start()
+        self.addCleanup(generate.stop)
+
+    def get_schema(self):
+        response = self.client.get(reverse("schema-json", kwargs={"format": ".json"}))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_second_request_reuses_the_schema(self):
+        first = self.get_schema()
+        second = self.get_schema()
+        self.assertEqual(self.generations.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_settings_change_regenerates_the_schema(self):
+        first = self.get_schema()
+        with override_settings(SWAGGER_SETTINGS={"USE_SESSION_AUTH": False}):
+            second = self.get_schema()
+        self.assertEqual(self.generations.call_count, 2)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+
+    def test_url_patterns_change_regenerates_the_schema(self):
+        info = openapi.Info(title="Railway Ticket Reservation API", default_version="v1")
+        request = Request(RequestFactory().get("/swagger.json"))
+        full = CachedSchemaGenerator(info).get_schema(request, public=True)
+        patterns = [path("api/v1/tickets/", include(ticket_urls.urlpatterns[:2]))]
+        narrowed = CachedSchemaGenerator(info, patterns=patterns).get_schema(request, public=True)
+
+        self.assertEqual(self.generations.call_count, 2)
+        self.assertLess(len(narrowed["paths"]), len(full["paths"]))
+        CachedSchemaGenerator(info).get_schema(request, public=True)
+        self.assertEqual(self.generations.call_count, 2)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Responses are compressed with the coding the client ranks highest, and only when that helps."""
+
+    body = b'{"tickets": [' + b'{"status": "booked", "ticket_type": "confirmed"}, ' * 50 + b"]}"
+
+    def compress(self, accept_encoding, response=None):
+        request = RequestFactory().get("/api/v1/tickets/booked", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response or HttpResponse(self.body))(request)
+
+    @skipUnless(brotli, "Needs the brotli package")
+    def test_encoding_follows_accept_encoding_q_values(self):
+        for accept_encoding, expected in (
+            ("gzip, deflate, br", "br"),
+            ("br;q=0.5, gzip", "gzip"),
+            ("br;q=0, gzip;q=0.1", "gzip"),
+            ("gzip;q=0.8, *", "br"),
+            ("identity", None),
+        ):
+            with self.subTest(accept_encoding):
+                self.assertEqual(self.compress(accept_encoding).get("Content-Encoding"), expected)
+
+        response = self.compress("br")
+        self.assertEqual(brotli.decompress(response.content), self.body)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+
+    def test_compressed_responses_vary_on_accept_encoding(self):
+        self.assertIn("Accept-Encoding", self.compress("gzip")["Vary"])
+        # The uncompressed answer to "identity" is cacheable only for clients that also send it.
+        self.assertIn("Accept-Encoding", self.compress("identity")["Vary"])
+
+    def test_small_bodies_are_sent_as_is(self):
+        response = self.compress("gzip, br", HttpResponse(b'{"detail": "ok"}'))
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.content, b'{"detail": "ok"}')
+
+    def test_streaming_responses_are_sent_as_is(self):
+        for content_type in ("text/event-stream", "text/csv"):
+            with self.subTest(content_type):
+                streamed = StreamingHttpResponse(iter([self.body, self.body]), content_type=content_type)
+                response = self.compress("gzip, br", streamed)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertEqual(b"".join(response.streaming_content), self.body * 2)
+
+    def test_existing_content_encoding_is_left_alone(self):
+        encoded = HttpResponse(self.body)
+        encoded["Content-Encoding"] = "deflate"
+        response = self.compress("gzip, br", encoded)
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(response.content, self.body)
+
+
+@skipUnless(orjson, "Needs orjson, which FastJSONRenderer falls back without")
+class FastJSONRendererTests(TestCase):
+    """The orjson renderer must produce byte-for-byte what DRF's JSONRenderer would."""
+
+    def test_ticket_payload_matches_drf(self):
+        train = create_train_run("12951", ladies_quota=0, senior_quota=0)
+        ticket = book(train, "Asha Rao")
+        Ticket.objects.filter(id=ticket.id).update(created_at=timezone.now().replace(microsecond=123456))
+        ticket.refresh_from_db()
+        payload = {
+            "ticket": TicketSerializer(ticket).data,
+            # Raw values as a ``.values()`` query returns them: aware datetimes and dates.
+            "row": Ticket.objects.filter(id=ticket.id).values("id", "created_at", "journey_date").get(),
+            "checked_at": ticket.created_at.time(),
+        }
+
+        self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertIn(b'"created_at":"', FastJSONRenderer().render(payload))
+        self.assertNotIn(b"+00:00", FastJSONRenderer().render(payload))
+
+
+class RecordingSink:
+    def __init__(self):
+        self.batches = []
+
+    def publish(self, events):
+        self.batches.append(events)
+
+
+class FailingSink:
+    def publish(self, events):
+        raise ConnectionError("sink unavailable")
+
+
+@override_settings(OUTBOX_GAP_GRACE_SECONDS=0)
+class OutboxTests(TestCase):
+    """Events exist exactly when their booking committed, and stay until a sink accepts them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.train = create_train_run("12951", ladies_quota=0, senior_quota=0)
+
+    def test_booking_writes_its_event(self):
+        ticket = book(self.train, "Asha Rao")
+        event = OutboxEvent.objects.get(ticket_id=ticket.id)
+        self.assertEqual(event.event_type, EVENT_TICKET_BOOKED)
+        self.assertEqual(event.payload["train"], "12951")
+        self.assertEqual(event.payload["berth_number"], ticket.berth.berth_number)
+
+    def test_booking_that_fails_after_its_event_emits_nothing(self):
+        with mock.patch("tickets.services.bump_inventory_version", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                book_ticket("Asha Rao", 30, "F", train=self.train, journey_date=JOURNEY_DATE)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_rolled_back_booking_emits_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            book(self.train, "Asha Rao")
+            raise RuntimeError("caller gave up")
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_failed_delivery_keeps_the_events_for_retry(self):
+        tickets = [book(self.train, name) for name in ("Asha Rao", "Ravi Kumar")]
+        with self.assertRaises(ConnectionError):
+            relay_batch("segments", FailingSink())
+        self.assertFalse(ConsumerOffset.objects.filter(consumer="segments", offset__gt=0).exists())
+        self.assertEqual(OutboxEvent.objects.count(), 2)
+
+        sink = RecordingSink()
+        self.assertEqual(relay_batch("segments", sink), 2)
+        self.assertEqual([event["ticket_id"] for event in sink.batches[0]], [ticket.id for ticket in tickets])
+        self.assertEqual(ConsumerOffset.objects.get(consumer="segments").offset, sink.batches[0][-1]["offset"])
+        self.assertEqual(relay_batch("segments", sink), 0)
+
+
+class OutboxSinkTests(SimpleTestCase):
+    """Sinks write each event once, in order, and fail loudly so the relay retries."""
+
+    def events(self, *offsets):
+        return [{"offset": offset, "type": EVENT_TICKET_BOOKED, "ticket_id": offset} for offset in offsets]
+
+    def test_segments_rotate_and_resume_from_an_offset(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = SegmentFileSink(directory, max_bytes=1)
+            sink.publish(self.events(1, 2))
+            sink.publish(self.events(3))
+            sink.publish(self.events(2, 3))  # A batch replayed after a crash is not written twice.
+            sink.publish(self.events(4))
+
+            segments = sorted(os.listdir(directory))
+            self.assertEqual(segments, [f"{first:020d}.ndjson" for first in (1, 3, 4)])
+            self.assertEqual([event["offset"] for event in read_segments(directory)], [1, 2, 3, 4])
+            self.assertEqual([event["offset"] for event in read_segments(directory, after=2)], [3, 4])
+
+    def test_segment_fills_before_rotating(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sink = SegmentFileSink(directory, max_bytes=1024 * 1024)
+            sink.publish(self.events(1))
+            sink.publish(self.events(2))
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_webhook_signs_the_batch(self):
+        with mock.patch("tickets.outbox.urllib.request.urlopen") as urlopen:
+            WebhookSink("https://events.example.com/outbox", secret="s3cret").publish(self.events(1, 2))
+
+        request = urlopen.call_args.args[0]
+        self.assertEqual(json.loads(request.data)["events"], self.events(1, 2))
+        expected = hmac.new(b"s3cret", request.data, hashlib.sha256).hexdigest()
+        self.assertEqual(request.get_header("X-outbox-signature"), f"sha256={expected}")
+
+    def test_webhook_error_response_raises(self):
+        error = urllib.error.HTTPError("https://events.example.com/outbox", 503, "Unavailable", {}, None)
+        with mock.patch("tickets.outbox.urllib.request.urlopen", side_effect=error):
+            with self.assertRaises(urllib.error.HTTPError):
+                WebhookSink("https://events.example.com/outbox").publish(self.events(1))
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Profiles are written only for sampled or signed requests to the views in ``PROFILING_VIEWS``."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        profiling = override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.5, PROFILING_DIR=self.directory)
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+
+    def profiles(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".summary.json"))
+
+    def get(self, name="get_booked_tickets", **headers):
+        response = self.client.get(reverse(name), **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_disabled_middleware_is_dropped(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: HttpResponse())
+            with mock.patch("tickets.profiling.random.random", return_value=0.0) as draw:
+                response = self.get()
+        self.assertFalse(response.has_header(PROFILE_ID_HEADER))
+        draw.assert_not_called()
+        self.assertEqual(self.profiles(), [])
+
+    def test_only_sampled_requests_are_recorded(self):
+        with mock.patch("tickets.profiling.random.random", side_effect=[0.9, 0.1]):
+            skipped = self.get()
+            sampled = self.get(HTTP_X_REQUEST_ID="booked-list-1")
+
+        self.assertFalse(skipped.has_header(PROFILE_ID_HEADER))
+        self.assertEqual(self.profiles(), [f"{sampled[PROFILE_ID_HEADER]}.summary.json"])
+        with open(os.path.join(self.directory, self.profiles()[0]), encoding="utf-8") as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(summary["reason"], "sampled")
+        self.assertEqual(summary["request_id"], "booked-list-1")
+        self.assertEqual(summary["view"], "GetBookedTicketsView")
+        self.assertGreater(summary["query_count"], 0)
+        for suffix in (".pstats", ".speedscope.json"):
+            self.assertTrue(os.path.exists(os.path.join(self.directory, sampled[PROFILE_ID_HEADER] + suffix)))
+
+    def test_views_outside_the_list_are_never_profiled(self):
+        with mock.patch("tickets.profiling.random.random", return_value=0.0):
+            response = self.client.get(reverse("ticket_status_lookup"), {"ids": "1"})
+        self.assertFalse(response.has_header(PROFILE_ID_HEADER))
+        self.assertEqual(self.profiles(), [])
+
+    def test_signed_header_profiles_without_sampling(self):
+        header = "HTTP_" + PROFILE_HEADER.upper().replace("-", "_")
+        with mock.patch("tickets.profiling.random.random", return_value=0.9):
+            self.get(**{header: "forged"})
+            self.assertEqual(self.profiles(), [])
+            requested = self.get(**{header: profile_token(60)})
+        self.assertEqual(len(self.profiles()), 1)
+        self.assertTrue(requested.has_header(PROFILE_ID_HEADER))
+
+
+@mock.patch.object(TicketAdmin, "list_per_page", 2)
+class TicketAdminTests(TestCase):
+    """The ticket changelist pages by primary key and leaves changes to the service layer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser("ops", "ops@example.com", "ops-password")
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+
+    def changelist(self, **params):
+        response = self.client.get(reverse("admin:tickets_ticket_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def assertNoCount(self, queries):
+        counts = [query["sql"] for query in queries.captured_queries if "COUNT(" in query["sql"].upper()]
+        self.assertEqual(counts, [])
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_keyset_pages_follow_the_cursor_without_counting(self):
+        tickets = [create_ticket(f"Passenger {number}", 30) for number in range(5)]
+        pages = []
+        with mock.patch("tickets.admin.estimated_rows", return_value=len(tickets)):
+            with CaptureQueriesContext(connection) as queries:
+                changelist = self.changelist()
+                pages.append(changelist.result_list)
+                while changelist.next_page_url:
+                    after = parse_qs(urlparse(changelist.next_page_url).query)[AFTER_VAR][0]
+                    changelist = self.changelist(**{AFTER_VAR: after})
+                    pages.append(changelist.result_list)
+
+        self.assertNoCount(queries)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        listed = [ticket.pk for page in pages for ticket in page]
+        self.assertEqual(listed, sorted((ticket.pk for ticket in tickets), reverse=True))
+        self.assertEqual(len(set(listed)), len(listed))
+        self.assertTrue(changelist.paginator.estimated)
+
+    @skipUnless(connection.vendor == "postgresql", "Row estimates come from the PostgreSQL planner")
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=0)
+    def test_filtered_changelist_uses_the_planner_estimate(self):
+        create_ticket("Asha Rao", 30)
+        with CaptureQueriesContext(connection) as queries:
+            changelist = self.changelist(status__exact=BOOKED)
+        self.assertNoCount(queries)
+        self.assertTrue(changelist.paginator.estimated)
+
+    def test_cancel_action_goes_through_the_service_layer(self):
+        train = create_train_run("12951", confirmed_limit=7, rac_limit=1, ladies_quota=0, senior_quota=0)
+        confirmed = [book(train, f"Passenger {index}") for index in range(7)]
+        rac = book(train, "Rac")
+        already_cancelled = create_ticket("Cancelled", 30, status=CANCELED)
+
+        response = self.client.post(
+            reverse("admin:tickets_ticket_changelist"),
+            {"action": "cancel_tickets", "_selected_action": [already_cancelled.id, confirmed[1].id]},
+            follow=True,
+        )
+
+        self.assertEqual([str(message) for message in response.context["messages"]], ["Tickets cancelled: 1."])
+        self.assertEqual(Ticket.objects.get(id=confirmed[1].id).status, CANCELED)
+        rac.refresh_from_db()
+        self.assertEqual((rac.ticket_type, rac.berth_id), (CONFIRMED, confirmed[1].berth_id))
+        self.assertTrue(OutboxEvent.objects.filter(ticket_id=rac.id, event_type=EVENT_TICKET_CONFIRMED).exists())
+
+
+class InventoryVersionTests(TestCase):
+    """Every job that changes availability must bump the version behind the list ETags."""
+
+    def assertBumps(self, job):
+        before = get_inventory_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(job())
+        self.assertGreater(get_inventory_version(), before)
+
+    def test_quota_rollover(self):
+        train = create_train_run("12951", journey_date=timezone.now().date())
+        create_quota_buckets({"train": train, "journey_date": timezone.now().date()})
+        self.assertBumps(rollover_quotas)
+
+    def test_archiving_and_purging_departed_runs(self):
+        departed = timezone.now().date() - timedelta(days=30)
+        train = create_train_run("12951", journey_date=departed)
+        passenger = Passenger.objects.create(name="Asha Rao", age=30, gender="F")
+        Ticket.objects.create(passenger=passenger, train=train, journey_date=departed, status=BOOKED)
+        self.assertBumps(lambda: archive_batch(100))
+        self.assertBumps(lambda: purge_departed_inventory(100))
+
+    def test_booking_names_its_run_in_the_change_notification(self):
+        train = create_train_run("12951", ladies_quota=0, senior_quota=0)
+        with mock.patch("tickets.inventory._increment_version") as increment:
+            with self.captureOnCommitCallbacks(execute=True):
+                book(train, "Asha Rao")
+        increment.assert_called_with(f"12951:{JOURNEY_DATE}")
+
+
+class AvailabilityHubTests(SimpleTestCase):
+    """A change notification wakes only the streams watching the run it names."""
+
+    def setUp(self):
+        self.counts, self.computed = {}, []
+        summaries = mock.patch.object(AvailabilityService, "get_availability_summary", side_effect=self.summary)
+        summaries.start()
+        self.addCleanup(summaries.stop)
+        start = mock.patch.object(AvailabilityHub, "_start")
+        start.start()
+        self.addCleanup(start.stop)
+
+    def summary(self, inventory=None):
+        key = subscription_key(inventory)
+        self.computed.append(key)
+        return {"version": sum(self.counts.values()), "available_berths_count": self.counts.get(key, 0)}
+
+    def run_of(self, number):
+        return {"train": SimpleNamespace(number=number), "journey_date": JOURNEY_DATE}
+
+    def notify(self, hub, *payloads):
+        notifies = [SimpleNamespace(payload=payload) for payload in payloads]
+        hub._on_notify(SimpleNamespace(poll=lambda: None, notifies=notifies))
+
+    def test_only_subscribers_of_the_notified_run_receive_its_delta(self):
+        async def scenario():
+            hub = AvailabilityHub()
+            hub._listener, hub._changed = object(), asyncio.Event()
+            changed, other, everyone = self.run_of("12951"), self.run_of("12952"), None
+            subscribers = {}
+            for name, inventory in (("changed", changed), ("other", other), ("everyone", everyone)):
+                subscribers[name] = await hub.subscribe(inventory)
+                subscribers[name].drain()
+
+            self.counts[subscription_key(changed)] = 7
+            self.counts[subscription_key(everyone)] = 7
+            self.computed.clear()
+            self.notify(hub, f"12951:{JOURNEY_DATE}")
+            await hub._publish(hub._take_dirty())
+            return {
+                name: subscriber.drain() if subscriber.changed.is_set() else None
+                for name, subscriber in subscribers.items()
+            }
+
+        deltas = asyncio.run(scenario())
+        self.assertEqual(deltas["changed"]["available_berths_count"], 7)
+        self.assertEqual(deltas["everyone"]["available_berths_count"], 7)
+        self.assertIsNone(deltas["other"])
+        self.assertNotIn(f"12952:{JOURNEY_DATE}", self.computed)
+
+    def test_notification_without_a_run_refreshes_every_subscription(self):
+        async def scenario():
+            hub = AvailabilityHub()
+            hub._listener, hub._changed = object(), asyncio.Event()
+            await hub.subscribe(self.run_of("12951"))
+            await hub.subscribe(self.run_of("12952"))
+            self.notify(hub, "")
+            return hub._take_dirty()
+
+        self.assertEqual(asyncio.run(scenario()), {f"12951:{JOURNEY_DATE}", f"12952:{JOURNEY_DATE}"})
+
+
+class ConditionalListTests(TestCase):
+    """The list endpoints answer a current If-None-Match from the inventory version alone."""
+
+    def setUp(self):
+        self.train = create_train_run("12951", ladies_quota=0, senior_quota=0)
+        self.params = {"train": "12951", "journey_date": JOURNEY_DATE.isoformat()}
+
+    def book(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            book(self.train, name)
+
+    def test_matching_etag_is_answered_without_reading_the_inventory(self):
+        self.book("Asha Rao")
+        for name in ("get_available_tickets", "get_booked_tickets"):
+            response = self.client.get(reverse(name), self.params)
+            self.assertEqual(response.status_code, 200)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name), self.params, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, 304)
+            tables = (Ticket._meta.db_table, Berth._meta.db_table)
+            self.assertFalse([query["sql"] for query in queries if any(table in query["sql"] for table in tables)])
+
+    def test_booking_changes_the_etag(self):
+        self.book("Asha Rao")
+        etag = self.client.get(reverse("get_available_tickets"), self.params)["ETag"]
+        self.book("Ravi Kumar")
+
+        response = self.client.get(reverse("get_available_tickets"), self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class CancellationCascadeTests(TestCase):
+    """A cancelled berth goes to the oldest RAC ticket, and the side-lower berth it gives up to the waiting list."""
+
+    def setUp(self):
+        # Seven regular berths and one side-lower berth.
+        self.train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0
+        )
+        self.inventory = {"train": self.train, "journey_date": JOURNEY_DATE}
+
+    def refreshed(self, *tickets):
+        return [Ticket.objects.select_related("berth").get(id=ticket.id) for ticket in tickets]
+
+    def test_cancelled_berth_cascades_through_the_queues(self):
+        confirmed = [book(self.train, f"Passenger {index}") for index in range(7)]
+        rac, first_waiting, second_waiting = (book(self.train, name) for name in ("Rac", "Wait One", "Wait Two"))
+        self.assertEqual([rac.ticket_type, first_waiting.ticket_type], [RAC, WAITING_LIST])
+        side_lower, released = rac.berth, confirmed[2].berth
+
+        self.assertIsNone(cancel_ticket(confirmed[2].id)[1])
+        rac, first_waiting, second_waiting = self.refreshed(rac, first_waiting, second_waiting)
+        self.assertEqual((rac.ticket_type, rac.berth), (CONFIRMED, released))
+        self.assertEqual((first_waiting.ticket_type, first_waiting.berth), (RAC, side_lower))
+        self.assertEqual(second_waiting.ticket_type, WAITING_LIST)
+        self.assertEqual(Berth.objects.filter(availability_status=AVAILABLE, **self.inventory).count(), 0)
+
+    def test_cancelled_rac_ticket_hands_its_side_lower_to_the_waiting_list(self):
+        for index in range(7):
+            book(self.train, f"Passenger {index}")
+        rac, waiting = book(self.train, "Rac"), book(self.train, "Wait")
+        cancel_ticket(rac.id)
+        (waiting,) = self.refreshed(waiting)
+        self.assertEqual((waiting.ticket_type, waiting.berth), (RAC, rac.berth))
+
+    def test_cancelled_child_seat_frees_quota_without_promoting(self):
+        for index in range(6):
+            book(self.train, f"Passenger {index}")
+        child = book(self.train, "Child", age=3)
+        rac, waiting = book(self.train, "Rac"), book(self.train, "Wait")
+        self.assertEqual((child.ticket_type, child.berth), (CONFIRMED, None))
+
+        cancel_ticket(child.id)
+        rac, waiting = self.refreshed(rac, waiting)
+        self.assertEqual((rac.ticket_type, rac.berth.berth_type), (RAC, SIDE_LOWER))
+        self.assertEqual(waiting.ticket_type, WAITING_LIST)
+        self.assertEqual(get_quota_buckets(self.inventory)[QUOTA_GENERAL]["available"], 1)
+
+
+class TicketStatusTests(TestCase):
+    """Ticket status is read through the cache and goes stale when the queues of its run move."""
+
+    def setUp(self):
+        cache.clear()
+        # Seven regular berths and one side-lower berth.
+        self.train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0
+        )
+
+    def test_second_lookup_is_a_cache_hit(self):
+        ticket = book(self.train, "Asha Rao")
+        status, error = get_ticket_status(ticket.id)
+        self.assertIsNone(error)
+        self.assertEqual((status["ticket_type"], status["berth_number"]), (CONFIRMED, ticket.berth.berth_number))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_ticket_status(ticket.id), (status, None))
+
+    def test_cancel_and_promotions_refresh_the_queued_statuses(self):
+        confirmed = [book(self.train, f"Passenger {index}") for index in range(7)]
+        rac, waiting = book(self.train, "Rac"), book(self.train, "Wait")
+        self.assertEqual(get_ticket_status(rac.id)[0]["ticket_type"], RAC)
+        self.assertEqual(get_ticket_status(waiting.id)[0]["queue_position"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_ticket(confirmed[0].id)
+        self.assertEqual(get_ticket_status(confirmed[0].id)[0]["status"], CANCELED)
+        self.assertEqual(get_ticket_status(rac.id)[0]["ticket_type"], CONFIRMED)
+        status = get_ticket_status(waiting.id)[0]
+        self.assertEqual((status["ticket_type"], status["queue_position"]), (RAC, 1))
+
+    def test_archived_ticket_is_found_in_the_cold_table(self):
+        departed = timezone.now().date() - timedelta(days=30)
+        train = create_train_run("12952", journey_date=departed)
+        passenger = Passenger.objects.create(name="Asha Rao", age=30, gender="F")
+        ticket = Ticket.objects.create(passenger=passenger, train=train, journey_date=departed, status=BOOKED)
+        self.assertEqual(archive_batch(100), 1)
+
+        status, error = get_ticket_status(ticket.id)
+        self.assertIsNone(error)
+        self.assertEqual((status["archived"], status["train"], status["passenger_name"]), (True, "12952", "Asha Rao"))
+        self.assertEqual(get_ticket_status(ticket.id + 1), (None, TICKET_NOT_FOUND))
+
+    def test_lookup_takes_between_one_and_the_limit_of_ids(self):
+        url = reverse("ticket_status_lookup")
+        for ids in ["", ",".join(str(ticket_id) for ticket_id in range(1, STATUS_LOOKUP_LIMIT + 2))]:
+            response = self.client.get(url, {"ids": ids})
+            self.assertEqual((response.status_code, response.json()), (400, {"error": INVALID_TICKET_IDS}))
+
+        ticket = book(self.train, "Asha Rao")
+        response = self.client.get(url, {"ids": f"{ticket.id},{ticket.id + 1}"})
+        self.assertEqual([data["id"] for data in response.json()["tickets"]], [ticket.id])
+        self.assertEqual(response.json()["not_found"], [ticket.id + 1])
+
+
+class SimulatorTests(TestCase):
+    """The simulator replays a trace with the same outcomes as the service layer."""
+
+    policy = QuotaPolicy(confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0)
+    trace = [
+        (BOOK, 3, "M", False),
+        *[(BOOK, 30, "M", False)] * 6,
+        (BOOK, 30, "M", False),  # RAC on the side-lower berth
+        (BOOK, 30, "M", False),  # waiting list
+        (CANCEL, 1),  # a child's seat frees quota but no berth
+        (BOOK, 40, "M", False),
+        (CANCEL, 2),  # RAC is confirmed and the waiting list moves to RAC
+    ]
+
+    def test_trace_matches_the_service_layer(self):
+        self.assertEqual(verify_against_service(self.trace, self.policy, compartments=1), [])
+
+    def test_child_cancellation_promotes_nobody(self):
+        simulator = AllocationSimulator(self.policy, compartments=1)
+        outcomes = simulator.run(self.trace)
+        self.assertEqual([outcome[1] for outcome in outcomes[7:9]], [RAC, WAITING_LIST])
+        self.assertEqual(outcomes[10][1], CONFIRMED)
+        report = simulator.report()
+        self.assertEqual((report["promoted_to_confirmed"], report["moved_to_rac"]), (1, 1))
+        self.assertEqual(report["quota_buckets"][QUOTA_GENERAL], {"capacity": 7, "booked": 7})
+
+
+class SellOutTests(TestCase):
+    """A run sells its confirmed berths, then one RAC ticket per side-lower berth, then the waiting list."""
+
+    def sell_out(self, **policy):
+        # A standard coach of nine compartments under the default quotas; men qualify for the general quota only.
+        train = create_train_run("12951", compartments=9, **policy)
+        tickets = [book(train, f"Passenger {index}") for index in range(70)]
+        self.assertEqual(
+            book_ticket("Too Late", 30, "M", train=train, journey_date=JOURNEY_DATE), (None, NO_TICKETS_AVAILABLE)
+        )
+        return tickets
+
+    def assertSoldOut(self, tickets):
+        self.assertEqual([ticket.ticket_type for ticket in tickets], [CONFIRMED] * 51 + [RAC] * 9 + [WAITING_LIST] * 10)
+        self.assertEqual({ticket.berth.berth_type for ticket in tickets[51:60]}, {SIDE_LOWER})
+        self.assertEqual(len({ticket.berth_id for ticket in tickets[:60]}), 60)
+
+    def test_default_policy_allows_one_rac_ticket_per_side_lower_berth(self):
+        self.assertSoldOut(self.sell_out())
+
+    def test_rac_limit_above_the_side_lower_berths_falls_through_to_the_waiting_list(self):
+        self.assertSoldOut(self.sell_out(rac_limit=18))
+
+
+class QuotaBucketTests(TestCase):
+    def capacities(self, inventory):
+        return {quota: bucket["capacity"] for quota, bucket in get_quota_buckets(inventory).items()}
+
+    def test_reserved_buckets_never_outgrow_their_berth_pools(self):
+        # One compartment: two lower berths and seven regular berths in all.
+        train = create_train_run("12951", confirmed_limit=7, senior_quota=6, ladies_quota=6)
+        seniors = [book(train, f"Senior {index}", age=65) for index in range(3)]
+        ladies = [book(train, f"Lady {index}", gender="F") for index in range(5)]
+
+        inventory = {"train": train, "journey_date": JOURNEY_DATE}
+        self.assertEqual(self.capacities(inventory), {QUOTA_SENIOR: 2, QUOTA_LADIES: 5, QUOTA_GENERAL: 0})
+        self.assertEqual([ticket.ticket_type for ticket in seniors], [CONFIRMED, CONFIRMED, RAC])
+        self.assertEqual(
+            {(ticket.berth.berth_type, ticket.berth.quota) for ticket in seniors[:2]}, {(LOWER, QUOTA_SENIOR)}
+        )
+        self.assertEqual({(ticket.ticket_type, ticket.berth.quota) for ticket in ladies}, {(CONFIRMED, QUOTA_LADIES)})
+
+    @override_settings(QUOTA_COUNTER_STRIPES=4)
+    def test_buckets_are_striped_and_count_tickets_sold_before_them(self):
+        self.assertEqual(_split(10, 7), [(3, 3), (3, 3), (2, 1), (2, 0)])
+
+        train = create_train_run("12951", compartments=2, confirmed_limit=14, senior_quota=2, ladies_quota=2)
+        for index in range(5):
+            book(train, f"Passenger {index}")
+        QuotaCounter.objects.all().delete()
+        inventory = {"train": train, "journey_date": JOURNEY_DATE}
+        create_quota_buckets(inventory)
+
+        self.assertEqual(QuotaCounter.objects.filter(quota=QUOTA_GENERAL, **inventory).count(), 4)
+        self.assertEqual(get_quota_buckets(inventory)[QUOTA_GENERAL], {"capacity": 10, "booked": 5, "available": 5})
+
+    def test_rollover_hands_unused_reserved_quota_to_general(self):
+        journey_date = timezone.now().date()
+        train = create_train_run(
+            "12951", compartments=2, journey_date=journey_date, confirmed_limit=14, senior_quota=2, ladies_quota=2
+        )
+        senior = book(train, "Senior", age=65, journey_date=journey_date)
+
+        self.assertEqual(rollover_quotas(), 3)
+        inventory = {"train": train, "journey_date": journey_date}
+        self.assertEqual(self.capacities(inventory), {QUOTA_SENIOR: 1, QUOTA_LADIES: 0, QUOTA_GENERAL: 13})
+        free_berths = Berth.objects.filter(availability_status=AVAILABLE, **inventory).exclude(berth_type=SIDE_LOWER)
+        self.assertEqual(set(free_berths.values_list("quota", flat=True)), {QUOTA_GENERAL})
+        self.assertEqual(Berth.objects.get(id=senior.berth_id).quota, QUOTA_SENIOR)
+        self.assertEqual(rollover_quotas(), 0)
+
+
+@override_settings(BOOKING_CONCURRENCY="optimistic", BOOKING_CAS_CANDIDATES=3)
+class OptimisticBookingTests(TestCase):
+    def test_claims_spread_over_the_first_free_berths(self):
+        train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=0, ladies_quota=0, senior_quota=0
+        )
+        berths = list(Berth.objects.exclude(berth_type=SIDE_LOWER).order_by("berth_type", "berth_number", "id"))
+        # Always take the last of the candidates offered.
+        with mock.patch("tickets.concurrency.random.choice", side_effect=lambda rows: rows[-1]):
+            tickets = [book(train, f"Passenger {index}") for index in range(8)]
+
+        self.assertEqual([ticket.berth for ticket in tickets[:3]], [berths[2], berths[3], berths[4]])
+        self.assertEqual({ticket.berth for ticket in tickets[:7]}, set(berths))
+        self.assertEqual((tickets[7].ticket_type, tickets[7].berth.berth_type), (RAC, SIDE_LOWER))
+
+
+class SeatHoldTests(TestCase):
+    """Lapsed holds give their seats back, and a held berth goes to the RAC queue as on a cancellation."""
+
+    def setUp(self):
+        # Seven regular berths and one side-lower berth.
+        self.train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0
+        )
+        self.inventory = {"train": self.train, "journey_date": JOURNEY_DATE}
+
+    def hold(self, *ages):
+        hold, errors = hold_seats(
+            [{"name": f"Holder {index}", "age": age, "gender": "M"} for index, age in enumerate(ages)], self.inventory
+        )
+        self.assertEqual(errors, [])
+        return hold
+
+    def expire(self, hold):
+        SeatHold.objects.filter(id=hold.id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_holds(), 1)
+        hold.refresh_from_db()
+        return hold
+
+    def test_expired_hold_frees_its_berths_and_quota(self):
+        hold = self.hold(30, 40)
+        berth_ids = [seat["berth_id"] for seat in hold.seats]
+        self.assertEqual(
+            set(Berth.objects.filter(id__in=berth_ids).values_list("availability_status", flat=True)), {RESERVED}
+        )
+        self.assertEqual(get_quota_buckets(self.inventory)[QUOTA_GENERAL]["available"], 5)
+
+        self.assertEqual(self.expire(hold).status, HOLD_EXPIRED)
+        self.assertEqual(
+            set(Berth.objects.filter(id__in=berth_ids).values_list("availability_status", flat=True)), {AVAILABLE}
+        )
+        self.assertEqual(get_quota_buckets(self.inventory)[QUOTA_GENERAL]["available"], 7)
+
+    def test_lapsed_hold_cannot_be_confirmed(self):
+        hold = self.hold(30)
+        SeatHold.objects.filter(id=hold.id).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(confirm_hold(hold.token), (None, HOLD_NOT_ACTIVE))
+        self.assertFalse(Ticket.objects.exists())
+
+        self.assertEqual(self.expire(hold).status, HOLD_EXPIRED)
+        self.assertEqual(confirm_hold(hold.token), (None, HOLD_NOT_ACTIVE))
+
+    def test_confirmed_hold_books_the_held_berths(self):
+        hold = self.hold(30)
+        tickets, error = confirm_hold(hold.token)
+        self.assertIsNone(error)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, HOLD_CONFIRMED)
+        self.assertEqual((tickets[0].ticket_type, tickets[0].berth_id), (CONFIRMED, hold.seats[0]["berth_id"]))
+        self.assertEqual(Berth.objects.get(id=hold.seats[0]["berth_id"]).availability_status, BOOKED)
+
+    def test_expired_berth_goes_to_the_rac_queue(self):
+        for index in range(6):
+            book(self.train, f"Passenger {index}")
+        hold = self.hold(30)
+        rac, waiting = book(self.train, "Rac"), book(self.train, "Wait")
+        side_lower = rac.berth
+
+        self.expire(hold)
+        rac, waiting = (Ticket.objects.select_related("berth").get(id=ticket.id) for ticket in (rac, waiting))
+        self.assertEqual((rac.ticket_type, rac.berth_id), (CONFIRMED, hold.seats[0]["berth_id"]))
+        self.assertEqual((waiting.ticket_type, waiting.berth), (RAC, side_lower))
+        self.assertEqual(Berth.objects.filter(availability_status=AVAILABLE, **self.inventory).count(), 0)
+
+    def test_expired_child_seat_frees_quota_without_promoting(self):
+        for index in range(6):
+            book(self.train, f"Passenger {index}")
+        hold = self.hold(3)
+        rac, waiting = book(self.train, "Rac"), book(self.train, "Wait")
+
+        self.expire(hold)
+        rac, waiting = (Ticket.objects.select_related("berth").get(id=ticket.id) for ticket in (rac, waiting))
+        self.assertEqual((rac.ticket_type, rac.berth.berth_type), (RAC, SIDE_LOWER))
+        self.assertEqual(waiting.ticket_type, WAITING_LIST)
+        self.assertEqual(get_quota_buckets(self.inventory)[QUOTA_GENERAL]["available"], 1)
+
+
+class PrepareChartTests(TestCase):
+    """The chart hands every free berth down the RAC and waiting-list queues and closes the run to bookings."""
+
+    def setUp(self):
+        # Seven regular berths and one side-lower berth.
+        self.train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0
+        )
+        self.inventory = {"train": self.train, "journey_date": JOURNEY_DATE}
+
+    def queue_behind_a_hold(self):
+        """Five confirmed tickets, an unconfirmed hold of two berths and one RAC and two waiting-list tickets."""
+        for index in range(5):
+            book(self.train, f"Passenger {index}")
+        hold, errors = hold_seats(
+            [{"name": f"Holder {index}", "age": 30, "gender": "M"} for index in range(2)], self.inventory
+        )
+        self.assertEqual(errors, [])
+        return hold, [book(self.train, name) for name in ("Rac", "Wait One", "Wait Two")]
+
+    def test_released_hold_cascades_through_both_queues(self):
+        hold, (rac, first_waiting, second_waiting) = self.queue_behind_a_hold()
+        side_lower = rac.berth
+
+        chart, error = prepare_chart(self.train, JOURNEY_DATE)
+        self.assertIsNone(error)
+        self.assertEqual(
+            (chart.status, chart.confirmed_from_rac, chart.moved_to_rac, chart.released_holds),
+            (CHART_PREPARED, 2, 2, 1),
+        )
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, HOLD_RELEASED)
+
+        # The first waiting-list ticket moves to RAC and then takes the second held berth.
+        rac, first_waiting, second_waiting = (
+            Ticket.objects.select_related("berth").get(id=ticket.id) for ticket in (rac, first_waiting, second_waiting)
+        )
+        held_berths = {seat["berth_id"] for seat in hold.seats}
+        self.assertEqual({rac.berth_id, first_waiting.berth_id}, held_berths)
+        self.assertEqual([rac.ticket_type, first_waiting.ticket_type], [CONFIRMED, CONFIRMED])
+        self.assertEqual((second_waiting.ticket_type, second_waiting.berth), (RAC, side_lower))
+        self.assertEqual(Berth.objects.filter(availability_status=AVAILABLE, **self.inventory).count(), 0)
+        self.assertEqual(get_quota_buckets(self.inventory)[QUOTA_GENERAL]["available"], 0)
+
+        self.assertEqual(
+            list(TicketHistory.objects.filter(ticket=first_waiting).order_by("id").values_list("action", flat=True)),
+            [ACTION_MOVED_RAC, ACTION_PROMOTED_RAC],
+        )
+        events = OutboxEvent.objects.filter(
+            ticket_id=first_waiting.id, event_type__in=[EVENT_TICKET_MOVED_RAC, EVENT_TICKET_CONFIRMED]
+        ).order_by("id")
+        self.assertEqual(
+            [(event.event_type, event.payload["ticket_type"], event.payload["berth_type"]) for event in events],
+            [
+                (EVENT_TICKET_MOVED_RAC, RAC, SIDE_LOWER),
+                (EVENT_TICKET_CONFIRMED, CONFIRMED, first_waiting.berth_allocation),
+            ],
+        )
+
+    def test_prepared_chart_closes_the_run_to_bookings(self):
+        self.assertIsNone(prepare_chart(self.train, JOURNEY_DATE)[1])
+
+        self.assertEqual(
+            book_ticket("Late", 30, "M", train=self.train, journey_date=JOURNEY_DATE), (None, CHART_CLOSED)
+        )
+        _, errors = hold_seats([{"name": "Late", "age": 30, "gender": "M"}], self.inventory)
+        self.assertEqual([error["error"] for error in errors], [CHART_CLOSED])
+        self.assertEqual(prepare_chart(self.train, JOURNEY_DATE), (None, CHART_ALREADY_PREPARED))
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_chart_left_preparing_by_a_crash_is_prepared_again(self):
+        hold, (rac, _, _) = self.queue_behind_a_hold()
+
+        with mock.patch.object(ChartCascade, "run", side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                prepare_chart(self.train, JOURNEY_DATE)
+        # The chart row stays behind and keeps the run closed, but the cascade was rolled back.
+        self.assertEqual(Chart.objects.get(**self.inventory).status, CHART_PREPARING)
+        hold.refresh_from_db()
+        self.assertNotEqual(hold.status, HOLD_RELEASED)
+        self.assertEqual(Ticket.objects.get(id=rac.id).ticket_type, RAC)
+
+        chart, error = prepare_chart(self.train, JOURNEY_DATE)
+        self.assertIsNone(error)
+        self.assertEqual((chart.status, chart.confirmed_from_rac, chart.released_holds), (CHART_PREPARED, 2, 1))
+        self.assertEqual(Chart.objects.filter(**self.inventory).count(), 1)
+        self.assertEqual(Ticket.objects.get(id=rac.id).ticket_type, CONFIRMED)
+
+
+class ItineraryTests(TestCase):
+    """An itinerary books every passenger on every leg or on none, locking legs in train order."""
+
+    passengers = [
+        {"name": "Traveller One", "age": 30, "gender": "M"},
+        {"name": "Traveller Two", "age": 40, "gender": "F"},
+    ]
+
+    def setUp(self):
+        self.first = create_train_run("12951", ladies_quota=0, senior_quota=0)
+        self.second = create_train_run("12952", ladies_quota=0, senior_quota=0)
+
+    def legs(self, *trains):
+        return [{"train": train.number, "journey_date": JOURNEY_DATE.isoformat()} for train in trains]
+
+    def test_failed_leg_rolls_back_every_leg(self):
+        sold_out = create_train_run(
+            "12953", confirmed_limit=1, rac_limit=0, waiting_list_limit=0, ladies_quota=0, senior_quota=0
+        )
+        book(sold_out, "Passenger")
+        passengers = Passenger.objects.count()
+
+        legs, error = book_itinerary(self.passengers, self.legs(sold_out, self.first))
+        self.assertIsNone(legs)
+        self.assertEqual((error["error"], error["leg"]), (NO_TICKETS_AVAILABLE, 0))
+        self.assertFalse(Ticket.objects.filter(train=self.first).exists())
+        self.assertEqual(Passenger.objects.count(), passengers)
+        self.assertFalse(Berth.objects.filter(train=self.first).exclude(availability_status=AVAILABLE).exists())
+        self.assertFalse(QuotaCounter.objects.filter(train=self.first, booked__gt=0).exists())
+
+    def test_legs_are_locked_in_train_order_whatever_the_request_order(self):
+        for trains in [(self.first, self.second), (self.second, self.first)]:
+            with mock.patch("tickets.itineraries._book_leg", wraps=_book_leg) as book_leg:
+                legs, error = book_itinerary(self.passengers, self.legs(*trains))
+            self.assertIsNone(error)
+            self.assertEqual([call.args[1]["train"].number for call in book_leg.call_args_list], ["12951", "12952"])
+            # Legs still come back in the order they were asked for.
+            self.assertEqual([leg["train"] for leg in legs], list(trains))
+            self.assertEqual([len(leg["tickets"]) for leg in legs], [2, 2])
+
+
+@skipUnless("shard1" in settings.DATABASES, "Needs a second database, as in ticket_system.test_settings")
+@override_settings(SHARD_DATABASES=["default", "shard1"])
+class ShardingTests(TransactionTestCase):
+    databases = "__all__"
+
+    def test_routes_sharded_models_to_the_current_shard_and_global_ones_to_default(self):
+        with on_shard("shard1"):
+            train = Train.objects.create(number="12951", name="Train 12951")
+            AdmissionToken.objects.create()
+        self.assertEqual(train._state.db, "shard1")
+        self.assertFalse(Train.objects.using("default").exists())
+        self.assertEqual(AdmissionToken.objects.using("default").count(), 1)
+
+        # An instance keeps writing to the shard it was loaded from.
+        train.name = "Renamed"
+        train.save()
+        self.assertEqual(Train.objects.using("shard1").get().name, "Renamed")
+
+    def test_fan_out_and_locate_visit_every_shard(self):
+        Train.objects.create(number="12951", name="Train 12951")
+        with on_shard("shard1"):
+            Train.objects.create(number="12952", name="Train 12952")
+
+        self.assertEqual(fan_out(lambda: list(Train.objects.values_list("number", flat=True))), [["12951"], ["12952"]])
+        self.assertEqual(locate(Train.objects.filter(number="12952")), "shard1")
+        self.assertEqual(locate(Train.objects.filter(number="12951")), "default")
+        with on_shard("shard1"):
+            self.assertEqual(locate(Train.objects.filter(number="missing")), "shard1")
+
+    def test_move_train_copies_the_train_and_then_deletes_it(self):
+        train = create_train_run(
+            "12951", confirmed_limit=7, rac_limit=1, waiting_list_limit=2, ladies_quota=0, senior_quota=0
+        )
+        tickets = [book(train, f"Passenger {index}") for index in range(9)]
+        version = get_inventory_version()
+
+        self.assertEqual(move_train("12951", "shard1"), (9, None))
+        self.assertEqual(TrainShard.objects.get(train_number="12951").shard, "shard1")
+        self.assertGreater(get_inventory_version(), version)
+        for model in (Train, Berth, QuotaPolicy, Ticket, TicketHistory, Passenger):
+            self.assertFalse(model.objects.using("default").exists(), model)
+        moved = Ticket.objects.using("shard1").order_by("id")
+        self.assertEqual(
+            [(ticket.id, ticket.ticket_type, ticket.berth_id) for ticket in moved],
+            [(ticket.id, ticket.ticket_type, ticket.berth_id) for ticket in tickets],
+        )
+        self.assertEqual(Berth.objects.using("shard1").count(), len(COMPARTMENT_LAYOUT))
+
+        # Bookings and cancellations follow the train to its new shard.
+        inventory, _ = resolve_inventory("12951", JOURNEY_DATE.isoformat())
+        self.assertEqual(inventory["train"]._state.db, "shard1")
+        self.assertEqual(book(inventory["train"], "Late Passenger").ticket_type, WAITING_LIST)
+        self.assertIsNone(cancel_ticket(tickets[0].id)[1])
+        self.assertEqual(Ticket.objects.using("shard1").get(id=tickets[7].id).ticket_type, CONFIRMED)
+
+        self.assertEqual(move_train("12951", "shard1"), (None, TRAIN_ALREADY_ON_SHARD))
+        self.assertEqual(move_train("12951", "shard2"), (None, UNKNOWN_SHARD))
+
+    def test_itinerary_across_shards_undoes_its_legs_when_a_hold_fails_to_confirm(self):
+        first = create_train_run("12951", ladies_quota=0, senior_quota=0)
+        create_train_run("12952", ladies_quota=0, senior_quota=0)
+        self.assertEqual(move_train("12952", "shard1"), (0, None))
+        second, _ = resolve_inventory("12952", JOURNEY_DATE.isoformat())
+        legs = [{"train": number, "journey_date": JOURNEY_DATE.isoformat()} for number in ("12952", "12951")]
+        passengers = [{"name": "Traveller", "age": 30, "gender": "M"}]
+
+        # The first leg in train order is booked, then the hold of the second one has lapsed.
+        real_confirm_hold = confirm_hold
+        outcomes = iter([real_confirm_hold, lambda token: (None, HOLD_NOT_ACTIVE)])
+        with mock.patch("tickets.itineraries.confirm_hold", side_effect=lambda token: next(outcomes)(token)):
+            self.assertEqual(book_itinerary(passengers, legs), (None, {"error": HOLD_NOT_ACTIVE, "leg": 0}))
+
+        (ticket,) = Ticket.objects.using("default").filter(train=first)
+        self.assertEqual(ticket.status, CANCELED)
+        self.assertEqual(SeatHold.objects.using("shard1").get().status, HOLD_RELEASED)
+        for inventory in ({"train": first, "journey_date": JOURNEY_DATE}, second):
+            alias = inventory["train"]._state.db
+            berths = Berth.objects.using(alias).filter(**inventory)
+            self.assertFalse(berths.exclude(availability_status=AVAILABLE).exists())
+            self.assertFalse(QuotaCounter.objects.using(alias).filter(booked__gt=0, **inventory).exists())
@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle, ScopedRateThrottle
+
+from .constants import SERVICE_OVERLOADED
+
+
+class ServiceOverloaded(APIException):
+    """Raised while the database is too slow to take on more work."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = SERVICE_OVERLOADED
+    default_code = "service_overloaded"
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class LoadMonitor:
+    """
+    Time-decayed view of lock failures and database latency in this process.
+
+    Counters halve every ``LOAD_SHEDDING["HALF_LIFE"]`` seconds, so once load is shed and
+    samples stop arriving the monitor falls below ``MIN_SAMPLES`` and lets traffic probe again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._updated_at = time.monotonic()
+        self.lock_attempts = 0.0
+        self.lock_failures = 0.0
+        self.queries = 0.0
+        self.query_ms = 0.0
+
+    def record_lock_attempt(self, failed):
+        with self._lock:
+            self._decay()
+            self.lock_attempts += 1
+            self.lock_failures += 1 if failed else 0
+
+    def record_query(self, duration_ms):
+        with self._lock:
+            self._decay()
+            self.queries += 1
+            self.query_ms += duration_ms
+
+    def overload_status(self):
+        """Return 503 when the database is slow, 429 when locks keep failing, otherwise ``None``."""
+        config = settings.LOAD_SHEDDING
+        with self._lock:
+            self._decay()
+            if self.queries >= config["MIN_SAMPLES"] and self.query_ms / self.queries > config["DB_LATENCY_MS"]:
+                return status.HTTP_503_SERVICE_UNAVAILABLE
+            if (
+                self.lock_attempts >= config["MIN_SAMPLES"]
+                and self.lock_failures / self.lock_attempts > config["LOCK_FAILURE_RATE"]
+            ):
+                return status.HTTP_429_TOO_MANY_REQUESTS
+        return None
+
+    def _decay(self):
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._updated_at) / settings.LOAD_SHEDDING["HALF_LIFE"])
+        self._updated_at = now
+        self.lock_attempts *= factor
+        self.lock_failures *= factor
+        self.queries *= factor
+        self.query_ms *= factor
+
+
+load_monitor = LoadMonitor()
+
+
+@contextmanager
+def timed_queries(aliases):
+    """Feed the duration of every query run on the ``aliases`` connections of this thread into the load monitor."""
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(_time_query))
+        yield
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        load_monitor.record_query((time.perf_counter() - start) * 1000)
+
+
+class DatabaseLatencyMiddleware:
+    """Feed the duration of every query, on every database, into the load monitor."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with timed_queries(settings.DATABASES):
+            return self.get_response(request)
+
+
+class LoadSheddingThrottle(BaseThrottle):
+    """Reject requests in the ``LOAD_SHEDDING["SCOPES"]`` scopes up front while the booking path is overloaded."""
+
+    def allow_request(self, request, view):
+        if getattr(view, "throttle_scope", None) not in settings.LOAD_SHEDDING["SCOPES"]:
+            return True
+
+        overload_status = load_monitor.overload_status()
+        if overload_status == status.HTTP_503_SERVICE_UNAVAILABLE:
+            raise ServiceOverloaded(self.wait())
+        return overload_status is None
+
+    def wait(self):
+        return settings.LOAD_SHEDDING["RETRY_AFTER"]
+
+
+class TokenBucketThrottle(ScopedRateThrottle):
+    """
+    Token bucket per authenticated user, or per client IP, for each view's ``throttle_scope``.
+
+    A rate of ``30/min`` gives a bucket of 30 tokens refilled at 30 tokens per minute, so
+    clients can burst up to the full rate and are then held to the average. The bucket is
+    stored as the time it will be full again and moved with atomic cache increments, so
+    concurrent requests never spend the same token.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        now = int(self.timer() * 1000)
+        interval = max(self.duration * 1000 // self.num_requests, 1)
+        burst = interval * self.num_requests
+
+        key, full_at = self._take_token(now, interval, burst)
+        allowed = full_at - now <= burst
+        if not allowed:
+            # Give the token back, so rejected requests do not push the bucket further out.
+            self.cache.decr(key, interval)
+        self.wait_seconds = 0 if allowed else (full_at - now - burst) / 1000
+        return allowed
+
+    def _take_token(self, now, interval, burst):
+        """
+        Move the time the bucket is full again one interval later; returns its key and the new time (ms).
+
+        The time is kept under one key per slot of ``max(interval, 1s)``. The first request of a
+        slot carries it over from the latest earlier slot, or starts from ``now`` once the bucket
+        has refilled. A bucket left idle within a slot therefore gains at most one slot's worth
+        of extra tokens.
+        """
+        slot_ms = max(interval, 1000)
+        slot = now // slot_ms
+        key = f"{self.key}:{slot}"
+        try:
+            return key, self.cache.incr(key, interval)
+        except ValueError:
+            pass
+        earlier = self.cache.get_many([f"{self.key}:{slot - back}" for back in range(1, burst // slot_ms + 2)])
+        self.cache.add(key, max([now, *earlier.values()]), timeout=(burst + 2 * slot_ms) // 1000 + 1)
+        return key, self.cache.incr(key, interval)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f"user-{request.user.pk}"
+        else:
+            ident = f"ip-{self.get_ident(request)}"
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def wait(self):
+        return self.wait_seconds
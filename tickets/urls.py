@@ -1,19 +1,45 @@
 from django.urls import path
 
 from .views import (
+    BookItineraryView,
     BookTicketView,
     CancelTicketView,
+    ConfirmSeatHoldView,
+    ExportManifestView,
     GetAvailableTicketsView,
     GetBookedTicketsView,
+    HoldSeatsView,
+    JoinWaitingRoomView,
+    SearchTicketsView,
+    SeatHoldView,
+    TicketStatusLookupView,
+    TicketStatusView,
+    WaitingRoomStatusView,
 )
 
 urlpatterns = [
     # Endpoint to book a ticket
     path("api/v1/tickets/book", BookTicketView.as_view(), name="book_ticket"),
+    # Endpoint to book every leg of a journey over connecting trains in one operation
+    path("api/v1/tickets/itineraries", BookItineraryView.as_view(), name="book_itinerary"),
     # Endpoint to cancel a ticket
     path("api/v1/tickets/cancel/<int:ticket_id>", CancelTicketView.as_view(), name="cancel_ticket"),
+    # Endpoints to look up the status of one ticket (PNR) or of several, such as a group booking
+    path("api/v1/tickets/<int:ticket_id>", TicketStatusView.as_view(), name="ticket_status"),
+    path("api/v1/tickets/status", TicketStatusLookupView.as_view(), name="ticket_status_lookup"),
     # Endpoint to get the list of booked tickets
     path("api/v1/tickets/booked", GetBookedTicketsView.as_view(), name="get_booked_tickets"),
+    # Endpoint to search tickets by passenger name, age, ticket type, status and booking time
+    path("api/v1/tickets/search", SearchTicketsView.as_view(), name="search_tickets"),
     # Endpoint to get the list of available tickets (berths)
     path("api/v1/tickets/available", GetAvailableTicketsView.as_view(), name="get_available_tickets"),
+    # Endpoint to stream the passenger manifest
+    path("api/v1/tickets/manifest", ExportManifestView.as_view(), name="export_manifest"),
+    # Endpoints to hold seats while the client pays, then confirm or release the hold
+    path("api/v1/tickets/holds", HoldSeatsView.as_view(), name="hold_seats"),
+    path("api/v1/tickets/holds/<uuid:token>", SeatHoldView.as_view(), name="seat_hold"),
+    path("api/v1/tickets/holds/<uuid:token>/confirm", ConfirmSeatHoldView.as_view(), name="confirm_seat_hold"),
+    # Endpoints for the flash-sale waiting room
+    path("api/v1/tickets/waiting-room", JoinWaitingRoomView.as_view(), name="join_waiting_room"),
+    path("api/v1/tickets/waiting-room/<uuid:token>", WaitingRoomStatusView.as_view(), name="waiting_room_status"),
 ]
@@ -1,22 +1,90 @@
+import functools
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .constants import (
+    ADMISSION_TOO_MANY_PASSENGERS,
+    ADMISSION_WRONG_TRAIN_RUN,
+    HOLD_NOT_FOUND,
+    INVALID_TICKET_IDS,
+    PARQUET_UNAVAILABLE,
+    STATUS_LOOKUP_LIMIT,
+    UNSUPPORTED_EXPORT_FORMAT,
+)
 from .error_handlers import handle_service_error, handle_ticket_error
-from .serializers import TicketSerializer
+from .exports import EXPORT_FORMATS, export_manifest, parquet_available
+from .holds import confirm_hold, hold_seats, release_hold
+from .inventory import inventory_etag
+from .itineraries import book_itinerary
+from .search import search_tickets
+from .serializers import SeatHoldSerializer, TicketSerializer
 from .services import (
     AvailabilityService,
     BookingService,
     cancel_ticket,
-    get_booked_tickets,
+    list_booked_tickets,
+    resolve_inventory,
 )
+from .status import get_ticket_status, get_ticket_statuses
 from .swagger_schemas import (
+    book_itinerary_schema,
     book_ticket_schema,
     cancel_ticket_schema,
+    confirm_seat_hold_schema,
+    export_manifest_schema,
     get_available_berths_schema,
     get_booked_tickets_schema,
+    hold_seats_schema,
+    join_waiting_room_schema,
+    release_seat_hold_schema,
+    search_tickets_schema,
+    ticket_status_lookup_schema,
+    ticket_status_schema,
+    waiting_room_status_schema,
 )
+from .waiting_room import WaitingRoomService, books_sale_run
+
+
+def flash_sale_admission(post):
+    """
+    During a flash sale, spend the request's X-Admission-Token before running ``post``.
+
+    Only requests booking the train run on sale are metered. Their token must have been issued
+    for that run, and they may book at most ``FLASH_SALE_MAX_PASSENGERS`` passengers. The token
+    keeps its waiting-room slot until ``post`` returns, so the slot is only handed to the next
+    client once the booking has committed or failed.
+    """
+
+    @functools.wraps(post)
+    def inner(view, request, *args, **kwargs):
+        if not settings.FLASH_SALE_MODE or not books_sale_run(request.data):
+            return post(view, request, *args, **kwargs)
+        passengers = request.data.get("passengers")
+        if isinstance(passengers, list) and len(passengers) > settings.FLASH_SALE_MAX_PASSENGERS:
+            return view.create_response(
+                {"error": ADMISSION_TOO_MANY_PASSENGERS.format(settings.FLASH_SALE_MAX_PASSENGERS)},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        token = request.headers.get("X-Admission-Token")
+        admitted, error = WaitingRoomService.claim(token)
+        if not admitted:
+            status_code = (
+                status.HTTP_403_FORBIDDEN if error == ADMISSION_WRONG_TRAIN_RUN else status.HTTP_429_TOO_MANY_REQUESTS
+            )
+            return view.create_response({"error": error}, status_code)
+        try:
+            return post(view, request, *args, **kwargs)
+        finally:
+            WaitingRoomService.finish(token)
+
+    return inner
 
 
 class BaseTicketView(APIView):
@@ -25,20 +93,112 @@ class BaseTicketView(APIView):
     def create_response(self, data, status_code=status.HTTP_200_OK):
         return Response(data, status=status_code)
 
+    def get_inventory(self, request):
+        """Resolve the optional ``train`` and ``journey_date`` query parameters."""
+        return resolve_inventory(request.query_params.get("train"), request.query_params.get("journey_date"))
+
 
 class BookTicketView(BaseTicketView):
+    throttle_scope = "book"
+
     @swagger_auto_schema(**book_ticket_schema)
+    @flash_sale_admission
     def post(self, request):
         """Book tickets for multiple passengers."""
         try:
-            booking_result = BookingService.process_booking_request(request.data.get("passengers", []))
+            booking_result = BookingService.process_booking_request(
+                request.data.get("passengers", []), request.data.get("train"), request.data.get("journey_date")
+            )
             data, status_code = BookingService.format_booking_response(booking_result)
             return self.create_response(data, status_code)
         except Exception as e:
             return handle_service_error(e)
 
 
+class BookItineraryView(BaseTicketView):
+    throttle_scope = "book"
+
+    @swagger_auto_schema(**book_itinerary_schema)
+    @flash_sale_admission
+    def post(self, request):
+        """Book the passengers on every leg of a journey over connecting trains, or on none."""
+        try:
+            legs, error = book_itinerary(request.data.get("passengers", []), request.data.get("legs"))
+            if error:
+                return self.create_response(error, status.HTTP_400_BAD_REQUEST)
+            data = [
+                {
+                    "train": leg["train"].number,
+                    "journey_date": leg["journey_date"],
+                    "tickets": TicketSerializer(leg["tickets"], many=True).data,
+                }
+                for leg in legs
+            ]
+            return self.create_response({"legs": data}, status.HTTP_201_CREATED)
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class HoldSeatsView(BaseTicketView):
+    throttle_scope = "book"
+
+    @swagger_auto_schema(**hold_seats_schema)
+    @flash_sale_admission
+    def post(self, request):
+        """Reserve confirmed seats for the passengers until the hold is confirmed or expires."""
+        try:
+            passengers = request.data.get("passengers", [])
+            if not passengers:
+                return self.create_response({"error": "No passengers provided"}, status.HTTP_400_BAD_REQUEST)
+            inventory, error = resolve_inventory(request.data.get("train"), request.data.get("journey_date"))
+            if error:
+                return self.create_response({"error": error}, status.HTTP_400_BAD_REQUEST)
+
+            hold, errors = hold_seats(passengers, inventory)
+            if not hold:
+                return self.create_response({"errors": errors}, status.HTTP_400_BAD_REQUEST)
+            return self.create_response({**SeatHoldSerializer(hold).data, "errors": errors}, status.HTTP_201_CREATED)
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class ConfirmSeatHoldView(BaseTicketView):
+    throttle_scope = "book"
+
+    @swagger_auto_schema(**confirm_seat_hold_schema)
+    def post(self, request, token):
+        """Book the seats of a hold."""
+        try:
+            tickets, error = confirm_hold(token)
+            if error:
+                status_code = status.HTTP_404_NOT_FOUND if error == HOLD_NOT_FOUND else status.HTTP_400_BAD_REQUEST
+                return self.create_response({"error": error}, status_code)
+            return self.create_response(
+                {"booked_tickets": TicketSerializer(tickets, many=True).data, "errors": []}, status.HTTP_201_CREATED
+            )
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class SeatHoldView(BaseTicketView):
+    throttle_scope = "cancel"
+
+    @swagger_auto_schema(**release_seat_hold_schema)
+    def delete(self, request, token):
+        """Release the seats of a hold before it expires."""
+        try:
+            hold, error = release_hold(token)
+            if error:
+                status_code = status.HTTP_404_NOT_FOUND if error == HOLD_NOT_FOUND else status.HTTP_400_BAD_REQUEST
+                return self.create_response({"error": error}, status_code)
+            return self.create_response({"message": "Seat hold released."})
+        except Exception as e:
+            return handle_service_error(e)
+
+
 class CancelTicketView(BaseTicketView):
+    throttle_scope = "cancel"
+
     @swagger_auto_schema(**cancel_ticket_schema)
     def post(self, request, ticket_id):
         """Cancel a specific ticket."""
@@ -51,22 +211,131 @@ class CancelTicketView(BaseTicketView):
             return handle_service_error(e)
 
 
+class TicketStatusView(BaseTicketView):
+    throttle_scope = "status"
+
+    @swagger_auto_schema(**ticket_status_schema)
+    def get(self, request, ticket_id):
+        """Get the status, berth and queue position of one ticket."""
+        try:
+            data, error = get_ticket_status(ticket_id)
+            if error:
+                return handle_ticket_error(error)
+            return self.create_response(data)
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class TicketStatusLookupView(BaseTicketView):
+    throttle_scope = "status"
+
+    @swagger_auto_schema(**ticket_status_lookup_schema)
+    def get(self, request):
+        """Get the status of several tickets, such as those of a group booking."""
+        try:
+            ids = request.query_params.get("ids", "").split(",")
+            if not all(ticket_id.strip().isdigit() for ticket_id in ids) or len(ids) > STATUS_LOOKUP_LIMIT:
+                return self.create_response({"error": INVALID_TICKET_IDS}, status.HTTP_400_BAD_REQUEST)
+
+            results = get_ticket_statuses(list(dict.fromkeys(int(ticket_id) for ticket_id in ids)))
+            return self.create_response(
+                {
+                    "tickets": [data for data, error in results.values() if data],
+                    "not_found": [ticket_id for ticket_id, (data, error) in results.items() if error],
+                }
+            )
+        except Exception as e:
+            return handle_service_error(e)
+
+
 class GetBookedTicketsView(BaseTicketView):
+    throttle_scope = "list"
+
     @swagger_auto_schema(**get_booked_tickets_schema)
+    @method_decorator(condition(etag_func=inventory_etag("booked")))
     def get(self, request):
         """Get all booked tickets."""
         try:
-            tickets = get_booked_tickets()
-            return self.create_response(TicketSerializer(tickets, many=True).data)
+            inventory, error = self.get_inventory(request)
+            if error:
+                return self.create_response({"error": error}, status.HTTP_400_BAD_REQUEST)
+            return self.create_response(TicketSerializer(list_booked_tickets(inventory), many=True).data)
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class SearchTicketsView(BaseTicketView):
+    throttle_scope = "list"
+
+    @swagger_auto_schema(**search_tickets_schema)
+    def get(self, request):
+        """Search tickets by passenger name, age, ticket type, status and booking time."""
+        try:
+            page, error = search_tickets(request.query_params)
+            if error:
+                return self.create_response({"error": error}, status.HTTP_400_BAD_REQUEST)
+            page["tickets"] = TicketSerializer(page["tickets"], many=True).data
+            return self.create_response(page)
         except Exception as e:
             return handle_service_error(e)
 
 
 class GetAvailableTicketsView(BaseTicketView):
+    throttle_scope = "list"
+
     @swagger_auto_schema(**get_available_berths_schema)
+    @method_decorator(condition(etag_func=inventory_etag("available")))
     def get(self, request):
         """Get available tickets and quota information."""
         try:
-            return self.create_response(AvailabilityService.get_availability_info())
+            inventory, error = self.get_inventory(request)
+            if error:
+                return self.create_response({"error": error}, status.HTTP_400_BAD_REQUEST)
+            return self.create_response(AvailabilityService.get_availability_info(inventory))
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class ExportManifestView(BaseTicketView):
+    throttle_scope = "export"
+
+    @swagger_auto_schema(**export_manifest_schema)
+    def get(self, request):
+        """Stream the passenger manifest as CSV, NDJSON or Parquet."""
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return self.create_response({"error": UNSUPPORTED_EXPORT_FORMAT}, status.HTTP_400_BAD_REQUEST)
+        if export_format == "parquet" and not parquet_available():
+            return self.create_response({"error": PARQUET_UNAVAILABLE}, status.HTTP_400_BAD_REQUEST)
+        inventory, error = self.get_inventory(request)
+        if error:
+            return self.create_response({"error": error}, status.HTTP_400_BAD_REQUEST)
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_manifest(export_format, inventory), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="manifest.{extension}"'
+        return response
+
+
+class JoinWaitingRoomView(BaseTicketView):
+    @swagger_auto_schema(**join_waiting_room_schema)
+    def post(self, request):
+        """Join the flash-sale waiting room."""
+        try:
+            data, _ = WaitingRoomService.join()
+            return self.create_response(data, status.HTTP_201_CREATED)
+        except Exception as e:
+            return handle_service_error(e)
+
+
+class WaitingRoomStatusView(BaseTicketView):
+    @swagger_auto_schema(**waiting_room_status_schema)
+    def get(self, request, token):
+        """Get queue position or admission for a waiting-room token."""
+        try:
+            data, error = WaitingRoomService.get_status(token)
+            if error:
+                return self.create_response({"error": error}, status.HTTP_404_NOT_FOUND)
+            return self.create_response(data)
         except Exception as e:
             return handle_service_error(e)
@@ -0,0 +1,179 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .constants import (
+    ADMISSION_ADMITTED,
+    ADMISSION_BOOKING,
+    ADMISSION_EXPIRED,
+    ADMISSION_NOT_FOUND,
+    ADMISSION_REQUIRED,
+    ADMISSION_USED,
+    ADMISSION_WAITING,
+    ADMISSION_WRONG_TRAIN_RUN,
+)
+from .models import AdmissionToken
+from .services import get_remaining_capacity, resolve_inventory
+
+# Key of the advisory lock serializing admission rounds, in the two-integer key space so it never
+# collides with the per-train locks taken on train ids.
+ADMISSION_LOCK_KEY = (1, 0)
+
+
+class WaitingRoomService:
+    """
+    Virtual waiting room that meters booking traffic during a flash sale.
+
+    Clients join and poll their token; polling only reads. ``admit`` runs in the
+    ``admit_waiting_room`` job and admits waiting tokens in order while the sale's train run
+    has capacity and fewer than ``FLASH_SALE_MAX_ADMITTED`` clients are booking. A token counts
+    as an active booker from admission until its booking finishes or the admission lapses.
+    Tokens are issued for the train run on sale and can only be spent on bookings of that run.
+    """
+
+    @classmethod
+    def join(cls):
+        """Hand out the next admission token in line for the train run on sale."""
+        admission = AdmissionToken.objects.create(**sale_run())
+        return cls.get_status(admission.token)
+
+    @classmethod
+    def get_status(cls, token):
+        """Describe where ``token`` stands."""
+        try:
+            admission = AdmissionToken.objects.get(token=token)
+        except (AdmissionToken.DoesNotExist, ValidationError):
+            return None, ADMISSION_NOT_FOUND
+
+        inventory, error = sale_inventory()
+        if error:
+            return None, error
+        return cls._describe(admission, get_remaining_capacity(**inventory)), None
+
+    @classmethod
+    def claim(cls, token):
+        """Spend an admitted token on a booking of the train run on sale; a token can be used only once."""
+        if not token:
+            return False, ADMISSION_REQUIRED
+
+        run = sale_run()
+        try:
+            claimed = AdmissionToken.objects.filter(
+                token=token, status=ADMISSION_ADMITTED, expires_at__gt=timezone.now(), **run
+            ).update(status=ADMISSION_BOOKING)
+            issued_for = AdmissionToken.objects.filter(token=token).values("train_number", "journey_date").first()
+        except ValidationError:
+            return False, ADMISSION_REQUIRED
+        if claimed:
+            return True, None
+        if issued_for and issued_for != run:
+            return False, ADMISSION_WRONG_TRAIN_RUN
+        return False, ADMISSION_REQUIRED
+
+    @staticmethod
+    def finish(token):
+        """Free the slot of a claimed token once its booking has committed or failed."""
+        AdmissionToken.objects.filter(token=token, status=ADMISSION_BOOKING).update(status=ADMISSION_USED)
+
+    @staticmethod
+    @transaction.atomic(using=DEFAULT_DB_ALIAS)
+    def admit():
+        """
+        Expire stale admissions and admit waiting tokens in order while quota allows.
+
+        Returns ``(admitted, error)``. Rounds are serialized, so two rounds running at once can
+        never admit more tokens together than there are free slots.
+        """
+        inventory, error = sale_inventory()
+        if error:
+            return None, error
+
+        _lock_admissions()
+        now = timezone.now()
+        AdmissionToken.objects.filter(status=ADMISSION_ADMITTED, expires_at__lte=now).update(status=ADMISSION_EXPIRED)
+
+        active_count = AdmissionToken.objects.filter(
+            status__in=[ADMISSION_ADMITTED, ADMISSION_BOOKING], expires_at__gt=now, **sale_run()
+        ).count()
+        free_slots = min(get_remaining_capacity(**inventory), settings.FLASH_SALE_MAX_ADMITTED) - active_count
+        if free_slots <= 0:
+            return 0, None
+
+        next_ids = list(
+            AdmissionToken.objects.filter(status=ADMISSION_WAITING, **sale_run())
+            .order_by("id")
+            .values_list("id", flat=True)[:free_slots]
+        )
+        admitted = AdmissionToken.objects.filter(id__in=next_ids).update(
+            status=ADMISSION_ADMITTED,
+            admitted_at=now,
+            expires_at=now + timedelta(seconds=settings.FLASH_SALE_ADMISSION_TTL),
+        )
+        return admitted, None
+
+    @staticmethod
+    def _describe(admission, remaining_capacity):
+        """Build the client-facing view of an admission token."""
+        data = {
+            "token": str(admission.token),
+            "status": admission.status,
+            "remaining_capacity": remaining_capacity,
+        }
+        if admission.status == ADMISSION_WAITING:
+            ahead = AdmissionToken.objects.filter(
+                status=ADMISSION_WAITING,
+                train_number=admission.train_number,
+                journey_date=admission.journey_date,
+                id__lt=admission.id,
+            )
+            position = ahead.count() + 1
+            batches_ahead = math.ceil(position / max(settings.FLASH_SALE_MAX_ADMITTED, 1))
+            data["position"] = position
+            data["eta_seconds"] = batches_ahead * settings.FLASH_SALE_BOOKING_SECONDS
+        elif admission.status == ADMISSION_ADMITTED:
+            data["expires_at"] = admission.expires_at
+        return data
+
+
+def sale_inventory():
+    """Inventory filters of the train run on sale, from ``FLASH_SALE_TRAIN`` and ``FLASH_SALE_JOURNEY_DATE``."""
+    return resolve_inventory(settings.FLASH_SALE_TRAIN, settings.FLASH_SALE_JOURNEY_DATE)
+
+
+def sale_run():
+    """Train number and journey date on sale, as stored on the admission tokens issued for it."""
+    return {
+        "train_number": settings.FLASH_SALE_TRAIN,
+        "journey_date": _parse_journey_date(settings.FLASH_SALE_JOURNEY_DATE),
+    }
+
+
+def books_sale_run(data):
+    """Whether request ``data``, with ``train`` and ``journey_date`` or a list of ``legs``, books the run on sale."""
+    legs = data.get("legs")
+    run = sale_run()
+    return any(
+        isinstance(leg, dict)
+        and str(leg.get("train")) == run["train_number"]
+        and _parse_journey_date(leg.get("journey_date")) == run["journey_date"]
+        for leg in (legs if isinstance(legs, list) else [data])
+    )
+
+
+def _parse_journey_date(value):
+    try:
+        return parse_date(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+
+def _lock_admissions():
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", ADMISSION_LOCK_KEY)